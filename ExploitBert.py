@@ -1,7 +1,7 @@
 import torch
 from transformers import BertTokenizer, BertForSequenceClassification
-from bs4 import BeautifulSoup
-import requests
+from fetch_engine import fetch_page
+from html_extract import extract_html
 import pandas as pd
 
 # Load the fine-tuned model and tokenizer from the local directory
@@ -63,15 +63,18 @@ ecommerce_keywords = [
 
 # Function to extract text from HTML
 def extract_text(html):
-    soup = BeautifulSoup(html, 'html.parser')
-    return soup.get_text()
+    return extract_html(html).visible_text
 
 # Function to classify a URL as e-commerce or not
 def classify_url(url):
+    # Fetch the page through the shared page cache
+    page = fetch_page(url)
+    if not page.ok:
+        print(f"Error processing URL {url}: {page.error or f'HTTP status {page.status}'}")
+        return None
+
     try:
-        response = requests.get(url)
-        response.raise_for_status()  # Raise an error for bad responses
-        text = extract_text(response.text)
+        text = extract_text(page.text)
 
         # Check for non-e-commerce keywords
         if any(keyword in text for keyword in non_ecommerce_keywords):
@@ -90,7 +93,7 @@ def classify_url(url):
         prediction = torch.argmax(probabilities, dim=-1).item()
         return prediction
 
-    except (requests.exceptions.RequestException, ValueError) as e:
+    except ValueError as e:
         print(f"Error processing URL {url}: {e}")
         return None
 
@@ -2,8 +2,8 @@ import torch
 from transformers import BertTokenizer, BertForSequenceClassification, Trainer, TrainingArguments
 from sklearn.model_selection import train_test_split
 import pandas as pd
-import requests
-from bs4 import BeautifulSoup
+from fetch_engine import fetch_page
+from html_extract import extract_html
 from concurrent.futures import ThreadPoolExecutor, as_completed
 import time
 import logging
@@ -13,19 +13,16 @@ logging.basicConfig(level=logging.INFO)
 
 # Function to extract text from HTML
 def extract_text(html):
-    soup = BeautifulSoup(html, 'html.parser')
-    return soup.get_text()
+    return extract_html(html).visible_text
 
-# Function to fetch URL content with retry logic
+# Function to fetch URL content with retry logic, going through the shared page cache
 def fetch_url_content(url, max_retries=3, delay=2):
     for attempt in range(max_retries):
-        try:
-            response = requests.get(url)
-            response.raise_for_status()
-            return response.text
-        except requests.exceptions.RequestException as e:
-            logging.error(f"Error fetching URL {url} (attempt {attempt + 1}/{max_retries}): {e}")
-            time.sleep(delay)
+        page = fetch_page(url)
+        if page.ok:
+            return page.text
+        logging.error(f"Error fetching URL {url} (attempt {attempt + 1}/{max_retries}): {page.error or f'HTTP status {page.status}'}")
+        time.sleep(delay)
     logging.error(f"Failed to fetch URL {url} after {max_retries} attempts")
     return None
 
@@ -1,9 +1,14 @@
-from mpi4py import MPI
+from executor import make_executor
 import pandas as pd
-import requests
-from bs4 import BeautifulSoup
-from tqdm import tqdm  # Import tqdm for progress bar
+from country_profiles import BARBER_KEYWORDS
+from fetch_engine import TIMEOUT_CODE, write_deferred
+from prefilter import prefilter
+from result_stream import Checkpoint, CsvStream, resume_requested
+from stream_scan import KeywordScanner
+from work_queue import fetch_and_process
 import logging
+from functools import partial
+import pipeline_config as config
 
 # Set up logging configuration
 logging.basicConfig(
@@ -12,111 +17,166 @@ logging.basicConfig(
     format='%(asctime)s - %(levelname)s - %(message)s'
 )
 
-def is_ecommerce_site(url):
-    try:
-        # Fetch the website content
-        response = requests.get(url)
-        response.raise_for_status()  # Raise an error for bad responses
+# Keywords indicating non-e-commerce (see country_profiles.py)
+non_ecommerce_keywords = BARBER_KEYWORDS['DE']
 
+# In streaming mode stop reading a page as soon as one non-e-commerce keyword is seen
+def make_scanner(url):
+    return KeywordScanner({keyword: 1 for keyword in non_ecommerce_keywords}, stop_score=1)
 
+# Classify one page from its features (see page_features.py)
+def is_ecommerce_site(page):
+    url = page.url
 
-        # Check if the URL contains the string "barb"
-        if "barb" in url:
-            return 0, url  # Not an e-commerce site, return URL for saving
-        # Parse the HTML content
-        soup = BeautifulSoup(response.text, 'html.parser')
+    # Fetch ran out of time, return -98 so the URL can be retried later
+    if page.timed_out:
+        logging.warning(f"Timed out fetching {url}: {page.error}")
+        return TIMEOUT_CODE, None
 
-        # Check for keywords indicating non-e-commerce
-        if any(keyword in response.text for keyword in ["Barbershop", "Notarfachangestellte", "Friseursalon", "Rechtsanwälte", "Zahnarzt", "schnitt"]):
-            return 0, url  # Not an e-commerce site, return URL for saving
+    # Error fetching the URL or bad response, return -99
+    if not page.ok:
+        logging.error(f"Error fetching {url}: {page.error or f'HTTP status {page.status}'}")
+        return -99, None
 
 
 
-        return 1, None  # Likely an e-commerce site, no URL to save
+    # Check if the URL contains the string "barb"
+    if "barb" in url:
+        return 0, url  # Not an e-commerce site, return URL for saving
+    # Check for keywords indicating non-e-commerce
+    if page.keyword_hits['barber_DE']:
+        return 0, url  # Not an e-commerce site, return URL for saving
 
-    except requests.exceptions.RequestException as e:
-        logging.error(f"Error fetching {url}: {e}")
-        return -99, None  # Error fetching the URL, return -99
 
-def main():
-    # Initialize MPI
-    comm = MPI.COMM_WORLD
-    rank = comm.Get_rank()
-    size = comm.Get_size()
 
-    if rank == 0:
-        df = pd.read_csv('DEinput.csv')
-        urls = df.iloc[:, 1].tolist()  # Assuming URLs are in the second column
-        num_urls = len(urls)
+    return 1, None  # Likely an e-commerce site, no URL to save
 
-        # Create an array of indices and split it among processes
-        chunks = [urls[i::size] for i in range(size)]
-    else:
-        chunks = None
+# Append-only list of the URLs finished so far, read by --resume (see result_stream.py)
+CHECKPOINT_FILE = 'checkpoint_barbers_DE.txt'
 
-    # Scatter the URL chunks to all processes
-    urls_chunk = comm.scatter(chunks, root=0)
+# URLs to check, read on rank 0. Those the prefilter decides are never fetched; the
+# context returned with the rest is what open_results needs later.
+def load_urls():
+    df = pd.read_csv('DEinput.csv')
+    urls = df.iloc[:, 1].tolist()  # Assuming URLs are in the second column
 
-    # Each process checks if its URLs are e-commerce sites with a progress bar
+    # URLs whose domain already shows they are not e-commerce are decided here and never fetched;
+    # only the uncertain rest is split among the processes
+    prefiltered_urls = []
+    if config.PREFILTER_ENABLED:
+        prefiltered_urls, urls = prefilter(urls, 'DE')
+    return (df, prefiltered_urls), urls
+
+# Classify the fetched pages (PageFeatures, see page_features.py) of one rank's URLs
+def process_chunk(urls_chunk, pages):
     results_chunk = []
     non_ecommerce_urls = set()  # Use a set to store non-e-commerce URLs
     original_indices = []  # List to store original indices of non-e-commerce URLs
 
-    for i, url in enumerate(tqdm(urls_chunk, desc=f"Processing on rank {rank}")):
-        result, non_ecommerce_url = is_ecommerce_site(url)
+    outcomes = [is_ecommerce_site(page) for page in pages]
 
+    for i, (url, (result, non_ecommerce_url)) in enumerate(zip(urls_chunk, outcomes)):
         if non_ecommerce_url:
             non_ecommerce_urls.add(non_ecommerce_url)  # Add to set of non-e-commerce URLs
             original_indices.append(i)  # Store the original index
 
         results_chunk.append((url, result))
 
-    # Gather results from all processes
-    all_results = comm.gather(results_chunk, root=0)
-    all_non_ecommerce_urls = comm.gather(non_ecommerce_urls, root=0)
-    all_original_indices = comm.gather(original_indices, root=0)
-
-    if rank == 0:
-        # Flatten the list of results and create a DataFrame for e-commerce checks
-        final_results = [(url, result) for sublist in all_results for url, result in sublist]
-
-        # Ensure unique results by using a set
-        unique_results = set(final_results)
-
-        results_df = pd.DataFrame(unique_results, columns=['URL', 'E-commerce Indicator'])
-
-        # Save to CSV with specified structure for e-commerce checks
-        results_df.to_csv('ecommerce_detection_results_DE.csv', index=False)
+    return results_chunk, non_ecommerce_urls, original_indices
+
+# Output files of rank 0, which the result of every batch is appended to as soon
+# as it arrives (see result_stream.py), so an interrupted run leaves usable output;
+# with resume the rows of the earlier run are kept
+def open_results(context, resume=False):
+    df, prefiltered_urls = context
+    outputs = {
+        'results': CsvStream('ecommerce_detection_results_DE.csv', ['URL', 'E-commerce Indicator'], resume=resume),
+        'non_ecommerce': CsvStream('non_ecommerce_urls_de.csv', ['URL'], resume=resume),
+    }
+
+    # The URLs decided from the URL alone are done before anything is fetched; a
+    # resumed run finds them in the rows the earlier run wrote first
+    if not outputs['results'].kept:
+        outputs['results'].append((url, 0) for url in prefiltered_urls)
+    if not outputs['non_ecommerce'].kept:
+        outputs['non_ecommerce'].append([url] for url in prefiltered_urls)
+    return outputs
+
+# Append the process_chunk result of one batch to the output files
+def save_batch(outputs, batch_result):
+    results_chunk, non_ecommerce_urls, original_indices = batch_result
+    outputs['results'].append(results_chunk)
+    outputs['non_ecommerce'].append([url] for url in non_ecommerce_urls)
+
+# Complete the output files on rank 0 once every batch is in
+def finish_results(context, outputs):
+    df, prefiltered_urls = context
+    for stream in outputs.values():
+        stream.close()
+
+    # Ensure unique results: a URL listed more than once in the input was appended more than once
+    results_df = pd.read_csv('ecommerce_detection_results_DE.csv').drop_duplicates()
+    results_df.to_csv('ecommerce_detection_results_DE.csv', index=False)
+
+    non_ecommerce_df = pd.read_csv('non_ecommerce_urls_de.csv').drop_duplicates()
+    non_ecommerce_df.to_csv('non_ecommerce_urls_de.csv', index=False)
+    final_non_ecommerce_urls = non_ecommerce_df['URL'].tolist()
+
+    # Add a new column 'E-commerce Indicator' with default values (NaN)
+    df['E-commerce Indicator'] = float('nan')
+
+    # Update the 'E-commerce Indicator' to 0 for non-e-commerce URLs
+    df.loc[df.iloc[:, 1].isin(final_non_ecommerce_urls), 'E-commerce Indicator'] = 0
+
+    # Update the 'E-commerce Indicator' to -99 for URLs that resulted in an error
+    error_urls = results_df[results_df['E-commerce Indicator'] == -99]['URL'].tolist()
+    df.loc[df.iloc[:, 1].isin(error_urls), 'E-commerce Indicator'] = -99
+
+    # Update the 'E-commerce Indicator' to -98 for URLs that timed out and save them for a later retry
+    timed_out_urls = results_df[results_df['E-commerce Indicator'] == TIMEOUT_CODE]['URL'].tolist()
+    df.loc[df.iloc[:, 1].isin(timed_out_urls), 'E-commerce Indicator'] = TIMEOUT_CODE
+    write_deferred(timed_out_urls, 'deferred_urls_de.csv')
+
+    # Save the updated DataFrame back to DEinput.csv
+    df.to_csv('DEinput.csv', index=False)
+
+    logging.info("Results saved to 'ecommerce_detection_results_DE.csv'.")
+    logging.info("Non-e-commerce URLs saved to 'non_ecommerce_urls_de.csv'.")
+    logging.info("Updated input saved to 'DEinput.csv'.")
 
-        # Combine all sets of non-e-commerce URLs from different processes into one set
-        final_non_ecommerce_urls_set = set()
-
-        for sublist in all_non_ecommerce_urls:
-            final_non_ecommerce_urls_set.update(sublist)  # Add items from each process's set
-
-        final_non_ecommerce_urls = list(final_non_ecommerce_urls_set)  # Convert back to list
-
-        non_ecommerce_df = pd.DataFrame(final_non_ecommerce_urls, columns=['URL'])
-
-        # Save to CSV with specified structure for non-e-commerce URLs
-        non_ecommerce_df.to_csv('non_ecommerce_urls_de.csv', index=False)
-
-        # Add a new column 'E-commerce Indicator' with default values (NaN)
-        df['E-commerce Indicator'] = float('nan')
+def main():
+    resume = resume_requested("Check which URLs of DEinput.csv are e-commerce sites, leaving out barbers, dentists and lawyers.")
 
-        # Update the 'E-commerce Indicator' to 0 for non-e-commerce URLs
-        df.loc[df.iloc[:, 1].isin(final_non_ecommerce_urls), 'E-commerce Indicator'] = 0
+    # MPI ranks under mpirun, every local core otherwise (see executor.py); with
+    # WEBINTEL_RANKS_PER_NODE only that many ranks per node take part
+    executor = make_executor()
+    if executor is None:
+        return
+    rank = executor.rank
 
-        # Update the 'E-commerce Indicator' to -99 for URLs that resulted in an error
-        error_urls = results_df[results_df['E-commerce Indicator'] == -99]['URL'].tolist()
-        df.loc[df.iloc[:, 1].isin(error_urls), 'E-commerce Indicator'] = -99
+    if rank == 0:
+        context, urls = load_urls()
 
-        # Save the updated DataFrame back to DEinput.csv
-        df.to_csv('DEinput.csv', index=False)
+        # With --resume the URLs an earlier run finished are skipped and its output files appended to
+        checkpoint = Checkpoint(CHECKPOINT_FILE, resume=resume)
+        urls = checkpoint.remaining(urls)
+        outputs = open_results(context, resume)
+    else:
+        context = None
+        urls = None
+        outputs = None
+        checkpoint = None
+
+    # Each process checks if its URLs are e-commerce sites. With WEBINTEL_DISPATCH=dynamic rank 0 hands
+    # out small batches of URLs to whichever process is idle; with static the URLs are split by host
+    # once. Either way a batch's pages are fetched and processed before the next batch (see work_queue.py),
+    # and its result is sent to rank 0 and appended to the output files right away, then its URLs to the checkpoint.
+    executor.run_batches(urls, fetch_and_process(process_chunk, make_scanner), on_result=partial(save_batch, outputs),
+                           on_done=checkpoint.add if rank == 0 else None, desc="Processing URLs")
 
-        logging.info("Results saved to 'ecommerce_detection_results_DE.csv'.")
-        logging.info("Non-e-commerce URLs saved to 'non_ecommerce_urls_de.csv'.")
-        logging.info("Updated input saved to 'DEinput.csv'.")
+    if rank == 0:
+        checkpoint.close()
+        finish_results(context, outputs)
 
 if __name__ == "__main__":
     main()
@@ -1,8 +1,11 @@
-from mpi4py import MPI
+from executor import make_executor
 import pandas as pd
 import requests
 from tqdm import tqdm  # Import tqdm for progress bar
 import logging
+from functools import partial
+from result_stream import Checkpoint, CsvStream, resume_requested
+from work_queue import fetch_and_process
 
 # Set up logging configuration
 logging.basicConfig(
@@ -36,31 +39,25 @@ def is_ecommerce_site(url):
         #logging.error(f"Error fetching {url}: {e}")
         #return -99, None  # Error fetching the URL, return -99
 
-def main():
-    # Initialize MPI
-    comm = MPI.COMM_WORLD
-    rank = comm.Get_rank()
-    size = comm.Get_size()
+# Pages are never fetched: these URLs are decided from their domain alone
+make_scanner = None
 
-    if rank == 0:
-        df = pd.read_csv('NLinput.csv')
-        urls = df.iloc[:, 1].tolist()  # Assuming URLs are in the second column
-        num_urls = len(urls)
+# Append-only list of the URLs finished so far, read by --resume (see result_stream.py)
+CHECKPOINT_FILE = 'checkpoint_barbers_NL.txt'
 
-        # Create an array of indices and split it among processes
-        chunks = [urls[i::size] for i in range(size)]
-    else:
-        chunks = None
+# URLs to check, read on rank 0; the context returned with them is what open_results needs later
+def load_urls():
+    df = pd.read_csv('NLinput.csv')
+    urls = df.iloc[:, 1].tolist()  # Assuming URLs are in the second column
+    return df, urls
 
-    # Scatter the URL chunks to all processes
-    urls_chunk = comm.scatter(chunks, root=0)
-
-    # Each process checks if its URLs are e-commerce sites with a progress bar
+# Classify one rank's URLs (pages is unused, nothing is fetched)
+def process_chunk(urls_chunk, pages=None):
     results_chunk = []
     non_ecommerce_urls = set()  # Use a set to store non-e-commerce URLs
     original_indices = []  # List to store original indices of non-e-commerce URLs
 
-    for i, url in enumerate(tqdm(urls_chunk, desc=f"Processing on rank {rank}")):
+    for i, url in enumerate(tqdm(urls_chunk, desc="Classifying URLs")):
         result, non_ecommerce_url = is_ecommerce_site(url)
 
         if non_ecommerce_url:
@@ -69,64 +66,92 @@ def main():
 
         results_chunk.append((url, result))
 
-    # Gather results from all processes
-    logging.info(f"Rank {rank} is gathering results.")
-    all_results = comm.gather(results_chunk, root=0)
-    logging.info(f"Rank {rank} is gathering non-ecommerce URLs.")
-    all_non_ecommerce_urls = comm.gather(non_ecommerce_urls, root=0)
-    logging.info(f"Rank {rank} is gathering original indices.")
-    all_original_indices = comm.gather(original_indices, root=0)
-
-    if rank == 0:
-        # Flatten the list of results and create a DataFrame for e-commerce checks
-        logging.info("Flattening results.")
-        final_results = [(url, result) for sublist in all_results for url, result in sublist]
-
-        # Ensure unique results by using a set
-        logging.info("Ensuring unique results.")
-        unique_results = set(final_results)
-
-        results_df = pd.DataFrame(unique_results, columns=['URL', 'E-commerce Indicator'])
-
-        # Save to CSV with specified structure for e-commerce checks
-        logging.info("Saving e-commerce detection results.")
-        results_df.to_csv('ecommerce_detection_results_NL.csv', index=False)
+    return results_chunk, non_ecommerce_urls, original_indices
+
+# Output files of rank 0, which the result of every batch is appended to as soon
+# as it arrives (see result_stream.py), so an interrupted run leaves usable output;
+# with resume the rows of the earlier run are kept
+def open_results(df, resume=False):
+    return {
+        'results': CsvStream('ecommerce_detection_results_NL.csv', ['URL', 'E-commerce Indicator'], resume=resume),
+        'non_ecommerce': CsvStream('non_ecommerce_urls_nl.csv', ['URL'], resume=resume),
+    }
+
+# Append the process_chunk result of one batch to the output files
+def save_batch(outputs, batch_result):
+    results_chunk, non_ecommerce_urls, original_indices = batch_result
+    outputs['results'].append(results_chunk)
+    outputs['non_ecommerce'].append([url] for url in non_ecommerce_urls)
+
+# Complete the output files on rank 0 once every batch is in
+def finish_results(df, outputs):
+    for stream in outputs.values():
+        stream.close()
+
+    # Ensure unique results: a URL listed more than once in the input was appended more than once
+    logging.info("Ensuring unique results.")
+    results_df = pd.read_csv('ecommerce_detection_results_NL.csv').drop_duplicates()
+    results_df.to_csv('ecommerce_detection_results_NL.csv', index=False)
+
+    logging.info("Combining non-e-commerce URLs.")
+    non_ecommerce_df = pd.read_csv('non_ecommerce_urls_nl.csv').drop_duplicates()
+    non_ecommerce_df.to_csv('non_ecommerce_urls_nl.csv', index=False)
+    final_non_ecommerce_urls = non_ecommerce_df['URL'].tolist()
+
+    # Add a new column 'E-commerce Indicator' with default values (NaN)
+    logging.info("Adding E-commerce Indicator column.")
+    df['E-commerce Indicator'] = float('nan')
+
+    # Update the 'E-commerce Indicator' to 0 for non-e-commerce URLs
+    logging.info("Updating E-commerce Indicator for non-e-commerce URLs.")
+    df.loc[df.iloc[:, 1].isin(final_non_ecommerce_urls), 'E-commerce Indicator'] = 0
+
+    # Update the 'E-commerce Indicator' to -99 for URLs that resulted in an error
+    logging.info("Updating E-commerce Indicator for error URLs.")
+    error_urls = results_df[results_df['E-commerce Indicator'] == -99]['URL'].tolist()
+    df.loc[df.iloc[:, 1].isin(error_urls), 'E-commerce Indicator'] = -99
+
+    # Save the updated DataFrame back to ATinput.csv
+    #logging.info("Saving updated input.")
+    #df.to_csv('NLinput.csv', index=False)
+
+    #logging.info("Results saved to 'ecommerce_detection_results_NL.csv'.")
+    logging.info("Non-e-commerce URLs saved to 'non_ecommerce_urls_nl.csv'.")
+    #logging.info("Updated input saved to 'NLinput.csv'.")
 
-        # Combine all sets of non-e-commerce URLs from different processes into one set
-        logging.info("Combining non-e-commerce URLs.")
-        final_non_ecommerce_urls_set = set()
-
-        for sublist in all_non_ecommerce_urls:
-            final_non_ecommerce_urls_set.update(sublist)  # Add items from each process's set
-
-        final_non_ecommerce_urls = list(final_non_ecommerce_urls_set)  # Convert back to list
-
-        non_ecommerce_df = pd.DataFrame(final_non_ecommerce_urls, columns=['URL'])
-
-        # Save to CSV with specified structure for non-e-commerce URLs
-        logging.info("Saving non-e-commerce URLs.")
-        non_ecommerce_df.to_csv('non_ecommerce_urls_nl.csv', index=False)
-
-        # Add a new column 'E-commerce Indicator' with default values (NaN)
-        logging.info("Adding E-commerce Indicator column.")
-        df['E-commerce Indicator'] = float('nan')
+def main():
+    resume = resume_requested("Check which URLs of NLinput.csv are e-commerce sites, leaving out barbers, dentists and lawyers.")
 
-        # Update the 'E-commerce Indicator' to 0 for non-e-commerce URLs
-        logging.info("Updating E-commerce Indicator for non-e-commerce URLs.")
-        df.loc[df.iloc[:, 1].isin(final_non_ecommerce_urls), 'E-commerce Indicator'] = 0
+    # MPI ranks under mpirun, every local core otherwise (see executor.py); with
+    # WEBINTEL_RANKS_PER_NODE only that many ranks per node take part
+    executor = make_executor()
+    if executor is None:
+        return
+    rank = executor.rank
 
-        # Update the 'E-commerce Indicator' to -99 for URLs that resulted in an error
-        logging.info("Updating E-commerce Indicator for error URLs.")
-        error_urls = results_df[results_df['E-commerce Indicator'] == -99]['URL'].tolist()
-        df.loc[df.iloc[:, 1].isin(error_urls), 'E-commerce Indicator'] = -99
+    if rank == 0:
+        context, urls = load_urls()
 
-        # Save the updated DataFrame back to ATinput.csv
-        #logging.info("Saving updated input.")
-        #df.to_csv('NLinput.csv', index=False)
+        # With --resume the URLs an earlier run finished are skipped and its output files appended to
+        checkpoint = Checkpoint(CHECKPOINT_FILE, resume=resume)
+        urls = checkpoint.remaining(urls)
+        outputs = open_results(context, resume)
+    else:
+        context = None
+        urls = None
+        outputs = None
+        checkpoint = None
+
+    # Each process checks if its URLs are e-commerce sites. With WEBINTEL_DISPATCH=dynamic rank 0 hands
+    # out small batches of URLs to whichever process is idle; with static the URLs are split by host
+    # once. Either way a batch's pages are fetched and processed before the next batch (see work_queue.py),
+    # and its result is sent to rank 0 and appended to the output files right away, then its URLs to the checkpoint.
+    executor.run_batches(urls, fetch_and_process(process_chunk, make_scanner), on_result=partial(save_batch, outputs),
+                           on_done=checkpoint.add if rank == 0 else None, desc="Processing URLs")
 
-        #logging.info("Results saved to 'ecommerce_detection_results_NL.csv'.")
-        logging.info("Non-e-commerce URLs saved to 'non_ecommerce_urls_nl.csv'.")
-        #logging.info("Updated input saved to 'NLinput.csv'.")
+    if rank == 0:
+        checkpoint.close()
+        finish_results(context, outputs)
 
 if __name__ == "__main__":
     main()
@@ -1,5 +1,5 @@
 import pandas as pd
-import requests
+from fetch_engine import fetch_page
 import logging
 from bs4 import BeautifulSoup  # For parsing HTML
 
@@ -41,46 +41,45 @@ def calculate_probability(url):
         'Fahrzeuge':5
     }
 
-    try:
-        # Send a GET request to the URL
-        response = requests.get(url)
-        keyword_matches = 0
-        print(response.text)
-        found_keywords = {keyword: False for keyword in keywords_german.keys()}
-        print(found_keywords)
-        # Check for e-commerce keywords and record which ones are found
-        for keyword in keywords_german.keys():
-            if keyword in response.text:
-                found_keywords[keyword] = True
+    # Fetch the URL through the shared page cache
+    page = fetch_page(url)
+    if page.error:
+        logging.error(f"Error fetching {url}: {page.error}")
+        return {'URL': url, 'Probability (%)': 0}
 
-        # Analyze HTML content with BeautifulSoup
-        soup = BeautifulSoup(response.text, 'html.parser')
-        print(soup.prettify())
-        # Check for forms and buttons indicating e-commerce functionality
-        forms = soup.find_all('form')
-        buttons = soup.find_all('button')
+    keyword_matches = 0
+    print(page.text)
+    found_keywords = {keyword: False for keyword in keywords_german.keys()}
+    print(found_keywords)
+    # Check for e-commerce keywords and record which ones are found
+    for keyword in keywords_german.keys():
+        if keyword in page.text:
+            found_keywords[keyword] = True
 
-        # Increase matches if certain types of forms/buttons are found
-        if any('checkout' in form.get('action', '') for form in forms):
-            keyword_matches += 5
+    # Analyze HTML content with BeautifulSoup
+    soup = BeautifulSoup(page.text, 'html.parser')
+    print(soup.prettify())
+    # Check for forms and buttons indicating e-commerce functionality
+    forms = soup.find_all('form')
+    buttons = soup.find_all('button')
 
-        if any('buy' in button.text.lower() or 'add to cart' in button.text.lower() or 'Fahrzeuge' in button.text.lower() for button in buttons):
-            keyword_matches += 5
+    # Increase matches if certain types of forms/buttons are found
+    if any('checkout' in form.get('action', '') for form in forms):
+        keyword_matches += 5
 
-        # Calculate base matches based on found keywords
-        for keyword, weight in keywords_german.items():
-            if found_keywords[keyword]:
-                keyword_matches += weight
-                print(f"Keyword: {keyword}, Keyword Matches: {keyword_matches}")
-        total_weight = sum(keywords_german.values())
-        probability = (keyword_matches / total_weight) * 100 if total_weight > 0 else 0
+    if any('buy' in button.text.lower() or 'add to cart' in button.text.lower() or 'Fahrzeuge' in button.text.lower() for button in buttons):
+        keyword_matches += 5
 
-        logging.info(f"{url} has an estimated probability of being an e-commerce site: {probability:.2f}%")
-        return {'URL': url, 'Probability (%)': probability}
+    # Calculate base matches based on found keywords
+    for keyword, weight in keywords_german.items():
+        if found_keywords[keyword]:
+            keyword_matches += weight
+            print(f"Keyword: {keyword}, Keyword Matches: {keyword_matches}")
+    total_weight = sum(keywords_german.values())
+    probability = (keyword_matches / total_weight) * 100 if total_weight > 0 else 0
 
-    except requests.exceptions.RequestException as e:
-        logging.error(f"Error fetching {url}: {e}")
-        return {'URL': url, 'Probability (%)': 0}
+    logging.info(f"{url} has an estimated probability of being an e-commerce site: {probability:.2f}%")
+    return {'URL': url, 'Probability (%)': probability}
 
 def main():
     # Read the CSV file
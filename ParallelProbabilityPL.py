@@ -1,9 +1,15 @@
-from mpi4py import MPI
+from executor import make_executor
 import pandas as pd
-import requests
 import logging
-from bs4 import BeautifulSoup  # For parsing HTML
-from tqdm import tqdm  # Import tqdm for progress bar
+from functools import partial
+from country_profiles import KEYWORDS, URL_BONUSES
+from fetch_engine import write_deferred
+from hit_matrix import HitMatrix
+from page_features import fetch_features
+from result_stream import Checkpoint, CsvStream, resume_requested
+from stream_scan import KeywordScanner
+from work_queue import fetch_and_process
+import pipeline_config as config
 
 # Set up logging configuration
 logging.basicConfig(
@@ -12,162 +18,137 @@ logging.basicConfig(
     format='%(asctime)s - %(levelname)s - %(message)s'
 )
 
-def calculate_probability(urls):
-    # Keywords to look for with base weights
-    keywords_polish = {
-        'Klantenherkenning': 1,
-        'Individuele prijsstelling': 1,
-        'Sessiebeheer': 1,
-        'cart': 10,
-        'online': 3,
-        'shop': 3,
-        'Online-winkel': 10,
-        'diensten': 10,
-        'diensten': 10,
-        'service': 1,
-        'Service': 1,
-        'gezinnen': 1,
-        'Reservering': 10,
-        'verzekering': 10,
-        'lidmaatschap': 10,
-        'gegevensbescherming': 1,
-        'Book': 10,
-        'BOOK': 10,
-        'Booking': 10,
-        'booking': 10,
-        'Boek':10,
-        'Boeken':10,
-        'Kamer':5,
-        'rentcar': 4,
-        'rentacar': 4,
-        'rent': 4,
-        'Rental': 6,
-        'reservation': 5,
-        'Reservation':5,
-        'checkout': 10,
-        'payment': 5,
-        'pay': 5,
-        'Vrachtwagen huren': 5,
-        'Gratis retourzending': 10,
-        'been blocked by bot': 10,
-        'robots': 5,
-        'Voordelenwereld': 5,
-        'Kamers': 5,
-        'KAMERS': 5,
-        'Winkelwagentje': 10,
-        'wellness': 5,
-        'suites': 15,
-        'SUITES': 15,
-        'Rooms':15,
-        'AANVRAAG': 5,
-        'Aanvraag': 5,
-        'delivery': 10
-    }
+# Keywords to look for with base weights (see country_profiles.py)
+keywords_polish = KEYWORDS['PL']
+
+# In streaming mode stop reading a page once its keywords alone reach the decision threshold
+stop_score = config.DECISION_THRESHOLD / 100 * sum(keywords_polish.values())
+
+def make_scanner(url):
+    return KeywordScanner(keywords_polish, stop_score=stop_score)
+
+# Append-only list of the URLs finished so far, read by --resume (see result_stream.py)
+CHECKPOINT_FILE = 'checkpoint_probabilities_PL.txt'
+
+# URLs to score: the ones the barber filter left as e-commerce. The context
+# returned with them is what open_results needs later (none for this stage).
+def load_urls():
+    df = pd.read_csv('ecommerce_detection_results_PL.csv')
+    # Filter only the ones that have field in second column = 1 (ecommerce indicator)
+    df_filtered = df[df.iloc[:, 1] == 1]
+    urls = df_filtered.iloc[:, 0].tolist()  # Assuming URLs are in the first column
+    num_urls = len(urls)
 
+    # Log the number of URLs processed
+    logging.info(f"Total URLs to process: {num_urls}")
+    return None, urls
+
+# Score the fetched pages (PageFeatures, see page_features.py) of one rank's URLs
+def process_chunk(urls, pages):
     results = []
     zero_probability_urls = []
+    deferred_urls = []  # URLs that timed out, to be retried later
 
-    for url in tqdm(urls, desc="Processing URLs"):
-        try:
-            # Send a GET request to the URL with allow_redirects=True to follow redirects
-            response = requests.get(url)
-            keyword_matches = 0
-            found_keywords = {keyword: False for keyword in keywords_polish.keys()}
-
-            # Check for e-commerce keywords and record which ones are found
-            for keyword in keywords_polish.keys():
-                if keyword in response.text:
-                    found_keywords[keyword] = True
-
-            # Analyze HTML content with BeautifulSoup
-            soup = BeautifulSoup(response.text, 'html.parser')
-            # Check for forms and buttons indicating e-commerce functionality
-            forms = soup.find_all('form')
-            buttons = soup.find_all('button')
-            # Check if the URL contains the string "hotel"
-            if "pension" in url:
-                keyword_matches += 15
-            if "hotel" in url:
-                keyword_matches += 15
-            if "cityhotel" in url:
-                keyword_matches += 15
-            # Increase matches if certain types of forms/buttons are found
-            if any('checkout' in form.get('action', '') for form in forms):
-                keyword_matches += 5
-
-            if any('buy' in button.text.lower() or 'add to cart' in button.text.lower() for button in buttons):
-                keyword_matches += 5
-
-            # Calculate base matches based on found keywords
-            for keyword, weight in keywords_polish.items():
-                if found_keywords[keyword]:
-                    keyword_matches += weight
-
-            total_weight = sum(keywords_polish.values())
-            probability = (keyword_matches / total_weight) * 100 if total_weight > 0 else 0
-
-            logging.info(f"{url} has an estimated probability of being an e-commerce site: {probability:.2f}%")
-            results.append({'URL': url, 'Probability (%)': probability})
-
-        except requests.exceptions.RequestException as e:
-            logging.error(f"Error fetching {url}: {e}")
-            zero_probability_urls.append(url)
-
-    return results, zero_probability_urls
+    for features in pages:
+        if features.timed_out:
+            logging.warning(f"Timed out fetching {features.url}: {features.error}")
+            deferred_urls.append(features.url)
+        elif features.error:
+            logging.error(f"Error fetching {features.url}: {features.error}")
+            zero_probability_urls.append(features.url)
 
-def main():
-    # Initialize MPI
-    comm = MPI.COMM_WORLD
-    rank = comm.Get_rank()
-    size = comm.Get_size()
+    # Score every fetched page at once: the keyword and form/button hits of the pages form a sparse
+    # matrix, multiplied by the weights, plus the URL bonuses (see hit_matrix.py and country_profiles.py)
+    hits = HitMatrix.from_features([features for features in pages if not features.timed_out and not features.error])
+    probabilities = hits.score(keywords_polish, URL_BONUSES['PL'])
 
-    # Read the CSV file only on the root process
-    if rank == 0:
-        df = pd.read_csv('ecommerce_detection_results_PL.csv')
-        # Filter only the ones that have field in second column = 1 (ecommerce indicator)
-        df_filtered = df[df.iloc[:, 1] == 1]
-        urls = df_filtered.iloc[:, 0].tolist()  # Assuming URLs are in the first column
-        num_urls = len(urls)
+    for url, probability in zip(hits.urls, probabilities.tolist()):
+        logging.info(f"{url} has an estimated probability of being an e-commerce site: {probability:.2f}%")
+        results.append({'URL': url, 'Probability (%)': probability})
 
-        # Log the number of URLs processed
-        logging.info(f"Total URLs to process: {num_urls}")
+    return results, zero_probability_urls, deferred_urls, hits
+
+def calculate_probability(urls):
+    # Fetch this rank's URLs concurrently; every page is parsed once into its features, and
+    # pages unchanged since an earlier stage or run (304 or still fresh in the cache) reuse them
+    pages = fetch_features(urls, scanner=make_scanner, desc="Processing URLs")
+    return process_chunk(urls, pages)
+
+# Output files of rank 0, which the result of every batch is appended to as soon
+# as it arrives (see result_stream.py), so an interrupted run leaves usable output;
+# with resume the rows of the earlier run are kept
+def open_results(context, resume=False):
+    return {
+        'probabilities': CsvStream('ecommerce_probabilities_parallel_PLDATASET.csv', ['URL', 'Probability (%)'], resume=resume),
+        'hits': CsvStream('keyword_hits_PLDATASET.csv', ['URL', 'Hits'], resume=resume),
+    }
 
-        # Split URLs among processes
-        chunks = [urls[i::size] for i in range(size)]
+# Append the process_chunk result of one batch to the output files
+def save_batch(outputs, batch_result):
+    results, zero_probability_urls, deferred_urls, hits = batch_result
+    outputs['probabilities'].append((item['URL'], item['Probability (%)']) for item in results)
+
+    # Keep the keyword hits so the pages can be re-scored offline after a weight change
+    outputs['hits'].append(hits.hit_rows())
+
+    # Save URLs that timed out so they can be retried in a later run
+    write_deferred(deferred_urls, 'deferred_urls_PLDATASET.csv')
+
+# Complete the output files on rank 0 once every batch is in
+def finish_results(context, outputs):
+    for stream in outputs.values():
+        stream.close()
+
+    # The keyword hits as a sparse matrix for hit_matrix.py and whatif.py
+    HitMatrix.read_hit_rows('keyword_hits_PLDATASET.csv').save('keyword_hits_PLDATASET.npz')
+
+    # Filter URLs with zero probability from the results
+    results_df = pd.read_csv('ecommerce_probabilities_parallel_PLDATASET.csv')
+    zero_probability_urls = results_df.loc[results_df['Probability (%)'] == 0, 'URL'].tolist()
+
+    # Save URLs with zero probability to a separate CSV
+    if zero_probability_urls:
+        zero_probability_df = pd.DataFrame(zero_probability_urls, columns=['URL'])
+        zero_probability_df.to_csv('zero_probability_urls_PLDATASET.csv', index=False)
+        logging.info("URLs with zero probability have been saved to 'zero_probability_urls_PLDATASET.csv'.")
     else:
-        chunks = None
+        logging.info("No URLs with zero probability found.")
 
-    # Scatter the URL chunks to all processes
-    urls_chunk = comm.scatter(chunks, root=0)
+    logging.info("Probabilities have been saved to 'ecommerce_probabilities_parallel_PLDATASET.csv'.")
 
-    # Each process calculates probabilities for its chunk of URLs
-    results_chunk, zero_probability_urls_chunk = calculate_probability(urls_chunk)
+def main():
+    resume = resume_requested("Estimate how likely the PL URLs left by the barber filter are e-commerce sites.")
+
+    # MPI ranks under mpirun, every local core otherwise (see executor.py); with
+    # WEBINTEL_RANKS_PER_NODE only that many ranks per node take part
+    executor = make_executor()
+    if executor is None:
+        return
+    rank = executor.rank
 
-    # Gather results from all processes
-    all_results = comm.gather(results_chunk, root=0)
-    all_zero_probability_urls = comm.gather(zero_probability_urls_chunk, root=0)
+    if rank == 0:
+        context, urls = load_urls()
+
+        # With --resume the URLs an earlier run finished are skipped and its output files appended to
+        checkpoint = Checkpoint(CHECKPOINT_FILE, resume=resume)
+        urls = checkpoint.remaining(urls)
+        outputs = open_results(context, resume)
+    else:
+        context = None
+        urls = None
+        outputs = None
+        checkpoint = None
+
+    # Each process calculates probabilities for the URLs it is given. With WEBINTEL_DISPATCH=dynamic rank 0 hands
+    # out small batches of URLs to whichever process is idle; with static the URLs are split by host
+    # once. Either way a batch's pages are fetched and processed before the next batch (see work_queue.py),
+    # and its result is sent to rank 0 and appended to the output files right away, then its URLs to the checkpoint.
+    executor.run_batches(urls, fetch_and_process(process_chunk, make_scanner), on_result=partial(save_batch, outputs),
+                           on_done=checkpoint.add if rank == 0 else None, desc="Processing URLs")
 
     if rank == 0:
-        # Flatten the list of results
-        final_results = [item for sublist in all_results for item in sublist]
-        final_zero_probability_urls = [url for sublist in all_zero_probability_urls for url in sublist]
-
-        # Create a DataFrame from results and save to CSV
-        results_df = pd.DataFrame(final_results)
-        results_df.to_csv('ecommerce_probabilities_parallel_PLDATASET.csv', index=False)
-
-        # Filter URLs with zero probability from final_results
-        zero_probability_urls = [item['URL'] for item in final_results if item['Probability (%)'] == 0]
-
-        # Save URLs with zero probability to a separate CSV
-        if zero_probability_urls:
-            zero_probability_df = pd.DataFrame(zero_probability_urls, columns=['URL'])
-            zero_probability_df.to_csv('zero_probability_urls_PLDATASET.csv', index=False)
-            logging.info("URLs with zero probability have been saved to 'zero_probability_urls_PLDATASET.csv'.")
-        else:
-            logging.info("No URLs with zero probability found.")
-
-        logging.info("Probabilities have been saved to 'ecommerce_probabilities_parallel_PLDATASET.csv'.")
+        checkpoint.close()
+        finish_results(context, outputs)
 
 if __name__ == "__main__":
     main()
@@ -7,8 +7,13 @@ import requests  # For sending HTTP requests to llama-server
 import subprocess  # For running shell commands
 from mpi4py import MPI
 from crawl4ai import AsyncWebCrawler
+from ecommerce_detector import translation_terms
+from page_cache import shared_cache
+from page_features import text_features
 from requests.exceptions import RequestException
-from tqdm import tqdm  # Import tqdm for progress bar
+from result_stream import Checkpoint, CsvStream, resume_requested
+from warc_archive import shared_archive
+from work_queue import run_batches
 
 # Configure logging
 log_filename = "script_log.log"
@@ -34,6 +39,10 @@ translations = {
     "ticket": {"German": "Ticket", "Dutch": "ticket", "Polish": "bilet"}
 }
 
+# Casefolded terms looked up in the page features; the features record every
+# term of country_profiles.TRANSLATIONS, of which these are a subset
+ecommerce_terms = translation_terms(translations)
+
 # Load URLs from a CSV file
 def load_urls_from_csv(filename):
     urls = []
@@ -50,29 +59,10 @@ def load_urls_from_csv(filename):
     return urls
 
 # Analyze the output for eCommerce and social media presence with handles
-def analyze_output(text):
-    # Check if it's an eCommerce site by searching for keywords in multiple languages
-    is_ecommerce = any(
-        term in text.lower() for word in translations.keys()
-        for term in [word] + [translations[word][lang].lower() for lang in translations[word]]
-    )
-
-    # Check for social media links and extract handles if available
-    social_media = {
-        platform: re.search(pattern, text, re.IGNORECASE)
-        for platform, pattern in {
-            'Twitter': r'twitter\.com/([A-Za-z0-9_]+)',
-            'YouTube': r'youtube\.com/(channel|user)/([A-Za-z0-9_-]+)',
-            'TikTok': r'tiktok\.com/@([A-Za-z0-9_.]+)',
-            'LinkedIn': r'linkedin\.com/in/([A-Za-z0-9_-]+)'
-        }.items()
-    }
-
-    # Convert results to Yes/No and extract value if found
-    social_media_presence = {platform: ("Yes" if match else "No") for platform, match in social_media.items()}
-    social_media_handles = {f"{platform}_value": (match.group(0) if match else "") for platform, match in social_media.items()}
-
-    return is_ecommerce, social_media_presence, social_media_handles
+# (every handle found on the page, separated by "; ")
+def analyze_output(features):
+    social_media_presence, social_media_handles = features.social_columns()
+    return bool(features.term_hits & ecommerce_terms), social_media_presence, social_media_handles
 
 # Function to clean and compress text
 def clean_and_compress_text(text):
@@ -101,14 +91,37 @@ def check_gpu_usage():
         logging.error(f"Error checking GPU usage: {e}")
         return None, None
 
-# Main processing function for each URL
-async def process_url(url, server_url):
-    try:
+# Crawl a URL with crawl4ai and return its markdown. The browser-rendered markdown
+# is stored in the shared page cache as its own rendition of the URL, so a URL is
+# crawled only once across runs of this script. With WEBINTEL_WARC=record the
+# markdown is archived too, and with WEBINTEL_WARC=replay it is read from the archive only.
+async def crawl_markdown(url):
+    archive = shared_archive()
+    if archive is not None and archive.replaying:
+        recorded = archive.get(url, kind='crawl4ai')
+        return recorded['body'].decode('utf-8') if recorded is not None else None
+
+    cache = shared_cache()
+    cached = cache.get(url, kind='crawl4ai') if cache is not None else None
+    if cached is not None:
+        text_content = cached['body'].decode('utf-8')
+    else:
         async with AsyncWebCrawler(verbose=True) as crawler:
             crawler_output = await crawler.arun(url=url)
 
         # Extract relevant text from the CrawlResult object
         text_content = crawler_output.markdown
+        if text_content and cache is not None:
+            cache.put(url, 200, [], text_content.encode('utf-8'), kind='crawl4ai')
+
+    if text_content and archive is not None:
+        archive.record_resource(url, 'crawl4ai', text_content.encode('utf-8'), 'text/markdown; charset=utf-8')
+    return text_content
+
+# Main processing function for each URL
+async def process_url(url, server_url):
+    try:
+        text_content = await crawl_markdown(url)
 
         if not text_content:
             logging.warning(f"No valid text found for URL: {url}")
@@ -118,7 +131,7 @@ async def process_url(url, server_url):
         compressed_text = clean_and_compress_text(text_content)
 
         # Analyze output
-        is_ecommerce, social_media_presence, social_media_handles = analyze_output(compressed_text)
+        is_ecommerce, social_media_presence, social_media_handles = analyze_output(text_features(url, compressed_text))
 
         # Prepare input for Llama.cpp
         llama_input = f"""
@@ -160,8 +173,9 @@ async def process_url(url, server_url):
         logging.error(f"An error occurred while processing URL {url}: {e}")
         return "", False, {}, {}
 
-# Save results to CSV
-def save_results_to_csv(filename, results):
+# Output CSV of rank 0, which the results of every batch are appended to as soon
+# as they arrive; with resume the rows of an earlier run are kept
+def open_results_csv(filename, resume=False):
     fieldnames = ["URL",
                   "eCommerce",
                   "Twitter",
@@ -173,54 +187,51 @@ def save_results_to_csv(filename, results):
                   "LinkedIn",
                   "LinkedIn_value",
                   "llama_response"]
+    return CsvStream(filename, fieldnames, resume=resume)
 
+# Append the results of one batch; False when they could not be written
+def save_results_to_csv(stream, results):
     try:
-        with open(filename, mode="w", newline="") as file:
-            writer = csv.DictWriter(file, fieldnames=fieldnames)
-            writer.writeheader()
-            writer.writerows(results)  # Write all results at once
+        stream.append([result[field] for field in stream.columns] for result in results)
+        return True
     except Exception as e:
-        logging.error(f"An error occurred while saving results to {filename}: {e}")
+        logging.error(f"An error occurred while saving results to {stream.path}: {e}")
+        return False
 
-# Process all URLs from CSV and save results
-async def process_urls_from_csv(input_csv, output_csv, server_url, urls):
+# Process a batch of URLs and return the results of the ones the llama-server answered
+async def process_urls(server_url, urls):
     results = []
-
-    # Create a progress bar
-    with tqdm(total=len(urls), desc="Processing URLs") as pbar:
-        for url in urls:
-            logging.info(f"Processing URL: {url}")
-            llama_response, is_ecommerce, social_media_presence, social_media_handles = await process_url(url, server_url)
-
-            if not llama_response:
-                logging.warning(f"Skipping URL {url} due to processing error.")
-                continue
-
-            result = {
-                'URL': url,
-                'eCommerce': 'Yes' if is_ecommerce else 'No',
-                'Twitter': social_media_presence.get('Twitter', 'No'),
-                'Twitter_value': social_media_handles.get('Twitter_value', ''),
-                'YouTube': social_media_presence.get('YouTube', 'No'),
-                'YouTube_value': social_media_handles.get('YouTube_value', ''),
-                'TikTok': social_media_presence.get('TikTok', 'No'),
-                'TikTok_value': social_media_handles.get('TikTok_value', ''),
-                'LinkedIn': social_media_presence.get('LinkedIn', 'No'),
-                'LinkedIn_value': social_media_handles.get('LinkedIn_value', ''),
-                'llama_response': llama_response,
-            }
-
-            results.append(result)
-            pbar.update(1)  # Update the progress bar
-
-    save_results_to_csv(output_csv, results)
-    logging.info(f"Results saved to {output_csv}")
+    for url in urls:
+        logging.info(f"Processing URL: {url}")
+        llama_response, is_ecommerce, social_media_presence, social_media_handles = await process_url(url, server_url)
+
+        if not llama_response:
+            logging.warning(f"Skipping URL {url} due to processing error.")
+            continue
+
+        result = {
+            'URL': url,
+            'eCommerce': 'Yes' if is_ecommerce else 'No',
+            'Twitter': social_media_presence.get('Twitter', 'No'),
+            'Twitter_value': social_media_handles.get('Twitter_value', ''),
+            'YouTube': social_media_presence.get('YouTube', 'No'),
+            'YouTube_value': social_media_handles.get('YouTube_value', ''),
+            'TikTok': social_media_presence.get('TikTok', 'No'),
+            'TikTok_value': social_media_handles.get('TikTok_value', ''),
+            'LinkedIn': social_media_presence.get('LinkedIn', 'No'),
+            'LinkedIn_value': social_media_handles.get('LinkedIn_value', ''),
+            'llama_response': llama_response,
+        }
+
+        results.append(result)
+    return results
 
 # Run the processing and save results
 if __name__ == "__main__":
+    resume = resume_requested("Ask the llama-server about every URL of a nation's updated input, on all MPI processes.")
+
     comm = MPI.COMM_WORLD
     rank = comm.Get_rank()
-    size = comm.Get_size()
 
     server_url = "http://localhost:8080/completion"  # Adjust the URL as per your llama-server setup
 
@@ -280,12 +291,16 @@ if __name__ == "__main__":
     # Load URLs from CSV on rank 0
     if rank == 0:
         urls = load_urls_from_csv(input_csv)
-        urls = [urls[i::size] for i in range(size)]  # Distribute URLs evenly among processes
+
+        # With --resume the URLs an earlier run finished (listed in an append-only
+        # checkpoint next to the output) are skipped and the output CSV appended to
+        checkpoint = Checkpoint(f"checkpoint_llm_{nation}.txt", resume=resume)
+        urls = checkpoint.remaining(urls)
+        results_csv = open_results_csv(output_csv, resume)
     else:
         urls = None
-
-    # Scatter URLs to all processes
-    urls = comm.scatter(urls, root=0)
+        results_csv = None
+        checkpoint = None
 
     # Check GPU usage before processing
     memory_used, gpu_utilization = check_gpu_usage()
@@ -301,22 +316,22 @@ if __name__ == "__main__":
     else:
         logging.info(f"GPU usage before processing: Memory used: {memory_used} MB | GPU Utilization: {gpu_utilization} %")
 
-    # Process URLs in parallel
-    asyncio.run(process_urls_from_csv(input_csv, f"{output_csv}_{rank}.csv", server_url, urls))
+    # Append the results of one batch on rank 0, then the URLs of the rows written to the checkpoint.
+    # URLs skipped because of an error (e.g. the llama-server being down) have no row and stay out of
+    # it, so --resume tries them again.
+    def save_batch(results):
+        if save_results_to_csv(results_csv, results):
+            checkpoint.add(result['URL'] for result in results)
+
+    # Process URLs in parallel: handed out in small batches to idle ranks (WEBINTEL_DISPATCH=dynamic)
+    # or split by host once (static), see work_queue.py. The results of every batch are sent to rank 0
+    # and appended to the output CSV right away, so an interrupted run keeps what was done.
+    run_batches(comm, urls, lambda batch: asyncio.run(process_urls(server_url, batch)),
+                on_result=save_batch, batches_at_once=1, desc="Processing URLs")
 
-    # Gather results on rank 0
     if rank == 0:
-        all_results = []
-        for i in range(size):
-            with open(f"{output_csv}_{i}.csv", mode="r", newline="") as file:
-                reader = csv.DictReader(file)
-                all_results.extend([row for row in reader])
-
-        # Save all results to a single CSV file
-        save_results_to_csv(output_csv, all_results)
-
-        # Clean up individual result files
-        for i in range(size):
-            subprocess.run(["rm", f"{output_csv}_{i}.csv"])
+        results_csv.close()
+        checkpoint.close()
+        logging.info(f"Results saved to {output_csv}")
 
     comm.Barrier()
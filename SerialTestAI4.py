@@ -6,8 +6,14 @@ import logging  # For logging
 import requests  # For sending HTTP requests to llama-server
 import subprocess  # For running shell commands
 from crawl4ai import AsyncWebCrawler
+from country_profiles import TRANSLATIONS
+from ecommerce_detector import translation_terms
+from page_cache import shared_cache
+from page_features import text_features
 from requests.exceptions import RequestException
+from result_stream import Checkpoint, CsvStream, resume_requested
 from tqdm import tqdm  # Import tqdm for progress bar
+from warc_archive import shared_archive
 
 # Configure logging
 log_filename = "script_log.log"
@@ -20,19 +26,11 @@ logging.basicConfig(
     ]
 )
 
-# Define translations for eCommerce terms in different languages
-translations = {
-    "cart": {"German": "Warenkorb", "Dutch": "winkelwagen", "Polish": "koszyk"},
-    "checkout": {"German": "Kasse", "Dutch": "afrekenen", "Polish": "kasa"},
-    "book": {"German": "Buch", "Dutch": "boek", "Polish": "książka"},
-    "product": {"German": "Produkt", "Dutch": "product", "Polish": "produkt"},
-    "shop": {"German": "Geschäft", "Dutch": "winkel", "Polish": "sklep"},
-    "online shop": {"German": "Onlineshop", "Dutch": "webwinkel", "Polish": "sklep internetowy"},
-    "booking": {"German": "Buchung", "Dutch": "boeking", "Polish": "rezerwacja"},
-    "room": {"German": "Zimmer", "Dutch": "kamer", "Polish": "pokój"},
-    "ticket": {"German": "Ticket", "Dutch": "ticket", "Polish": "bilet"},
-    "insurance": {"German": "Versicherung", "Dutch": "verzekering", "Polish": "ubezpieczenie"}
-}
+# Translations of the eCommerce terms in different languages (see country_profiles.py)
+translations = TRANSLATIONS
+
+# Casefolded terms looked up in the page features
+ecommerce_terms = translation_terms(translations)
 
 # Load URLs from a CSV file
 def load_urls_from_csv(filename):
@@ -50,29 +48,10 @@ def load_urls_from_csv(filename):
     return urls
 
 # Analyze the output for eCommerce and social media presence with handles
-def analyze_output(text):
-    # Check if it's an eCommerce site by searching for keywords in multiple languages
-    is_ecommerce = any(
-        term in text.lower() for word in translations.keys()
-        for term in [word] + [translations[word][lang].lower() for lang in translations[word]]
-    )
-
-    # Check for social media links and extract handles if available
-    social_media = {
-        platform: re.search(pattern, text, re.IGNORECASE)
-        for platform, pattern in {
-            'Twitter': r'twitter\.com/([A-Za-z0-9_]+)',
-            'YouTube': r'youtube\.com/(channel|user)/([A-Za-z0-9_-]+)',
-            'TikTok': r'tiktok\.com/@([A-Za-z0-9_.]+)',
-            'LinkedIn': r'linkedin\.com/in/([A-Za-z0-9_-]+)'
-        }.items()
-    }
-
-    # Convert results to Yes/No and extract value if found
-    social_media_presence = {platform: ("Yes" if match else "No") for platform, match in social_media.items()}
-    social_media_handles = {f"{platform}_value": (match.group(0) if match else "") for platform, match in social_media.items()}
-
-    return is_ecommerce, social_media_presence, social_media_handles
+# (every handle found on the page, separated by "; ")
+def analyze_output(features):
+    social_media_presence, social_media_handles = features.social_columns()
+    return bool(features.term_hits & ecommerce_terms), social_media_presence, social_media_handles
 
 # Function to clean and compress text
 def clean_and_compress_text(text):
@@ -101,14 +80,37 @@ def check_gpu_usage():
         logging.error(f"Error checking GPU usage: {e}")
         return None, None
 
-# Main processing function for each URL
-async def process_url(url, server_url):
-    try:
+# Crawl a URL with crawl4ai and return its markdown. The browser-rendered markdown
+# is stored in the shared page cache as its own rendition of the URL, so a URL is
+# crawled only once across runs of this script. With WEBINTEL_WARC=record the
+# markdown is archived too, and with WEBINTEL_WARC=replay it is read from the archive only.
+async def crawl_markdown(url):
+    archive = shared_archive()
+    if archive is not None and archive.replaying:
+        recorded = archive.get(url, kind='crawl4ai')
+        return recorded['body'].decode('utf-8') if recorded is not None else None
+
+    cache = shared_cache()
+    cached = cache.get(url, kind='crawl4ai') if cache is not None else None
+    if cached is not None:
+        text_content = cached['body'].decode('utf-8')
+    else:
         async with AsyncWebCrawler(verbose=True) as crawler:
             crawler_output = await crawler.arun(url=url)
 
         # Extract relevant text from the CrawlResult object
         text_content = crawler_output.markdown
+        if text_content and cache is not None:
+            cache.put(url, 200, [], text_content.encode('utf-8'), kind='crawl4ai')
+
+    if text_content and archive is not None:
+        archive.record_resource(url, 'crawl4ai', text_content.encode('utf-8'), 'text/markdown; charset=utf-8')
+    return text_content
+
+# Main processing function for each URL
+async def process_url(url, server_url):
+    try:
+        text_content = await crawl_markdown(url)
 
         if not text_content:
             logging.warning(f"No valid text found for URL: {url}")
@@ -118,7 +120,7 @@ async def process_url(url, server_url):
         compressed_text = clean_and_compress_text(text_content)
 
         # Analyze output
-        is_ecommerce, social_media_presence, social_media_handles = analyze_output(compressed_text)
+        is_ecommerce, social_media_presence, social_media_handles = analyze_output(text_features(url, compressed_text))
 
         # Prepare input for Llama.cpp
         llama_input = f"""
@@ -160,8 +162,9 @@ async def process_url(url, server_url):
         logging.error(f"An error occurred while processing URL {url}: {e}")
         return "", False, {}, {}
 
-# Save results to CSV
-def save_results_to_csv(filename, results):
+# Output CSV, which every result is appended to as soon as it is ready; with
+# resume the rows of an earlier run are kept (see result_stream.py)
+def open_results_csv(filename, resume=False):
     fieldnames = ["URL",
                   "eCommerce",
                   "Twitter",
@@ -173,18 +176,22 @@ def save_results_to_csv(filename, results):
                   "LinkedIn",
                   "LinkedIn_value",
                   "llama_response"]
+    return CsvStream(filename, fieldnames, resume=resume)
 
+# Append results to the output CSV; False when they could not be written
+def save_results_to_csv(stream, results):
     try:
-        with open(filename, mode="w", newline="") as file:
-            writer = csv.DictWriter(file, fieldnames=fieldnames)
-            writer.writeheader()
-            writer.writerows(results)  # Write all results at once
+        stream.append([result[field] for field in stream.columns] for result in results)
+        return True
     except Exception as e:
-        logging.error(f"An error occurred while saving results to {filename}: {e}")
+        logging.error(f"An error occurred while saving results to {stream.path}: {e}")
+        return False
 
-# Process all URLs from CSV and save results
-async def process_urls_from_csv(input_csv, output_csv, server_url, urls):
-    results = []
+# Process all URLs from CSV and save results: every result is appended to output_csv
+# and its URL to the checkpoint as soon as it is ready; URLs without a result are not
+# checkpointed
+async def process_urls_from_csv(input_csv, output_csv, server_url, urls, checkpoint, resume=False):
+    results_csv = open_results_csv(output_csv, resume)
 
     # Create a progress bar
     with tqdm(total=len(urls), desc="Processing URLs") as pbar:
@@ -192,6 +199,7 @@ async def process_urls_from_csv(input_csv, output_csv, server_url, urls):
             logging.info(f"Processing URL: {url}")
             llama_response, is_ecommerce, social_media_presence, social_media_handles = await process_url(url, server_url)
 
+            # Left out of the checkpoint, so --resume tries it again
             if not llama_response:
                 logging.warning(f"Skipping URL {url} due to processing error.")
                 continue
@@ -210,14 +218,18 @@ async def process_urls_from_csv(input_csv, output_csv, server_url, urls):
                 'llama_response': llama_response,
             }
 
-            results.append(result)
+            if save_results_to_csv(results_csv, [result]):
+                checkpoint.add([url])
             pbar.update(1)  # Update the progress bar
 
-    save_results_to_csv(output_csv, results)
+    results_csv.close()
+    checkpoint.close()
     logging.info(f"Results saved to {output_csv}")
 
 # Run the processing and save results
 if __name__ == "__main__":
+    resume = resume_requested("Ask the llama-server about every URL of a nation's updated input.")
+
     server_url = "http://localhost:8080/completion"  # Adjust the URL as per your llama-server setup
 
     # Ask the user for the nation
@@ -262,6 +274,11 @@ if __name__ == "__main__":
     # Load URLs from CSV
     urls = load_urls_from_csv(input_csv)
 
+    # With --resume the URLs an earlier run finished (listed in an append-only
+    # checkpoint) are skipped and the output CSV appended to
+    checkpoint = Checkpoint(f"checkpoint_llm_{nation}.txt", resume=resume)
+    urls = checkpoint.remaining(urls)
+
     # Check GPU usage before processing
     memory_used, gpu_utilization = check_gpu_usage()
     if memory_used is None:
@@ -277,4 +294,4 @@ if __name__ == "__main__":
         logging.info(f"GPU usage before processing: Memory used: {memory_used} MB | GPU Utilization: {gpu_utilization} %")
 
     # Process URLs sequentially
-    asyncio.run(process_urls_from_csv(input_csv, output_csv, server_url, urls))
+    asyncio.run(process_urls_from_csv(input_csv, output_csv, server_url, urls, checkpoint, resume))
@@ -1,7 +1,8 @@
-from mpi4py import MPI
+from executor import make_executor
 import pandas as pd
-from tqdm import tqdm  # Import tqdm for progress bar
 import logging
+import pipeline_config as config
+from result_stream import Checkpoint, CsvStream, resume_requested
 
 # Set up logging configuration
 logging.basicConfig(
@@ -10,13 +11,17 @@ logging.basicConfig(
     format='%(asctime)s - %(levelname)s - %(message)s'
 )
 
+# Append-only lists of the input rows finished so far and of the ones marked as e-commerce, read by --resume
+CHECKPOINT_FILE = 'checkpoint_update_NL.txt'
+MARKED_FILE = 'marked_rows_NL.csv'
+
 def update_ecommerce_indicator(df_input, df_probabilities):
     # Merge the datasets on the URL column
     merged_df = pd.merge(df_input, df_probabilities, left_on='url', right_on='URL', how='left')
 
     # Update the 'ecommerce' field based on the rounded probability
     merged_df['ecommerce'] = merged_df.apply(
-        lambda row: 1 if row['Probability (%)'] >= 20 else row['ecommerce'],
+        lambda row: 1 if row['Probability (%)'] >= config.DECISION_THRESHOLD else row['ecommerce'],
         axis=1
     )
 
@@ -28,10 +33,13 @@ def update_ecommerce_indicator(df_input, df_probabilities):
     return merged_df
 
 def main():
-    # Initialize MPI
-    comm = MPI.COMM_WORLD
-    rank = comm.Get_rank()
-    size = comm.Get_size()
+    resume = resume_requested("Mark the e-commerce rows of NLinput.csv from the probabilities of ParallelProbabilityNL.py.")
+
+    # MPI ranks under mpirun, every local core otherwise (see executor.py)
+    executor = make_executor()
+    if executor is None:
+        return
+    rank = executor.rank
 
     if rank == 0:
         # Read the input CSV file
@@ -40,42 +48,57 @@ def main():
         # Read the probabilities CSV file
         df_probabilities = pd.read_csv('ecommerce_probabilities_parallel_NLDATASET.csv')
 
-        # Split the input DataFrame among processes
-        chunks = [df_input[i::size] for i in range(size)]
+        # The (index, url) rows to update
+        rows = list(zip(df_input.index, df_input['url']))
+
+        # The input with the updates of every batch applied as they arrive; it keeps its original order
+        updated_df = df_input.copy()
+
+        # With --resume the rows an earlier run finished are skipped and the ones it marked are marked again
+        checkpoint = Checkpoint(CHECKPOINT_FILE, resume=resume, key=lambda row: row[0])
+        rows = checkpoint.remaining(rows)
+        marked = CsvStream(MARKED_FILE, ['index'], resume=resume)
+        if resume:
+            updated_df.loc[pd.read_csv(MARKED_FILE)['index'].tolist(), 'ecommerce'] = 1
     else:
-        df_input = None
         df_probabilities = None
-        chunks = None
-
-    # Scatter the input DataFrame chunks to all processes
-    df_input_chunk = comm.scatter(chunks, root=0)
+        rows = None
+        updated_df = None
+        marked = None
+        checkpoint = None
 
     # Broadcast the probabilities DataFrame to all processes
-    df_probabilities = comm.bcast(df_probabilities, root=0)
-
-    # Each process updates its chunk of the input DataFrame with a progress bar
-    updated_df_chunk = df_input_chunk.copy()  # Create a copy to avoid modifying the original chunk
-    for index, row in tqdm(df_input_chunk.iterrows(), total=df_input_chunk.shape[0], desc=f"Processing on rank {rank}"):
-        url = row['url']
-        probability = df_probabilities.loc[df_probabilities['URL'] == url, 'Probability (%)'].values
-        if len(probability) > 0:
-            probability = probability[0]
-            if probability >= 20:
-                updated_df_chunk.at[index, 'ecommerce'] = 1
-        if url == 'https://www.hertz.de':
-            updated_df_chunk.at[index, 'ecommerce'] = 1
-        if url == 'https://www.notebooksbilliger.de':
-            updated_df_chunk.at[index, 'ecommerce'] = 1
-
-    # Gather updated chunks from all processes
-    updated_df_chunks = comm.gather(updated_df_chunk, root=0)
+    df_probabilities = executor.bcast(df_probabilities)
+
+    # Indices of the rows of a batch whose 'ecommerce' field becomes 1
+    def update_rows(rows):
+        ecommerce_indices = []
+        for index, url in rows:
+            probability = df_probabilities.loc[df_probabilities['URL'] == url, 'Probability (%)'].values
+            if len(probability) > 0:
+                probability = probability[0]
+                if probability >= config.DECISION_THRESHOLD:
+                    ecommerce_indices.append(index)
+            if url == 'https://www.hertz.de':
+                ecommerce_indices.append(index)
+            if url == 'https://www.notebooksbilliger.de':
+                ecommerce_indices.append(index)
+        return ecommerce_indices
+
+    # Mark the rows of one batch on rank 0
+    def mark_ecommerce(ecommerce_indices):
+        updated_df.loc[ecommerce_indices, 'ecommerce'] = 1
+        marked.append([index] for index in ecommerce_indices)
+
+    # Each process updates the rows it is given: handed out in small batches to idle ranks
+    # (WEBINTEL_DISPATCH=dynamic) or split once (static), see work_queue.py; the rows to mark
+    # are sent to rank 0 as soon as a batch is done
+    executor.run_batches(rows, update_rows, url_of=lambda row: str(row[1]), on_result=mark_ecommerce,
+                         on_done=checkpoint.add if rank == 0 else None, batches_at_once=1, desc="Updating rows")
 
     if rank == 0:
-        # Concatenate all updated chunks into a single DataFrame
-        updated_df = pd.concat(updated_df_chunks)
-
-        # Sort the updated DataFrame back to the original order
-        updated_df.sort_index(inplace=True)
+        checkpoint.close()
+        marked.close()
 
         # Save the updated DataFrame back to DEinput.csv
         updated_df.to_csv('NEWNLinput.csv', index=False)
@@ -0,0 +1,80 @@
+import argparse
+import glob
+import os
+import time
+
+from country_profiles import KEYWORDS
+from keyword_matcher import KeywordMatcher, ahocorasick
+
+# Load the pages of the corpus: saved *.html / *.htm files, and the pages of
+# any WARC file recorded with WEBINTEL_WARC=record
+def load_corpus(directory):
+    pages = []
+    for path in sorted(glob.glob(os.path.join(directory, '**', '*.htm*'), recursive=True)):
+        with open(path, encoding='utf-8', errors='replace') as file:
+            pages.append(file.read())
+
+    if glob.glob(os.path.join(directory, '*.warc*')):
+        from warc_archive import WarcArchive
+        archive = WarcArchive(mode='replay', directory=directory)
+        for url in archive.urls():
+            body = archive.get(url)['body']
+            pages.append(body.decode('utf-8', errors='replace'))
+    return pages
+
+
+# The per-keyword scan calculate_probability used before the matcher
+def scan_each_keyword(weights, text):
+    found_keywords = {keyword: False for keyword in weights.keys()}
+    for keyword in weights.keys():
+        if keyword in text:
+            found_keywords[keyword] = True
+    return found_keywords
+
+
+# Best time of repeat passes of find over all pages
+def time_pass(find, pages, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        for text in pages:
+            find(text)
+        best = min(best, time.perf_counter() - start_time)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the per-keyword scan with the Aho-Corasick matcher.")
+    parser.add_argument('corpus', help="Directory of saved HTML pages and/or WARC files")
+    parser.add_argument('--country', choices=sorted(KEYWORDS), action='append',
+                        help="Keyword table to benchmark (repeatable, default all)")
+    parser.add_argument('--repeat', type=int, default=5, help="Passes per method; the best one is reported")
+    args = parser.parse_args()
+
+    pages = load_corpus(args.corpus)
+    if not pages:
+        parser.error(f"No pages found in {args.corpus}")
+    megabytes = sum(len(text) for text in pages) / 1e6
+    print(f"Corpus: {len(pages)} pages, {megabytes:.1f} MB of text")
+    print(f"Matcher backend: {'pyahocorasick' if ahocorasick is not None else 'per-keyword scan (pyahocorasick not installed)'}")
+
+    # The keyword weight tables of ParallelProbability*.py (see country_profiles.py)
+    for country in args.country or sorted(KEYWORDS):
+        weights = KEYWORDS[country]
+        matcher = KeywordMatcher(weights)
+
+        # Both methods must agree on every page before their speed matters
+        for text in pages:
+            expected = scan_each_keyword(weights, text)
+            if matcher.find(text) != expected:
+                raise AssertionError(f"{country}: the matcher disagrees with the per-keyword scan")
+
+        baseline = time_pass(lambda text: scan_each_keyword(weights, text), pages, args.repeat)
+        compiled = time_pass(matcher.find, pages, args.repeat)
+        print(f"{country}: {len(weights)} keywords | per-keyword scan {baseline * 1000:.1f} ms "
+              f"({megabytes / baseline:.0f} MB/s) | matcher {compiled * 1000:.1f} ms "
+              f"({megabytes / compiled:.0f} MB/s) | speedup {baseline / compiled:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+import argparse
+import time
+
+from bench_keywords import load_corpus
+from html_extract import BACKENDS, available_backends
+
+
+# The decisions the scorers take from the extracted features
+def decisions(features):
+    footer = (features.footer_text or '').lower()
+    return (
+        any('checkout' in action for action in features.form_actions),
+        any('buy' in text.lower() or 'add to cart' in text.lower() for text in features.button_texts),
+        bool(footer) and ('powered by' in footer or 'shop' in footer or 'e-commerce' in footer),
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the parse throughput of the HTML extraction backends.")
+    parser.add_argument('corpus', help="Directory of saved HTML pages and/or WARC files")
+    parser.add_argument('--repeat', type=int, default=3, help="Passes per backend; the best one is reported")
+    args = parser.parse_args()
+
+    pages = load_corpus(args.corpus)
+    if not pages:
+        parser.error(f"No pages found in {args.corpus}")
+    megabytes = sum(len(text) for text in pages) / 1e6
+    print(f"Corpus: {len(pages)} pages, {megabytes:.1f} MB of text")
+
+    # bs4 with html.parser is what the scripts used; the others are compared against it
+    reference = [BACKENDS['bs4'](text) for text in pages]
+    for backend in available_backends():
+        extract = BACKENDS[backend]
+        best = float('inf')
+        for _ in range(args.repeat):
+            start_time = time.perf_counter()
+            extracted = [extract(text) for text in pages]
+            best = min(best, time.perf_counter() - start_time)
+
+        same_decisions = sum(decisions(a) == decisions(b) for a, b in zip(reference, extracted))
+        same_text = sum(' '.join(a.visible_text.split()) == ' '.join(b.visible_text.split())
+                        for a, b in zip(reference, extracted))
+        print(f"{backend:>10}: {best:.2f} s, {len(pages) / best:.0f} pages/s ({megabytes / best:.1f} MB/s) | "
+              f"same decisions as bs4 on {same_decisions}/{len(pages)} pages, "
+              f"same visible text on {same_text}/{len(pages)}")
+
+
+if __name__ == "__main__":
+    main()
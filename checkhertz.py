@@ -1,5 +1,4 @@
-import requests
-from bs4 import BeautifulSoup
+from page_features import fetch_features
 import logging
 
 # Set up logging configuration
@@ -10,56 +9,50 @@ logging.basicConfig(
 )
 
 def is_ecommerce_site(url):
-    try:
-        # Fetch the website content
-        response = requests.get(url)
-        response.raise_for_status()  # Raise an error for bad responses
-
-        # Parse the HTML content
-        soup = BeautifulSoup(response.text, 'html.parser')
-
-        # Check for e-commerce keywords in the text (including German keywords)
-        keywords = [
-            'cart', 'checkout', 'buy', 'order', 'payment',
-            'Einloggen', 'Reservierung', 'Buchung','buchung', 'Buchen',
-            'Warenkorb', 'Kaufen', 'Bestellen', 'Zahlung','reservation','rentacar','robots'
-        ]
-
-        page_text = soup.get_text().lower()
-        print(page_text)
-        if any(keyword.lower() in page_text for keyword in keywords):
-            logging.info(f"{url} likely has e-commerce functionality due to keywords.")
-            return True
-
-        # Check for forms that may indicate e-commerce functionality
-        forms = soup.find_all('form')
-        if any('checkout' in form.get('action', '').lower() for form in forms):
-            logging.info(f"{url} has a checkout form.")
-            return True
-
-        # Check for buttons indicating purchasing options
-        buttons = soup.find_all('button')
-        if any('buy' in button.text.lower() or
-               'add to cart' in button.text.lower() or
-               'kaufen' in button.text.lower() or
-               'in den warenkorb' in button.text.lower() for button in buttons):
-            logging.info(f"{url} has buttons indicating purchasing options.")
-            return True
-
-        # Check footer for e-commerce platform indicators
-        footer = soup.find('footer')
-        if footer and ('powered by' in footer.text.lower() or
-                       'shop' in footer.text.lower() or
-                       'e-commerce' in footer.text.lower()):
-            logging.info(f"{url} footer indicates it may be powered by an e-commerce platform.")
-            return True
-
-        logging.info(f"{url} does not appear to be an e-commerce site.")
+    # Fetch the website through the shared page cache and parse it once into its features
+    page = fetch_features([url], desc=None)[0]
+    if not page.ok:
+        logging.error(f"Error fetching {url}: {page.error or f'HTTP status {page.status}'}")
         return False
 
-    except requests.exceptions.RequestException as e:
-        logging.error(f"Error fetching {url}: {e}")
-        return False
+    # Check for e-commerce keywords in the text (including German keywords)
+    keywords = [
+        'cart', 'checkout', 'buy', 'order', 'payment',
+        'Einloggen', 'Reservierung', 'Buchung','buchung', 'Buchen',
+        'Warenkorb', 'Kaufen', 'Bestellen', 'Zahlung','reservation','rentacar','robots'
+    ]
+
+    page_text = page.visible_text.lower()
+    print(page_text)
+    if any(keyword.lower() in page_text for keyword in keywords):
+        logging.info(f"{url} likely has e-commerce functionality due to keywords.")
+        return True
+
+    # Check for forms that may indicate e-commerce functionality
+    forms = page.form_actions
+    if any('checkout' in action.lower() for action in forms):
+        logging.info(f"{url} has a checkout form.")
+        return True
+
+    # Check for buttons indicating purchasing options
+    buttons = page.button_texts
+    if any('buy' in text.lower() or
+           'add to cart' in text.lower() or
+           'kaufen' in text.lower() or
+           'in den warenkorb' in text.lower() for text in buttons):
+        logging.info(f"{url} has buttons indicating purchasing options.")
+        return True
+
+    # Check footer for e-commerce platform indicators
+    footer = page.footer_text
+    if footer and ('powered by' in footer.lower() or
+                   'shop' in footer.lower() or
+                   'e-commerce' in footer.lower()):
+        logging.info(f"{url} footer indicates it may be powered by an e-commerce platform.")
+        return True
+
+    logging.info(f"{url} does not appear to be an e-commerce site.")
+    return False
 
 if __name__ == "__main__":
     url_to_check = "https://www.bohotel.com/"
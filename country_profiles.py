@@ -0,0 +1,279 @@
+# Keyword tables of every pipeline stage, per country. page_features.py finds
+# the keywords of all tables in one pass over a page, so each stage reads its
+# hits from the same PageFeatures record instead of scanning the page again.
+
+# Weighted e-commerce keywords of ParallelProbabilityDE.py
+KEYWORDS_DE = {
+    'Kundenerkennung': 1,
+    'Individuelle Preisgestaltung': 1,
+    'Sitzungsmanagement': 1,
+    'cart': 10,
+    'online': 3,
+    'shop': 3,
+    'Online-Shop': 10,
+    'leistungen': 10,
+    'Leinstungen': 10,
+    'service': 1,
+    'Service': 1,
+    'Reservierung': 10,
+    'versicherung': 10,
+    'Mitgliedschaft': 10,
+    'datenshutz': 1,
+    'BUCHEN': 10,
+    'Book': 10,
+    'BOOK': 10,
+    'Booking': 10,
+    'booking':10,
+    'rentcar': 4,
+    'rentacar': 4,
+    'rent': 4,
+    'Rental': 6,
+    'reservation': 5,  # New keyword added
+    'checkout': 10,     # New keyword added
+    'payment': 5,      # New keyword added
+    'pay':5,
+    'Transporter Mieten': 5,
+    'Buchung':10,
+    'buchung':10,
+    'buchen':10,
+    'DIRECTBUCHUNG':10,
+    'Kostenlose Rücksendung':10,
+    'been blocked by bot':10,
+    'robots':5,
+    'Vorteilswelt':5,
+    'Zimmer':5,
+    'ZIMMER':5,
+    'Einkaufswagen':10  # Shopping card
+}
+
+# Weighted e-commerce keywords of ParallelProbabilityAT.py
+KEYWORDS_AT = {
+    'Kundenerkennung': 1,
+    'Individuelle Preisgestaltung': 1,
+    'Sitzungsmanagement': 1,
+    'cart': 10,
+    'online': 3,
+    'shop': 3,
+    'Online-Shop': 10,
+    'leistungen': 10,
+    'Leinstungen': 10,
+    'service': 1,
+    'Service': 1,
+    'familien':1,
+    'Reservierung': 10,
+    'versicherung': 10,
+    'Mitgliedschaft': 10,
+    'datenshutz': 1,
+    'BUCHEN': 10,
+    'Buchen':10,
+    'Book': 10,
+    'BOOK': 10,
+    'Booking': 10,
+    'booking':10,
+    'rentcar': 4,
+    'rentacar': 4,
+    'rent': 4,
+    'Rental': 6,
+    'reservation': 5,  # New keyword added
+    'checkout': 10,     # New keyword added
+    'payment': 5,      # New keyword added
+    'pay':5,
+    'Transporter Mieten': 5,
+    'Buchung':10,
+    'buchung':10,
+    'buchen':10,
+    'BUCHEN':10,
+    'DIRECTBUCHUNG':10,
+    'Kostenlose Rücksendung':10,
+    'been blocked by bot':10,
+    'robots':5,
+    'Vorteilswelt':5,
+    'Zimmer':5,
+    'ZIMMER':5,
+    'Einkaufswagen':10,  # Shopping card
+    'wellness':5,
+    'suiten':5,
+    'SUITEN':5,
+    'ANFRAGE':5,
+    'Anfrage':5,
+    'delivery':10
+}
+
+# Weighted e-commerce keywords of ParallelProbabilityNL.py
+KEYWORDS_NL = {
+    'Klantenherkenning': 1,
+    'Individuele prijsstelling': 1,
+    'Sessiebeheer': 1,
+    'cart': 10,
+    'online': 3,
+    'shop': 3,
+    'Online-winkel': 10,
+    'diensten': 10,
+    'diensten': 10,
+    'service': 1,
+    'Service': 1,
+    'gezinnen': 1,
+    'Reservering': 10,
+    'verzekering': 10,
+    'lidmaatschap': 10,
+    'gegevensbescherming': 1,
+    'Book': 10,
+    'BOOK': 10,
+    'Booking': 10,
+    'booking': 10,
+    'Boek':10,
+    'Boeken':10,
+    'Kamer':5,
+    'rentcar': 4,
+    'rentacar': 4,
+    'rent': 4,
+    'Rental': 6,
+    'reservation': 5,
+    'Reservation':5,
+    'checkout': 10,
+    'payment': 5,
+    'pay': 5,
+    'Vrachtwagen huren': 5,
+    'Gratis retourzending': 10,
+    'been blocked by bot': 10,
+    'robots': 5,
+    'Voordelenwereld': 5,
+    'Kamers': 5,
+    'KAMERS': 5,
+    'Winkelwagentje': 10,
+    'wellness': 5,
+    'suites': 15,
+    'SUITES': 15,
+    'Rooms':15,
+    'AANVRAAG': 5,
+    'Aanvraag': 5,
+    'delivery': 10
+}
+
+# Weighted e-commerce keywords of ParallelProbabilityPL.py
+KEYWORDS_PL = {
+    'Klantenherkenning': 1,
+    'Individuele prijsstelling': 1,
+    'Sessiebeheer': 1,
+    'cart': 10,
+    'online': 3,
+    'shop': 3,
+    'Online-winkel': 10,
+    'diensten': 10,
+    'diensten': 10,
+    'service': 1,
+    'Service': 1,
+    'gezinnen': 1,
+    'Reservering': 10,
+    'verzekering': 10,
+    'lidmaatschap': 10,
+    'gegevensbescherming': 1,
+    'Book': 10,
+    'BOOK': 10,
+    'Booking': 10,
+    'booking': 10,
+    'Boek':10,
+    'Boeken':10,
+    'Kamer':5,
+    'rentcar': 4,
+    'rentacar': 4,
+    'rent': 4,
+    'Rental': 6,
+    'reservation': 5,
+    'Reservation':5,
+    'checkout': 10,
+    'payment': 5,
+    'pay': 5,
+    'Vrachtwagen huren': 5,
+    'Gratis retourzending': 10,
+    'been blocked by bot': 10,
+    'robots': 5,
+    'Voordelenwereld': 5,
+    'Kamers': 5,
+    'KAMERS': 5,
+    'Winkelwagentje': 10,
+    'wellness': 5,
+    'suites': 15,
+    'SUITES': 15,
+    'Rooms':15,
+    'AANVRAAG': 5,
+    'Aanvraag': 5,
+    'delivery': 10
+}
+
+KEYWORDS = {
+    'DE': KEYWORDS_DE,
+    'AT': KEYWORDS_AT,
+    'NL': KEYWORDS_NL,
+    'PL': KEYWORDS_PL,
+}
+
+# Score calculate_probability adds when the URL contains the string
+URL_BONUSES = {
+    'DE': {'hotel': 15, 'cityhotel': 15},
+    'AT': {'pension': 15, 'hotel': 15, 'cityhotel': 15},
+    'NL': {'pension': 15, 'hotel': 15, 'cityhotel': 15},
+    'PL': {'pension': 15, 'hotel': 15, 'cityhotel': 15},
+}
+
+# Score calculate_probability adds for a checkout form and for a buy / add to
+# cart button (the page signals of hit_matrix.py), the same in every country
+PAGE_BONUSES = {
+    'form:checkout': 5,
+    'button:buy': 5,
+}
+
+# Strings that mark a site as not e-commerce from its URL alone, as checked by the
+# barber filters: 'url' rules look at the whole URL, 'domain' rules only at the host
+URL_RULES = {
+    'DE': ('url', ["barb"]),
+    'AT': ('url', ["barb", "dent", "orthodont", "law", "Notarfachangestellte"]),
+    'NL': ('domain', ["barb", "dent", "orthodont", "law"]),
+    'PL': ('domain', ["barb", "dent", "orthodont", "law"]),
+}
+
+# Keywords of non-e-commerce sites (barbers, lawyers, dentists...) for GETRIDOFBARBERS_DEDATASET.py
+BARBER_KEYWORDS_DE = ["Barbershop", "Notarfachangestellte", "Friseursalon", "Rechtsanwälte", "Zahnarzt", "schnitt"]
+
+# Keywords of non-e-commerce sites (barbers, lawyers, dentists...) for GETRIDOFBARBERS_ATDATASET.py
+BARBER_KEYWORDS_AT = ["Barbershop"]
+
+BARBER_KEYWORDS = {
+    'DE': BARBER_KEYWORDS_DE,
+    'AT': BARBER_KEYWORDS_AT,
+}
+
+# Keywords of draftecommerceDE_NOBARBERS.py; it also looks for "rent" on every page
+RENTAL_KEYWORDS_DE = [
+    'cart', 'online', 'shop', 'Online-Shop', 'leistungen',
+    'Leinstungen', 'service', 'Service', 'Reservierung',
+    'bookings', 'versicherung', 'Mitgliedschaft','rent'
+    'datenshutz'
+]
+RENTAL_MARKER = 'rent'
+
+# Translations for eCommerce terms in different languages, checked case-insensitively
+# on the markdown crawl4ai returns (SerialTestAI4.py, ParallelTestChar4AI.py)
+TRANSLATIONS = {
+    "cart": {"German": "Warenkorb", "Dutch": "winkelwagen", "Polish": "koszyk"},
+    "checkout": {"German": "Kasse", "Dutch": "afrekenen", "Polish": "kasa"},
+    "book": {"German": "Buch", "Dutch": "boek", "Polish": "książka"},
+    "product": {"German": "Produkt", "Dutch": "product", "Polish": "produkt"},
+    "shop": {"German": "Geschäft", "Dutch": "winkel", "Polish": "sklep"},
+    "online shop": {"German": "Onlineshop", "Dutch": "webwinkel", "Polish": "sklep internetowy"},
+    "booking": {"German": "Buchung", "Dutch": "boeking", "Polish": "rezerwacja"},
+    "room": {"German": "Zimmer", "Dutch": "kamer", "Polish": "pokój"},
+    "ticket": {"German": "Ticket", "Dutch": "ticket", "Polish": "bilet"},
+    "insurance": {"German": "Versicherung", "Dutch": "verzekering", "Polish": "ubezpieczenie"}
+}
+
+# Every table whose keywords are looked up (case-sensitively) in the page text
+KEYWORD_TABLES = {
+    'DE': KEYWORDS_DE,
+    'AT': KEYWORDS_AT,
+    'NL': KEYWORDS_NL,
+    'PL': KEYWORDS_PL,
+    'barber_DE': BARBER_KEYWORDS_DE,
+    'barber_AT': BARBER_KEYWORDS_AT,
+    'rental_DE': RENTAL_KEYWORDS_DE + [RENTAL_MARKER],
+}
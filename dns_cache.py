@@ -0,0 +1,185 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import socket
+import time
+from urllib.parse import urlsplit
+
+import pandas as pd
+from aiohttp.abc import AbstractResolver
+
+import pipeline_config as config
+
+try:
+    import aiodns
+except ImportError:
+    aiodns = None
+
+# Country inputs whose hostnames the pre-pass resolves
+INPUT_FILES = ['DEinput.csv', 'ATinput.csv', 'NLinput.csv', 'PLinput.csv']
+
+# getaddrinfo errors that mean the name does not exist (as opposed to a temporary failure)
+NXDOMAIN_ERRORS = {socket.EAI_NONAME, getattr(socket, 'EAI_NODATA', socket.EAI_NONAME)}
+
+
+# Raised by a resolve function when the name does not exist
+class NameNotFound(Exception):
+    pass
+
+
+# Extract the hostname of a URL
+def hostname(url):
+    return (urlsplit(url.strip()).hostname or '').lower()
+
+
+# Resolve a host through the system resolver; returns a list of (family, address)
+async def system_resolve(host):
+    loop = asyncio.get_running_loop()
+    try:
+        infos = await loop.getaddrinfo(host, 80, type=socket.SOCK_STREAM)
+    except socket.gaierror as e:
+        if e.errno in NXDOMAIN_ERRORS:
+            raise NameNotFound(host) from e
+        raise
+    addresses = []
+    for family, _, _, _, sockaddr in infos:
+        if (family, sockaddr[0]) not in addresses:
+            addresses.append((family, sockaddr[0]))
+    return addresses
+
+
+# Build a resolve function that asks the given DNS servers directly (needs aiodns).
+# Pointing it at a local stub server makes the pre-pass testable offline.
+def nameserver_resolve(nameservers):
+    if aiodns is None:
+        raise RuntimeError("Querying specific nameservers needs the optional aiodns package (pip install aiodns)")
+    resolver = aiodns.DNSResolver(nameservers=nameservers)
+
+    async def resolve(host):
+        try:
+            result = await resolver.gethostbyname(host, socket.AF_INET)
+        except aiodns.error.DNSError as e:
+            if e.args and e.args[0] in (aiodns.error.ARES_ENOTFOUND, aiodns.error.ARES_ENODATA):
+                raise NameNotFound(host) from e
+            raise
+        return [(socket.AF_INET, address) for address in result.addresses]
+
+    return resolve
+
+
+# Resolved hostnames shared by the fetch layer of every stage. Entries are
+# ('ok', addresses) or ('nxdomain', []) and are kept for ttl seconds; temporary
+# failures are not remembered. The table is loaded from and saved to a JSON
+# file so the pre-pass and the MPI ranks share it.
+class DnsCache:
+    def __init__(self, path=None, ttl=None, resolve=None):
+        self.path = path or config.DNS_CACHE_PATH
+        self.ttl = ttl or config.DNS_TTL
+        self.resolve = resolve or system_resolve
+        self.entries = {}
+        if self.path and os.path.exists(self.path):
+            with open(self.path) as file:
+                self.entries = json.load(file)
+
+    # Cached entry for host, or None when unknown or expired
+    def lookup(self, host):
+        entry = self.entries.get(host)
+        if entry is None or time.time() - entry['resolved_at'] > self.ttl:
+            return None
+        return entry
+
+    def is_nxdomain(self, host):
+        entry = self.lookup(host)
+        return entry is not None and entry['status'] == 'nxdomain'
+
+    # Resolve one host and remember the answer
+    async def resolve_host(self, host):
+        try:
+            addresses = await self.resolve(host)
+            self.entries[host] = {'status': 'ok', 'addresses': addresses, 'resolved_at': time.time()}
+        except NameNotFound:
+            self.entries[host] = {'status': 'nxdomain', 'addresses': [], 'resolved_at': time.time()}
+        except (OSError, asyncio.TimeoutError) as e:
+            logging.warning(f"Temporary DNS failure for {host}: {e}")
+            return None
+        return self.entries[host]
+
+    # Resolve every host not cached yet, with at most concurrency lookups at once
+    async def prefetch(self, hosts, concurrency=None):
+        missing = iter(sorted({host for host in hosts if host and self.lookup(host) is None}))
+
+        async def worker():
+            for host in missing:
+                await self.resolve_host(host)
+
+        await asyncio.gather(*(worker() for _ in range(concurrency or config.DNS_CONCURRENCY)))
+
+    def save(self):
+        with open(self.path, 'w') as file:
+            json.dump(self.entries, file)
+
+
+# aiohttp resolver answering from a DnsCache, so connections skip getaddrinfo;
+# names that do not resolve raise socket.gaierror, as getaddrinfo does
+class CachedResolver(AbstractResolver):
+    def __init__(self, cache):
+        self.cache = cache
+
+    async def resolve(self, host, port=0, family=socket.AF_INET):
+        entry = self.cache.lookup(host) or await self.cache.resolve_host(host)
+        if entry is None or entry['status'] != 'ok' or not entry['addresses']:
+            raise socket.gaierror(socket.EAI_NONAME, f"Could not resolve {host}")
+        results = [
+            {'hostname': host, 'host': address, 'port': port,
+             'family': address_family, 'proto': 0, 'flags': socket.AI_NUMERICHOST}
+            for address_family, address in entry['addresses']
+            if family in (socket.AF_UNSPEC, address_family)
+        ]
+        if not results:
+            raise socket.gaierror(socket.EAI_NONAME, f"No address of the requested family for {host}")
+        return results
+
+    async def close(self):
+        pass
+
+
+_shared_dns = None
+
+
+# DnsCache shared by everything running in this process
+def shared_dns():
+    global _shared_dns
+    if _shared_dns is None:
+        _shared_dns = DnsCache()
+    return _shared_dns
+
+
+# Pre-pass: resolve every hostname of the four country inputs and save the table
+def main():
+    parser = argparse.ArgumentParser(description="Resolve the hostnames of the country inputs before crawling.")
+    parser.add_argument('--nameserver', action='append',
+                        help="DNS server to query instead of the system resolver (repeatable; needs the optional aiodns package)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    hosts = set()
+    for input_file in INPUT_FILES:
+        if os.path.exists(input_file):
+            hosts.update(hostname(url) for url in pd.read_csv(input_file)['url'].dropna())
+
+    cache = shared_dns()
+    if args.nameserver:
+        cache.resolve = nameserver_resolve(args.nameserver)
+    start_time = time.time()
+    asyncio.run(cache.prefetch(hosts))
+    cache.save()
+
+    nxdomain = sum(1 for host in hosts if cache.is_nxdomain(host))
+    logging.info(f"Resolved {len(hosts)} hostnames in {time.time() - start_time:.1f} seconds, "
+                 f"{nxdomain} do not exist. Saved to '{cache.path}'.")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,7 @@
 from mpi4py import MPI
 import pandas as pd
-import requests
-from tqdm import tqdm  # Import tqdm for progress bar
+from country_profiles import RENTAL_KEYWORDS_DE, RENTAL_MARKER
+from page_features import fetch_features
 import logging
 
 # Set up logging configuration
@@ -11,25 +11,24 @@ logging.basicConfig(
     format='%(asctime)s - %(levelname)s - %(message)s'
 )
 
-def check_url(url, keywords):
-    try:
-        # Send a GET request to the URL
-        response = requests.get(url)
-
-        # Check if the response contains the Set-Cookie header
-        uses_cookies = 'Set-Cookie' in response.headers
+# Checks on the features of one page (see page_features.py); keywords must come
+# from a table of country_profiles.KEYWORD_TABLES
+def check_url(page, keywords):
+    url = page.url
+    if page.error:
+        logging.error(f'Skipped {url} due to an error: {page.error}')
+        return None, None, None
 
-        # Check if the response contains "rent"
-        contains_rent = "rent" in response.text
+    # Check if the response contains the Set-Cookie header
+    uses_cookies = bool(page.cookie_headers)
 
-        # Check for keywords in the response text
-        contains_keywords = [keyword for keyword in keywords if keyword in response.text]
+    # Check if the response contains "rent"
+    contains_rent = RENTAL_MARKER in page.hits
 
-        return uses_cookies, contains_rent, contains_keywords
+    # Check for keywords in the response text
+    contains_keywords = [keyword for keyword in keywords if keyword in page.hits]
 
-    except requests.exceptions.RequestException as e:
-        logging.error(f'Skipped {url} due to an error: {e}')
-        return None, None, None
+    return uses_cookies, contains_rent, contains_keywords
 
 def main():
     # Initialize MPI
@@ -58,13 +57,8 @@ def main():
     # Scatter the URL chunks to all processes
     urls_chunk = comm.scatter(chunks, root=0)
 
-    # Keywords to look for
-    keywords_german = [
-        'cart', 'online', 'shop', 'Online-Shop', 'leistungen',
-        'Leinstungen', 'service', 'Service', 'Reservierung',
-        'bookings', 'versicherung', 'Mitgliedschaft','rent'
-        'datenshutz'
-    ]
+    # Keywords to look for (see country_profiles.py)
+    keywords_german = RENTAL_KEYWORDS_DE
 
     keywords = keywords_german
     rent_counter = 0
@@ -72,8 +66,11 @@ def main():
     # Each process checks if its URLs are e-commerce sites with a progress bar
     results_chunk = []
 
-    for url in tqdm(urls_chunk, desc=f"Processing on rank {rank}"):
-        uses_cookies, contains_rent, contains_keywords = check_url(url, keywords)
+    # Fetch the pages through the shared page cache, each parsed once into its features
+    pages = fetch_features(urls_chunk, desc=f"Processing on rank {rank}")
+
+    for url, page in zip(urls_chunk, pages):
+        uses_cookies, contains_rent, contains_keywords = check_url(page, keywords)
 
         if uses_cookies is not None:
             if uses_cookies:
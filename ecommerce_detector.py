@@ -0,0 +1,74 @@
+import re
+
+from keyword_matcher import KeywordMatcher
+
+# Social media profile links and the handle part of each
+SOCIAL_PATTERNS = {
+    'Twitter': r'twitter\.com/[A-Za-z0-9_]+',
+    'YouTube': r'youtube\.com/(?:channel|user)/[A-Za-z0-9_-]+',
+    'TikTok': r'tiktok\.com/@[A-Za-z0-9_.]+',
+    'LinkedIn': r'linkedin\.com/in/[A-Za-z0-9_-]+',
+}
+
+# Separator between several handles of one platform in the *_value columns
+HANDLE_SEPARATOR = '; '
+
+
+# Compiled form of the checks analyze_output makes on crawled markdown. The
+# page is casefolded once. All e-commerce terms (each English word and its
+# translations) are casefolded into one keyword matcher, and all social media
+# patterns are joined into one case-sensitive regex, so one scan of the
+# casefolded page finds the terms and one finds every link of every platform.
+# Handles are cut from the original text so they keep their case; on the rare
+# pages where casefolding changes the length (e.g. 'ß') the links are searched
+# case-insensitively in the original text instead.
+class EcommerceDetector:
+    def __init__(self, translations, social_patterns=None):
+        self.terms = KeywordMatcher({term: 1 for term in translation_terms(translations)})
+        social_patterns = social_patterns or SOCIAL_PATTERNS
+        self.platforms = {platform: re.compile(pattern, re.IGNORECASE) for platform, pattern in social_patterns.items()}
+        # Plain alternation: named groups would turn off re's first-character prefilter
+        joined = '|'.join(f'(?:{pattern})' for pattern in social_patterns.values())
+        self.social = re.compile(joined)
+        self.social_ignorecase = re.compile(joined, re.IGNORECASE)
+
+    # Casefolded e-commerce terms occurring in text, and the distinct links
+    # found per platform
+    def scan(self, text):
+        folded = text.casefold()
+        term_hits = self.terms.found(folded)
+
+        if len(folded) == len(text):
+            links = (text[match.start():match.end()] for match in self.social.finditer(folded))
+        else:
+            links = (match.group(0) for match in self.social_ignorecase.finditer(text))
+
+        handles = {platform: [] for platform in self.platforms}
+        for link in links:
+            platform = next(platform for platform, pattern in self.platforms.items() if pattern.fullmatch(link))
+            if link not in handles[platform]:
+                handles[platform].append(link)
+        return term_hits, handles
+
+    # Same answer as analyze_output: (is_ecommerce, {platform: "Yes"/"No"},
+    # {"<platform>_value": handles}), where every distinct handle is listed
+    def analyze(self, text):
+        term_hits, links = self.scan(text)
+        social_media_presence, social_media_handles = social_columns(links)
+        return bool(term_hits), social_media_presence, social_media_handles
+
+
+# Casefolded terms of a translations table: each English word and its translations
+def translation_terms(translations):
+    terms = set()
+    for word, by_language in translations.items():
+        terms.add(word.casefold())
+        terms.update(term.casefold() for term in by_language.values())
+    return terms
+
+
+# Yes/No presence and *_value columns of the links found per platform
+def social_columns(links):
+    social_media_presence = {platform: ("Yes" if found else "No") for platform, found in links.items()}
+    social_media_handles = {f"{platform}_value": HANDLE_SEPARATOR.join(found) for platform, found in links.items()}
+    return social_media_presence, social_media_handles
@@ -0,0 +1,167 @@
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from multiprocessing.util import Finalize
+
+from tqdm import tqdm
+
+import fetch_engine
+import pipeline_config as config
+from host_health import close_shared_health
+from page_cache import close_shared_cache
+from warc_archive import close_shared_archive
+from work_queue import host_batches, log_summary, run_batches, spread_size, working_comm
+
+try:
+    from mpi4py import MPI
+except ImportError:
+    MPI = None
+
+# process_batch of the run a local worker process was started for
+_worker_batch = None
+
+
+# The stage scripts run their batches through an executor: rank is 0 in the
+# process that reads the input and writes the outputs, bcast(value) hands a value
+# of that process to every worker, and run_batches(items, process_batch, ...) takes
+# the arguments of work_queue.run_batches after comm. Under mpirun the work goes
+# to the MPI ranks, as before.
+class MpiExecutor:
+    def __init__(self, comm):
+        self.comm = comm
+        self.rank = comm.Get_rank()
+        self.size = comm.Get_size()
+
+    def bcast(self, value):
+        return self.comm.bcast(value, root=0)
+
+    def run_batches(self, items, process_batch, **options):
+        return run_batches(self.comm, items, process_batch, **options)
+
+
+# Without MPI the batches run on a pool of size processes on this machine,
+# handed out like the dynamic MPI dispatcher does: the items are packed into
+# batches in which all items of a host stay together, a batch whose hosts are
+# being fetched by another process waits, and each result is handed to
+# on_result and its batch to on_done as soon as it is done. Batches are
+# batches_at_once times WEBINTEL_DISPATCH_BATCH_SIZE items, since a process
+# works on one batch at a time, or fewer where that would leave a worker
+# without one. The workers are forked, so process_batch may be a closure over
+# what the process read before (see _start_worker); with one worker, or where
+# fork does not exist, the batches run in this process.
+class LocalExecutor:
+    rank = 0
+
+    def __init__(self, size):
+        self.size = size
+
+    def bcast(self, value):
+        return value
+
+    def run_batches(self, items, process_batch, url_of=None, on_result=None, on_done=None, batches_at_once=None,
+                    desc="Processing URLs"):
+        start_time = time.monotonic()
+        fetch_engine.reset_stats()
+        results = None
+        if on_result is None:
+            results = []
+            on_result = results.append
+
+        batches_at_once = batches_at_once or -(-config.MAX_IN_FLIGHT // config.DISPATCH_BATCH_SIZE)
+        size = spread_size(len(items), self.size, config.DISPATCH_BATCH_SIZE * batches_at_once)
+        packed = host_batches(items, size, url_of=url_of)
+        pending = list(range(len(packed)))
+        busy_hosts = set()
+        running = {}  # future -> batch index
+        stats = {}  # worker pid -> [busy, done after]
+        fetch_stats = {}  # worker pid -> its fetch counters after its last batch
+
+        with _worker_pool(self.size, process_batch) as pool, \
+                tqdm(total=len(items), desc=desc, disable=desc is None) as progress:
+            while pending or running:
+                # Keep every worker busy with a batch whose hosts no other worker is fetching
+                while pending and len(running) < self.size:
+                    index = next((index for index in pending if not packed[index][0] & busy_hosts), None)
+                    if index is None:
+                        break
+                    pending.remove(index)
+                    busy_hosts.update(packed[index][0])
+                    running[pool.submit(_run_batch, packed[index][1])] = index
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    index = running.pop(future)
+                    pid, busy, counters, result = future.result()
+                    on_result(result)
+                    if on_done is not None:
+                        on_done(packed[index][1])
+                    busy_hosts.difference_update(packed[index][0])
+                    progress.update(len(packed[index][1]))
+                    worker = stats.setdefault(pid, [0.0, 0.0])
+                    worker[0] += busy
+                    worker[1] = time.monotonic() - start_time
+                    fetch_stats[pid] = counters
+
+        if stats:
+            log_summary('local', list(stats.values()), unit='worker')
+            fetch_engine.log_stats(fetch_engine.merge_stats(fetch_stats.values()))
+        return results
+
+
+# Pool of size forked workers running process_batch, or one thread of this process
+def _worker_pool(size, process_batch):
+    if size > 1 and 'fork' in multiprocessing.get_all_start_methods():
+        return ProcessPoolExecutor(size, mp_context=multiprocessing.get_context('fork'),
+                                   initializer=_start_worker, initargs=(process_batch,))
+    return ThreadPoolExecutor(1, thread_name_prefix='batch', initializer=_start_worker, initargs=(process_batch,))
+
+
+# Set up a worker. A forked worker inherits process_batch instead of unpickling
+# it, and starts its own event loop, page cache and host health connections on
+# first use (see the register_at_fork hooks of fetch_engine.py, page_cache.py,
+# host_health.py and warc_archive.py). Pool processes leave without running
+# atexit handlers, so _close_worker is run from multiprocessing's exit hook
+# instead, before multiprocessing closes the queues (priority 10) a process
+# parse pool still needs to shut down.
+def _start_worker(process_batch):
+    global _worker_batch
+    _worker_batch = process_batch
+    if multiprocessing.parent_process() is not None:
+        Finalize(None, _close_worker, exitpriority=100)
+
+
+# Close what a worker process opened: its event loop, connections and parse
+# pool, its WARC file, and its page cache and host health connections
+def _close_worker():
+    fetch_engine.shutdown()
+    close_shared_archive()
+    close_shared_cache()
+    close_shared_health()
+
+
+# Run one batch on a worker: (worker pid, seconds spent, the worker's fetch
+# counters so far, result); the counters die with the worker, so they travel
+# back to the parent, which logs them for all workers at the end
+def _run_batch(batch):
+    start = time.monotonic()
+    result = _worker_batch(batch)
+    return os.getpid(), time.monotonic() - start, dict(fetch_engine.STATS), result
+
+
+# The executor of this process, picked by WEBINTEL_EXECUTOR: auto runs on MPI
+# when the script was started with mpirun on more than one rank and on all local
+# cores otherwise, so the scripts need no MPI install. MPI ranks that
+# WEBINTEL_RANKS_PER_NODE leaves out get None and should return.
+def make_executor():
+    use_mpi = config.EXECUTOR == 'mpi' or (
+        config.EXECUTOR == 'auto' and MPI is not None and MPI.COMM_WORLD.Get_size() > 1)
+    if not use_mpi:
+        size = config.LOCAL_WORKERS or os.cpu_count() or 1
+        logging.info(f"Running on {size} local processes (WEBINTEL_EXECUTOR={config.EXECUTOR})")
+        return LocalExecutor(size)
+    if MPI is None:
+        raise RuntimeError("WEBINTEL_EXECUTOR=mpi needs mpi4py")
+    comm = working_comm(MPI.COMM_WORLD)
+    return MpiExecutor(comm) if comm is not None else None
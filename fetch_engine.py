@@ -0,0 +1,475 @@
+import asyncio
+import atexit
+import csv
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+import charset_normalizer
+import requests
+from requests.structures import CaseInsensitiveDict
+from tqdm import tqdm  # Import tqdm for progress bar
+
+import pipeline_config as config
+from dns_cache import hostname, shared_dns
+from host_health import shared_health
+from http_client import FetchError, FetchTimeout, HttpClient
+from page_cache import normalize_url, shared_cache
+from politeness import HostScheduler
+from warc_archive import shared_archive
+
+# Outcome code for URLs that ran out of time; -99 stays the code for fetch errors
+TIMEOUT_CODE = -98
+
+# Run-level counters of the work the cache and the connection pool saved in this process
+STATS = Counter()
+
+# Statuses that say the server could not answer right now (timeout, too early, rate
+# limited), which like server errors (5xx) are never cached
+TRANSIENT_STATUSES = {408, 425, 429}
+
+# Counters of STATS that hold the largest value seen rather than a total
+PEAK_STATS = ('peak_queue_depth', 'max_wait')
+
+# Event loop running in a background thread; it owns the pooled HTTP client,
+# so every fetch made by this process shares the same keep-alive connections
+_loop = None
+_client = None
+_loop_lock = threading.Lock()
+
+# Fetches of this process in flight at once, over every fetch_pages call (WEBINTEL_MAX_IN_FLIGHT)
+_in_flight = None
+
+# Pool the pages are parsed on (WEBINTEL_PARSE_POOL), so the event loop keeps fetching meanwhile
+_parse_pool = None
+
+# Monotonic time after which this rank starts no new fetch (WEBINTEL_RANK_TIME_BUDGET)
+_budget_deadline = None
+
+
+# Outcome of fetching one URL
+@dataclass
+class FetchResult:
+    url: str
+    status: int = None
+    headers: CaseInsensitiveDict = field(default_factory=CaseInsensitiveDict)
+    text: str = ''
+    error: str = None
+    from_cache: bool = False
+    connections_opened: int = 0
+    connections_reused: int = 0
+    timed_out: bool = False
+    bytes_read: int = 0
+    early_exit: bool = False
+    truncated: bool = False
+    final_url: str = None
+    set_cookies: list = field(default_factory=list)  # every Set-Cookie header, the dict only keeps the last one
+
+    @property
+    def ok(self):
+        # Same rule as requests' raise_for_status: no error and no 4xx/5xx status
+        return self.error is None and self.status is not None and self.status < 400
+
+    @property
+    def partial(self):
+        # Streaming mode stopped reading before the end of the body
+        return self.early_exit or self.truncated
+
+
+# Decode the body the way requests' response.text does
+def _decode(body, content_type):
+    encoding = requests.utils.get_encoding_from_headers({'content-type': content_type or ''})
+    if encoding is None:
+        best = charset_normalizer.from_bytes(body).best()
+        encoding = best.encoding if best else 'utf-8'
+    try:
+        return body.decode(encoding, errors='replace')
+    except LookupError:
+        return body.decode('utf-8', errors='replace')
+
+
+# Build a FetchResult from a status, a list of header pairs and the raw body
+def _make_result(url, status, header_pairs, body, from_cache=False):
+    headers = CaseInsensitiveDict(header_pairs)
+    return FetchResult(
+        url=url,
+        status=status,
+        headers=headers,
+        text=_decode(body, headers.get('Content-Type')),
+        from_cache=from_cache,
+        set_cookies=[value for name, value in header_pairs if name.lower() == 'set-cookie'],
+    )
+
+
+# Conditional request headers built from the validators of a cached page
+def _validators(cached):
+    headers = CaseInsensitiveDict(cached['headers'])
+    conditional = {}
+    if 'ETag' in headers:
+        conditional['If-None-Match'] = headers['ETag']
+    if 'Last-Modified' in headers:
+        conditional['If-Modified-Since'] = headers['Last-Modified']
+    return conditional
+
+
+# Whether a page with this status may be cached: not server errors (5xx) or the
+# TRANSIENT_STATUSES, so one failing or rate-limited pass is not replayed to later runs
+def _cacheable(status):
+    return status < 500 and status not in TRANSIENT_STATUSES
+
+
+# Append a page a fetch produced to the WARC archive when recording (WEBINTEL_WARC=record)
+def _record(url, status, header_pairs, body):
+    archive = shared_archive()
+    if archive is not None and not archive.replaying:
+        archive.record_response(url, status, header_pairs, body)
+
+
+# Build the page for url from the WARC archive alone (WEBINTEL_WARC=replay);
+# URLs that were never recorded fail like a fetch error
+def _replay_one(archive, url):
+    recorded = archive.get(url)
+    if recorded is None:
+        STATS['not_recorded'] += 1
+        return FetchResult(url=url, error="Not in the WARC archive")
+    STATS['replayed'] += 1
+    return _make_result(url, recorded['status'], recorded['headers'], recorded['body'])
+
+
+# Fetch a single URL, following redirects like requests.get does.
+# Fresh pages in the shared page cache are served without touching the network;
+# stale ones are revalidated with If-None-Match / If-Modified-Since and reused
+# when the server answers 304 Not Modified. The whole fetch, redirects included,
+# is cancelled after timeout seconds. With a scanner the body is streamed and
+# reading stops once the scanner has decided; such partial pages are not cached,
+# nor are answers that are usually gone by the next fetch (see _cacheable).
+# URLs known to redirect are requested at their canonical URL directly, skipping
+# the redirect chain; the page is still returned and cached under url.
+# Every page served is also archived when WARC recording is on. Hosts that are
+# known to be dead, or whose circuit breaker opened in this run, are not contacted.
+async def _fetch_one(client, url, timeout, scanner=None):
+    cache = shared_cache()
+    cached = cache.get(url, allow_stale=True) if cache is not None else None
+    if cached is not None and cached['fresh'] and _cacheable(cached['status']):
+        STATS['cache_hits'] += 1
+        _record(url, cached['status'], cached['headers'], cached['body'])
+        return _make_result(url, cached['status'], cached['headers'], cached['body'], from_cache=True)
+
+    # Hosts known not to exist fail at once, without opening a connection
+    if shared_dns().is_nxdomain(hostname(url)):
+        STATS['nxdomain'] += 1
+        return FetchResult(url=url, error=f"NXDOMAIN: {hostname(url)} does not exist")
+
+    health = shared_health()
+    host = hostname(url)
+    failure = health.blocked(host) if health is not None else None
+    if failure is not None:
+        STATS['dead_host_skips'] += 1
+        return FetchResult(url=url, error=f"Host {host} is marked dead ({failure})", timed_out=failure == 'timeout')
+
+    conditional = _validators(cached) if cached is not None else {}
+    target = cache.canonical(url) or url if cache is not None else url
+    if target != url:
+        STATS['redirects_skipped'] += 1
+    try:
+        request = client.get(target, headers=conditional, scanner=scanner, max_bytes=config.MAX_BODY_BYTES)
+        response = await asyncio.wait_for(request, timeout)
+    except asyncio.TimeoutError:
+        STATS['timed_out'] += 1
+        # A deadline cut short by the rank's time budget says nothing about the host
+        if health is not None and timeout >= config.TOTAL_TIMEOUT:
+            health.record_failure(host, 'timeout', f"No answer within {timeout:.0f}s")
+        return FetchResult(url=url, error=f"Fetch took longer than {timeout:.0f}s", timed_out=True)
+    except FetchError as e:
+        if isinstance(e, FetchTimeout):
+            STATS['timed_out'] += 1
+        if target != url and cache is not None:
+            cache.forget_canonical(url)
+        if health is not None and e.failure is not None:
+            health.record_failure(host, e.failure, str(e))
+        return FetchResult(url=url, error=str(e), timed_out=isinstance(e, FetchTimeout))
+
+    STATS['connections_opened'] += response.connections_opened
+    STATS['connections_reused'] += response.connections_reused
+    logging.debug(f"{url} opened {response.connections_opened} and reused {response.connections_reused} connections")
+    if health is not None:
+        if response.status >= 500:
+            health.record_failure(host, '5xx', f"HTTP {response.status}")
+        else:
+            health.record_success(host)
+
+    # Remember where the redirect chain ended; drop the shortcut once it stops working
+    final_url = response.final_url or target
+    if cache is not None:
+        if response.status >= 400 and target != url:
+            cache.forget_canonical(url)
+        elif response.status < 400 and normalize_url(final_url) != normalize_url(target):
+            cache.set_canonical(url, final_url)
+            STATS['redirects_recorded'] += 1
+
+    if response.status == 304 and cached is not None:
+        STATS['not_modified'] += 1
+        STATS['bytes_not_downloaded'] += len(cached['body'])
+        cache.touch(url)
+        _record(url, cached['status'], cached['headers'], cached['body'])
+        page = _make_result(url, cached['status'], cached['headers'], cached['body'], from_cache=True)
+    else:
+        partial = response.early_exit or response.truncated
+        if cache is not None and not partial and _cacheable(response.status):
+            cache.put(url, response.status, response.header_pairs, response.body)
+        if not partial:
+            _record(url, response.status, response.header_pairs, response.body)
+        page = _make_result(url, response.status, response.header_pairs, response.body)
+
+    page.connections_opened = response.connections_opened
+    page.connections_reused = response.connections_reused
+    page.bytes_read = len(response.body)
+    page.early_exit = response.early_exit
+    page.truncated = response.truncated
+    page.final_url = final_url
+    STATS['bytes_read'] += page.bytes_read
+    STATS['early_exits'] += page.early_exit
+    STATS['truncated'] += page.truncated
+    logging.debug(f"{url} read {page.bytes_read} bytes (early exit: {page.early_exit}, truncated: {page.truncated})")
+    return page
+
+
+# Value of process stored for a page whose body is unchanged since, or None.
+# memo names the computation (see page_cache.memo_key).
+def _stored(page, memo):
+    cache = shared_cache() if memo else None
+    if cache is None or not page.from_cache:
+        return None
+    value = cache.get_derived(page.url, memo)
+    if value is not None:
+        STATS['parses_skipped'] += 1
+    return value
+
+
+def _store(page, memo, value):
+    cache = shared_cache() if memo else None
+    if cache is not None and value is not None and page.error is None and not page.partial:
+        cache.put_derived(page.url, memo, value)
+
+
+# Apply process to a page. When memo names the computation and the page body
+# is unchanged since the value was last stored, the stored value is returned
+# without running process again.
+def _process(page, process, memo):
+    if process is None:
+        return page
+    value = _stored(page, memo)
+    if value is None:
+        value = process(page)
+        _store(page, memo, value)
+    return value
+
+
+# _process for the event loop: the parse runs on the parse pool and the loop
+# goes on with other fetches meanwhile. With a process pool, process has to be
+# a module-level function and its value picklable.
+async def _process_on_pool(page, process, memo):
+    if process is None or _parse_pool is None:
+        return _process(page, process, memo)
+    value = _stored(page, memo)
+    if value is None:
+        value = await asyncio.get_running_loop().run_in_executor(_parse_pool, process, page)
+        _store(page, memo, value)
+    return value
+
+
+# Parse pool of WEBINTEL_PARSE_POOL with WEBINTEL_PARSE_WORKERS workers, None for none.
+# Process workers are spawned rather than forked, as this process already runs the
+# event loop thread, and they must not initialize MPI again when they import the script.
+def _make_parse_pool():
+    if config.PARSE_WORKERS <= 0:
+        return None
+    if config.PARSE_POOL == 'process':
+        os.environ.setdefault('MPI4PY_RC_INITIALIZE', '0')
+        return ProcessPoolExecutor(config.PARSE_WORKERS, mp_context=multiprocessing.get_context('spawn'))
+    return ThreadPoolExecutor(config.PARSE_WORKERS, thread_name_prefix='parse')
+
+
+# Start the background event loop, the pooled client and the parse pool on first use
+def _engine_loop():
+    global _loop, _client, _budget_deadline, _in_flight, _parse_pool
+    with _loop_lock:
+        if _loop is None:
+            if config.RANK_TIME_BUDGET > 0:
+                _budget_deadline = time.monotonic() + config.RANK_TIME_BUDGET
+            _parse_pool = _make_parse_pool()
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name='fetch-engine', daemon=True).start()
+            _client = HttpClient()
+            asyncio.run_coroutine_threadsafe(_client.start(), _loop).result()
+            _in_flight = asyncio.Semaphore(config.MAX_IN_FLIGHT)
+            atexit.register(shutdown)
+    return _loop
+
+
+# Close the pooled connections and the parse pool when the process exits
+def shutdown():
+    global _loop
+    if _loop is None:  # Already closed, or a forked child that never fetched
+        return
+    asyncio.run_coroutine_threadsafe(_client.close(), _loop).result()
+    _loop.call_soon_threadsafe(_loop.stop)
+    if _parse_pool is not None:
+        _parse_pool.shutdown(cancel_futures=True)
+    _loop = None
+
+
+# A forked child (a local worker, see executor.py) has none of the parent's
+# threads: the event loop, its client and the parse pool would be copies no
+# thread runs, so the child starts its own on first use, with its own counters
+def _forget_after_fork():
+    global _loop, _client, _loop_lock, _in_flight, _parse_pool, _budget_deadline
+    _loop = _client = _in_flight = _parse_pool = _budget_deadline = None
+    _loop_lock = threading.Lock()
+    STATS.clear()
+
+
+os.register_at_fork(after_in_child=_forget_after_fork)
+
+
+# Fetch all URLs with at most max_in_flight requests of this call running at
+# once, and no more than WEBINTEL_MAX_IN_FLIGHT over all calls running in the
+# process (e.g. the batches a worker rank works on together). The host
+# scheduler interleaves hosts and paces each one with its token bucket, and the
+# pooled client limits connections per host. When process is given it is called
+# on each page as soon as it arrives, on the parse pool, and only its return
+# value is kept, so the page bodies do not pile up in memory. Results come back
+# in the order of urls.
+async def _fetch_all(urls, process, memo, scanner, max_in_flight, desc):
+    results = [None] * len(urls)
+    scheduler = HostScheduler()
+    for index, url in enumerate(urls):
+        scheduler.add((index, url), hostname(url))
+
+    # Resolve all hostnames of the batch concurrently before the first connection
+    await shared_dns().prefetch(hostname(url) for url in urls)
+
+    with tqdm(total=len(urls), desc=desc, disable=desc is None) as pbar:
+        # Each worker asks the scheduler for the next URL as soon as its previous
+        # fetch is done. Once the rank's time budget is spent the remaining URLs are deferred.
+        async def worker():
+            while (item := await scheduler.next()) is not None:
+                index, url = item
+                timeout = config.TOTAL_TIMEOUT
+                if _budget_deadline is not None:
+                    timeout = min(timeout, _budget_deadline - time.monotonic())
+                if timeout <= 0:
+                    STATS['timed_out'] += 1
+                    page = FetchResult(url=url, error="Rank time budget exhausted", timed_out=True)
+                else:
+                    async with _in_flight:
+                        page = await _fetch_one(_client, url, timeout, scanner(url) if scanner else None)
+                results[index] = await _process_on_pool(page, process, memo)
+                pbar.update(1)
+
+        await asyncio.gather(*(worker() for _ in range(min(max_in_flight, len(urls)))))
+
+    STATS['scheduled'] += scheduler.dispatched
+    STATS['scheduler_wait'] += scheduler.total_wait
+    STATS['peak_queue_depth'] = max(STATS['peak_queue_depth'], scheduler.peak_depth)
+    STATS['max_wait'] = max(STATS['max_wait'], scheduler.max_wait)
+    return results
+
+
+# Blocking entry point for the pipeline scripts; safe to call from several threads.
+# scanner is a function returning a fresh stream_scan.KeywordScanner for a URL;
+# it is only used when streaming mode is on (WEBINTEL_STREAMING=1) and WARC
+# recording is off, since the archive has to hold whole pages. In WARC replay
+# mode no request is made at all.
+def fetch_pages(urls, process=None, memo=None, scanner=None, max_in_flight=None, desc="Fetching URLs"):
+    if not urls:
+        return []
+    max_in_flight = max_in_flight or config.MAX_IN_FLIGHT
+    if not config.STREAMING or config.WARC_MODE:
+        scanner = None
+    archive = shared_archive()
+    if archive is not None and archive.replaying:
+        pages = (_replay_one(archive, url) for url in urls)
+        results = [_process(page, process, memo) for page in tqdm(pages, total=len(urls), desc=desc, disable=desc is None)]
+    else:
+        coroutine = _fetch_all(urls, process, memo, scanner, max_in_flight, desc)
+        results = asyncio.run_coroutine_threadsafe(coroutine, _engine_loop()).result()
+    if desc is not None:
+        log_stats()
+    return results
+
+
+# Start the counters of this process over, e.g. at the start of a run over the
+# executor (see work_queue.run_batches), which logs them once for all processes
+def reset_stats():
+    STATS.clear()
+
+
+# The STATS of several processes (or ranks) added up
+def merge_stats(counters):
+    merged = Counter()
+    for counter in counters:
+        for key, value in counter.items():
+            merged[key] = max(merged[key], value) if key in PEAK_STATS else merged[key] + value
+    return merged
+
+
+# Log what the cache and the connection pool saved so far in this process, or
+# the given counters, e.g. those of every process of a run added up
+def log_stats(stats=None):
+    stats = STATS if stats is None else stats
+    logging.info(
+        f"Fetch cache: {stats['cache_hits']} fresh hits, {stats['not_modified']} revalidated (304), "
+        f"{stats['bytes_not_downloaded']} bytes not downloaded, {stats['parses_skipped']} parses skipped"
+    )
+    logging.info(
+        f"Connection pool: {stats['connections_opened']} connections opened, "
+        f"{stats['connections_reused']} reused"
+    )
+    if stats['redirects_recorded'] or stats['redirects_skipped']:
+        logging.info(
+            f"Redirects: {stats['redirects_recorded']} canonical URLs recorded, "
+            f"{stats['redirects_skipped']} redirect chains skipped"
+        )
+    if stats['scheduled']:
+        logging.info(
+            f"Scheduler: {stats['scheduled']} requests, peak queue depth {stats['peak_queue_depth']}, "
+            f"mean wait {stats['scheduler_wait'] / stats['scheduled']:.2f}s, max wait {stats['max_wait']:.2f}s"
+        )
+    if stats['early_exits'] or stats['truncated']:
+        logging.info(
+            f"Streaming: {stats['bytes_read']} bytes read, {stats['early_exits']} early exits, "
+            f"{stats['truncated']} pages cut at {config.MAX_BODY_BYTES} bytes"
+        )
+    if stats['replayed'] or stats['not_recorded']:
+        logging.info(f"WARC replay: {stats['replayed']} pages replayed, {stats['not_recorded']} not in the archive")
+    if stats['dead_host_skips']:
+        logging.info(f"{stats['dead_host_skips']} URLs skipped because their host is dead or its circuit breaker is open")
+    if stats['nxdomain']:
+        logging.info(f"{stats['nxdomain']} URLs skipped because their host does not exist (NXDOMAIN)")
+    if stats['timed_out']:
+        logging.warning(f"{stats['timed_out']} URLs timed out and were deferred")
+
+
+# Blocking fetch of a single URL for the scripts that handle one URL at a time.
+# Consecutive calls reuse the pooled connections of the background client.
+def fetch_page(url):
+    return fetch_pages([url], desc=None)[0]
+
+
+# Append URLs that timed out to a CSV so they can be retried in a later run
+def write_deferred(urls, filename):
+    if not urls:
+        return
+    write_header = not os.path.exists(filename)
+    with open(filename, mode='a', newline='') as file:
+        writer = csv.writer(file)
+        if write_header:
+            writer.writerow(['URL'])
+        writer.writerows([url] for url in urls)
+    logging.info(f"{len(urls)} timed-out URLs have been added to '{filename}' for a later retry.")
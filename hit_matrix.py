@@ -0,0 +1,146 @@
+import argparse
+import csv
+import time
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from country_profiles import KEYWORD_TABLES, KEYWORDS, PAGE_BONUSES, URL_BONUSES
+
+# Every keyword of country_profiles.KEYWORD_TABLES is a column, so any table can be re-weighted
+KEYWORD_COLUMNS = sorted({keyword for table in KEYWORD_TABLES.values() for keyword in table})
+
+# The form and button checks of calculate_probability, as named page signals
+PAGE_SIGNALS = {
+    'form:checkout': lambda features: any('checkout' in action for action in features.form_actions),
+    'button:buy': lambda features: any('buy' in text.lower() or 'add to cart' in text.lower()
+                                       for text in features.button_texts),
+}
+
+COLUMNS = KEYWORD_COLUMNS + list(PAGE_SIGNALS)
+
+
+# Which keywords and page signals each page has, as a sparse page x column
+# matrix of 0/1 kept next to the page URLs. A score is one matrix-vector
+# product with the weights plus the URL bonuses, so a whole country can be
+# re-scored after a weight change without fetching or parsing anything.
+class HitMatrix:
+    def __init__(self, urls, hits, columns=COLUMNS):
+        self.urls = list(urls)
+        self.hits = sparse.csr_matrix(hits, dtype=np.float64)
+        self.columns = list(columns)
+        self._url_columns = {}  # URL bonus string -> boolean vector, built on first use
+
+    # Rows of PageFeatures records (see page_features.py)
+    @classmethod
+    def from_features(cls, pages):
+        index = {column: i for i, column in enumerate(COLUMNS)}
+        rows, cols = [], []
+        for row, features in enumerate(pages):
+            found = [index[keyword] for keyword in features.hits if keyword in index]
+            found += [index[name] for name, check in PAGE_SIGNALS.items() if check(features)]
+            rows.extend([row] * len(found))
+            cols.extend(found)
+        hits = sparse.csr_matrix((np.ones(len(rows)), (rows, cols)), shape=(len(pages), len(COLUMNS)))
+        return cls([features.url for features in pages], hits)
+
+    # One matrix of the rows of several (e.g. one per MPI rank)
+    @classmethod
+    def stack(cls, matrices):
+        matrices = [matrix for matrix in matrices if matrix is not None]
+        if not matrices:
+            return cls([], sparse.csr_matrix((0, len(COLUMNS))))
+        urls = [url for matrix in matrices for url in matrix.urls]
+        return cls(urls, sparse.vstack([matrix.hits for matrix in matrices]), matrices[0].columns)
+
+    # Append-friendly form of the rows: (url, the columns hit joined by ';') per page,
+    # which the scripts add to a CSV batch by batch while a run is going
+    def hit_rows(self):
+        hits = self.hits.tocsr()
+        for row, url in enumerate(self.urls):
+            columns = hits.indices[hits.indptr[row]:hits.indptr[row + 1]]
+            yield url, ';'.join(self.columns[column] for column in sorted(columns))
+
+    # Matrix of a CSV of hit_rows with a header line
+    @classmethod
+    def read_hit_rows(cls, path):
+        index = {column: i for i, column in enumerate(COLUMNS)}
+        urls, rows, cols = [], [], []
+        with open(path, newline='') as file:
+            reader = csv.reader(file)
+            next(reader, None)
+            for row, (url, found) in enumerate(reader):
+                urls.append(url)
+                found = [index[column] for column in found.split(';') if column]
+                rows.extend([row] * len(found))
+                cols.extend(found)
+        hits = sparse.csr_matrix((np.ones(len(rows)), (rows, cols)), shape=(len(urls), len(COLUMNS)))
+        return cls(urls, hits)
+
+    def __len__(self):
+        return len(self.urls)
+
+    # Whether each URL contains the string
+    def url_column(self, text):
+        if text not in self._url_columns:
+            self._url_columns[text] = np.fromiter((text in url for url in self.urls), dtype=bool, count=len(self.urls))
+        return self._url_columns[text]
+
+    # Column weights of a keyword table and the page bonuses
+    def weight_vector(self, keywords, page_bonuses=PAGE_BONUSES):
+        weights = dict(keywords, **page_bonuses)
+        missing = set(weights) - set(self.columns)
+        if missing:
+            raise ValueError(f"Keywords without a column in the hit matrix (add them to country_profiles.py and refetch): {sorted(missing)}")
+        return np.array([weights.get(column, 0) for column in self.columns], dtype=np.float64)
+
+    # calculate_probability's probability (%) of every page: the weights of the
+    # keywords and page signals found plus the URL bonuses, over the total keyword weight
+    def score(self, keywords, url_bonuses, page_bonuses=PAGE_BONUSES):
+        matches = self.hits @ self.weight_vector(keywords, page_bonuses)
+        for text, bonus in url_bonuses.items():
+            matches = matches + bonus * self.url_column(text)
+        total_weight = sum(keywords.values())
+        if total_weight <= 0:
+            return np.zeros(len(self.urls))
+        return (matches / total_weight) * 100
+
+    # Scores with the current tables of country_profiles.py
+    def score_country(self, country):
+        return self.score(KEYWORDS[country], URL_BONUSES[country])
+
+    def save(self, path):
+        hits = self.hits.tocsr()
+        np.savez_compressed(path, urls=np.array(self.urls, dtype=str), columns=np.array(self.columns, dtype=str),
+                            data=hits.data.astype(np.uint8), indices=hits.indices, indptr=hits.indptr,
+                            shape=np.array(hits.shape))
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as stored:
+            hits = sparse.csr_matrix((stored['data'].astype(np.float64), stored['indices'], stored['indptr']),
+                                     shape=tuple(stored['shape']))
+            return cls(stored['urls'].tolist(), hits, stored['columns'].tolist())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-score saved keyword hits with the weights of country_profiles.py, offline.")
+    parser.add_argument('matrix', help="keyword_hits_<country>DATASET.npz written by ParallelProbability<country>.py")
+    parser.add_argument('country', choices=sorted(KEYWORDS), help="Country whose keyword weights and URL bonuses to use")
+    parser.add_argument('--output', help="CSV to write the URL and Probability (%%) columns to")
+    args = parser.parse_args()
+
+    matrix = HitMatrix.load(args.matrix)
+    start_time = time.perf_counter()
+    probabilities = matrix.score_country(args.country)
+    elapsed = time.perf_counter() - start_time
+    print(f"Scored {len(matrix)} pages in {elapsed * 1000:.1f} ms")
+
+    if args.output:
+        pd.DataFrame({'URL': matrix.urls, 'Probability (%)': probabilities}).to_csv(args.output, index=False)
+        print(f"Probabilities have been saved to '{args.output}'.")
+
+
+if __name__ == "__main__":
+    main()
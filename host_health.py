@@ -0,0 +1,115 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import Counter
+
+import pipeline_config as config
+
+# Failure classes that mark a host as dead; other errors say nothing about the host
+FAILURE_CLASSES = ('dns', 'connect', 'tls', 'timeout', '5xx')
+
+# Failure classes a host is remembered as dead for across runs. A timeout may be
+# the deadline's fault rather than the host's, and the URLs it hit are deferred
+# for a retry, so it only opens the breaker for the rest of the run.
+PERSISTENT_CLASSES = ('dns', 'connect', 'tls', '5xx')
+
+
+# Tracks which hosts are dead, for this run and across runs. The circuit
+# breaker counts consecutive failures per host and, after threshold of them,
+# short-circuits every further request to that host for the rest of the run.
+# The negative cache is an SQLite table shared by every stage and every MPI
+# rank: a host whose breaker opened without any fetch of it succeeding in this
+# run is recorded with the class of the failure that opened it (unless that is
+# a timeout) and skipped by later stages and re-runs for ttl seconds.
+class HostHealth:
+    def __init__(self, path=None, ttl=None, threshold=None):
+        self.path = path or config.HOST_HEALTH_PATH
+        self.ttl = ttl or config.DEAD_HOST_TTL
+        self.threshold = threshold or config.BREAKER_THRESHOLD
+        self.failures = Counter()  # host -> consecutive failures in this run
+        self.tripped = {}  # host -> failure class, for hosts whose breaker is open
+        self.alive = set()  # hosts that answered at least once in this run
+        self.recorded = set()  # hosts this run wrote to the negative cache
+        self._lock = threading.RLock()
+        self.db = sqlite3.connect(self.path, timeout=60, check_same_thread=False)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS dead_hosts (
+                host TEXT PRIMARY KEY,
+                failure TEXT NOT NULL,
+                detail TEXT,
+                failed_at REAL NOT NULL
+            )
+        """)
+        self.db.commit()
+
+    # Failure class that rules out contacting host, or None when it may be tried
+    def blocked(self, host):
+        if host in self.tripped:
+            return self.tripped[host]
+        if host in self.recorded:
+            return None
+        with self._lock:
+            row = self.db.execute('SELECT failure, failed_at FROM dead_hosts WHERE host = ?', (host,)).fetchone()
+        # Rows of timeouts written by older runs no longer block: their URLs were deferred for a retry
+        if row is None or row[0] not in PERSISTENT_CLASSES or time.time() - row[1] > self.ttl:
+            return None
+        return row[0]
+
+    def record_success(self, host):
+        self.failures.pop(host, None)
+        self.alive.add(host)
+        if host in self.recorded:
+            self.recorded.discard(host)
+            with self._lock, self.db:
+                self.db.execute('DELETE FROM dead_hosts WHERE host = ?', (host,))
+
+    def record_failure(self, host, failure, detail=None):
+        if failure not in FAILURE_CLASSES:
+            return
+        self.failures[host] += 1
+        if self.failures[host] < self.threshold or host in self.tripped:
+            return
+        self.tripped[host] = failure
+        logging.warning(f"Circuit breaker open for {host} after {self.failures[host]} failures ({failure})")
+        if failure in PERSISTENT_CLASSES and host not in self.alive:
+            self.recorded.add(host)
+            with self._lock, self.db:
+                self.db.execute('INSERT OR REPLACE INTO dead_hosts (host, failure, detail, failed_at) '
+                                'VALUES (?, ?, ?, ?)', (host, failure, detail, time.time()))
+
+    def close(self):
+        self.db.close()
+
+
+_shared_health = None
+
+
+# HostHealth shared by everything running in this process, or None when
+# dead-host tracking is disabled with WEBINTEL_DEAD_HOSTS=0
+def shared_health():
+    global _shared_health
+    if not config.DEAD_HOSTS_ENABLED:
+        return None
+    if _shared_health is None:
+        _shared_health = HostHealth()
+    return _shared_health
+
+
+# Close the shared HostHealth's connection, e.g. when a local worker process exits
+def close_shared_health():
+    global _shared_health
+    if _shared_health is not None:
+        _shared_health.close()
+        _shared_health = None
+
+
+# A forked child (a local worker, see executor.py) opens its own connection on first use
+def _forget_after_fork():
+    global _shared_health
+    _shared_health = None
+
+
+os.register_at_fork(after_in_child=_forget_after_fork)
@@ -0,0 +1,144 @@
+import logging
+from dataclasses import dataclass, field
+
+from bs4 import BeautifulSoup
+
+import pipeline_config as config
+
+try:
+    from lxml import etree
+except ImportError:
+    etree = None
+
+try:
+    from selectolax.lexbor import LexborHTMLParser
+except ImportError:
+    LexborHTMLParser = None
+
+# Tags whose text BeautifulSoup's get_text() leaves out
+SKIPPED_TEXT_TAGS = {'script', 'style', 'template'}
+
+
+# The parts of a page the scorers look at
+@dataclass
+class HtmlFeatures:
+    form_actions: list = field(default_factory=list)  # action attribute of every <form> ('' when missing)
+    button_texts: list = field(default_factory=list)  # text of every <button>
+    footer_text: str = None  # text of the first <footer>, None when there is none
+    visible_text: str = ''  # what soup.get_text() returns
+
+
+# Reference backend: the BeautifulSoup html.parser tree the scripts used to build
+def _extract_bs4(html):
+    soup = BeautifulSoup(html, 'html.parser')
+    footer = soup.find('footer')
+    return HtmlFeatures(
+        form_actions=[form.get('action', '') for form in soup.find_all('form')],
+        button_texts=[button.text for button in soup.find_all('button')],
+        footer_text=footer.text if footer else None,
+        visible_text=soup.get_text(),
+    )
+
+
+# lxml parser target: receives the parse events of libxml2's HTML parser and
+# keeps only the features, so no tree is ever built
+class _FeatureTarget:
+    def __init__(self):
+        self.features = HtmlFeatures()
+        self._text = []
+        self._skip_depth = 0
+        self._open_buttons = []  # (index in button_texts, text parts) of the buttons being read
+        self._footer_parts = None
+        self._footer_depth = 0
+
+    def start(self, tag, attrib):
+        if tag in SKIPPED_TEXT_TAGS:
+            self._skip_depth += 1
+        elif tag == 'form':
+            self.features.form_actions.append(attrib.get('action', ''))
+        elif tag == 'button':
+            self.features.button_texts.append('')
+            self._open_buttons.append((len(self.features.button_texts) - 1, []))
+        elif tag == 'footer' and (self._footer_parts is None or self._footer_depth):
+            if self._footer_parts is None:
+                self._footer_parts = []
+            self._footer_depth += 1
+
+    def end(self, tag):
+        if tag in SKIPPED_TEXT_TAGS:
+            self._skip_depth = max(self._skip_depth - 1, 0)
+        elif tag == 'button' and self._open_buttons:
+            index, parts = self._open_buttons.pop()
+            self.features.button_texts[index] = ''.join(parts)
+        elif tag == 'footer' and self._footer_depth:
+            self._footer_depth -= 1
+
+    def data(self, data):
+        if self._skip_depth:
+            return
+        self._text.append(data)
+        for _, parts in self._open_buttons:
+            parts.append(data)
+        if self._footer_depth:
+            self._footer_parts.append(data)
+
+    def close(self):
+        while self._open_buttons:
+            self.end('button')
+        if self._footer_parts is not None:
+            self.features.footer_text = ''.join(self._footer_parts)
+        self.features.visible_text = ''.join(self._text)
+        return self.features
+
+
+# Streaming backend: lxml's HTML parser in event mode
+def _extract_lxml(html):
+    target = _FeatureTarget()
+    parser = etree.HTMLParser(target=target)
+    try:
+        parser.feed(html)
+        return parser.close()
+    except etree.LxmlError:
+        # Pages libxml2 gives up on (e.g. empty ones) keep what was read so far
+        return target.close()
+
+
+# selectolax backend: the lexbor C parser, text read from the tree it builds
+def _extract_selectolax(html):
+    tree = LexborHTMLParser(html)
+    tree.strip_tags(list(SKIPPED_TEXT_TAGS))
+    footer = tree.css_first('footer')
+    return HtmlFeatures(
+        form_actions=[form.attributes.get('action') or '' for form in tree.css('form')],
+        button_texts=[button.text(deep=True) for button in tree.css('button')],
+        footer_text=footer.text(deep=True) if footer is not None else None,
+        visible_text=tree.root.text(deep=True) if tree.root is not None else '',
+    )
+
+
+BACKENDS = {
+    'bs4': _extract_bs4,
+    'lxml': _extract_lxml,
+    'selectolax': _extract_selectolax,
+}
+
+
+# Names of the backends whose library is installed
+def available_backends():
+    missing = {'lxml': etree is None, 'selectolax': LexborHTMLParser is None}
+    return [name for name in BACKENDS if not missing.get(name)]
+
+
+_warned = set()
+
+
+# Extract the scorer features of an HTML page with the configured backend
+# (WEBINTEL_HTML_BACKEND); a backend that is not installed falls back to bs4
+def extract_html(html, backend=None):
+    backend = backend or config.HTML_BACKEND
+    if backend not in available_backends():
+        if backend not in _warned:
+            logging.warning(f"HTML backend '{backend}' is not available, using bs4")
+            _warned.add(backend)
+        backend = 'bs4'
+    return BACKENDS[backend](html)
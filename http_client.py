@@ -0,0 +1,231 @@
+import asyncio
+import logging
+import socket
+import ssl
+from dataclasses import dataclass
+from types import SimpleNamespace
+
+import aiohttp
+import certifi
+import requests
+from requests.structures import CaseInsensitiveDict
+
+import pipeline_config as config
+from dns_cache import CachedResolver, shared_dns
+
+try:
+    import h2  # noqa: F401  (httpx only speaks HTTP/2 when h2 is installed)
+    import httpx
+except ImportError:
+    httpx = None
+
+# Send the same headers as requests.get so sites answer exactly as before
+DEFAULT_HEADERS = {
+    'User-Agent': requests.utils.default_user_agent(),
+    'Accept': '*/*',
+}
+
+# requests.get follows up to 30 redirects
+MAX_REDIRECTS = 30
+
+# Size of the chunks handed to a scanner in streaming mode
+CHUNK_SIZE = 16 * 1024
+
+
+# Raised for every network-level failure, whichever library made the request.
+# failure names the class of failure (see host_health.py) when it is known.
+class FetchError(Exception):
+    def __init__(self, message, failure=None):
+        super().__init__(message)
+        self.failure = failure
+
+
+# Raised when connecting or reading took longer than its deadline
+class FetchTimeout(FetchError):
+    def __init__(self, message):
+        super().__init__(message, failure='timeout')
+
+
+# Raw answer to one GET, after redirects, with the number of connections the
+# request (and its redirect hops) opened and reused from the pool
+@dataclass
+class HttpResponse:
+    status: int
+    header_pairs: list
+    body: bytes
+    connections_opened: int = 0
+    connections_reused: int = 0
+    early_exit: bool = False  # the scanner decided the verdict before the end of the body
+    truncated: bool = False  # the body hit the max_bytes cap
+    final_url: str = None  # where the redirect chain ended
+
+
+# Count pooled connections per request through aiohttp's tracing hooks
+def _connection_trace():
+    async def on_create(session, trace_config_ctx, params):
+        trace_config_ctx.trace_request_ctx.opened += 1
+
+    async def on_reuse(session, trace_config_ctx, params):
+        trace_config_ctx.trace_request_ctx.reused += 1
+
+    trace = aiohttp.TraceConfig()
+    trace.on_connection_create_end.append(on_create)
+    trace.on_connection_reuseconn.append(on_reuse)
+    return trace
+
+
+# Long-lived HTTP client shared by every stage running in a process. One
+# connection pool keeps connections alive between requests, so redirect chains
+# (http -> https -> www) and later requests to the same host skip the TCP and
+# TLS handshakes. Hostnames are resolved through the shared DNS cache. With
+# WEBINTEL_HTTP2=1 and h2 installed the requests go through httpx over HTTP/2,
+# where one connection carries many requests (httpx resolves names itself).
+class HttpClient:
+    def __init__(self, http2=None):
+        self.http2 = config.HTTP2 if http2 is None else http2
+        if self.http2 and httpx is None:
+            logging.warning("HTTP/2 requested but httpx/h2 are not installed, using HTTP/1.1")
+            self.http2 = False
+        self.session = None
+
+    async def start(self):
+        ssl_context = ssl.create_default_context(cafile=certifi.where())
+        if self.http2:
+            limits = httpx.Limits(
+                max_connections=config.MAX_IN_FLIGHT,
+                max_keepalive_connections=config.MAX_IN_FLIGHT,
+                keepalive_expiry=config.KEEPALIVE_TIMEOUT,
+            )
+            self.session = httpx.AsyncClient(
+                http2=True, verify=ssl_context, limits=limits, headers=DEFAULT_HEADERS,
+                follow_redirects=True, max_redirects=MAX_REDIRECTS,
+                timeout=httpx.Timeout(None, connect=config.CONNECT_TIMEOUT, read=config.READ_TIMEOUT),
+            )
+        else:
+            connector = aiohttp.TCPConnector(
+                limit=config.MAX_IN_FLIGHT,
+                limit_per_host=config.PER_HOST_LIMIT,
+                keepalive_timeout=config.KEEPALIVE_TIMEOUT,
+                resolver=CachedResolver(shared_dns()),
+                ssl=ssl_context,
+            )
+            timeout = aiohttp.ClientTimeout(
+                total=None, sock_connect=config.CONNECT_TIMEOUT, sock_read=config.READ_TIMEOUT
+            )
+            self.session = aiohttp.ClientSession(
+                connector=connector, headers=DEFAULT_HEADERS, timeout=timeout,
+                trace_configs=[_connection_trace()]
+            )
+
+    async def close(self):
+        if self.http2:
+            await self.session.aclose()
+        else:
+            await self.session.close()
+
+    # GET url following redirects; raises FetchError when no response arrives.
+    # With a scanner (see stream_scan.py) the body is read in chunks and the
+    # connection is closed as soon as the scanner is done or max_bytes were read.
+    async def get(self, url, headers=None, scanner=None, max_bytes=None):
+        if self.http2:
+            return await self._get_http2(url, headers or {}, scanner, max_bytes)
+        return await self._get_http1(url, headers or {}, scanner, max_bytes)
+
+    async def _get_http1(self, url, headers, scanner, max_bytes):
+        usage = SimpleNamespace(opened=0, reused=0)
+        try:
+            async with self.session.get(url, headers=headers, allow_redirects=True,
+                                        max_redirects=MAX_REDIRECTS, trace_request_ctx=usage) as response:
+                result = HttpResponse(response.status, list(response.headers.items()), b'',
+                                      usage.opened, usage.reused, final_url=str(response.url))
+                if response.status == 304:
+                    return result
+                if scanner is None:
+                    result.body = await response.read()
+                    return result
+
+                await _read_scanned(result, response.content.iter_chunked(CHUNK_SIZE), scanner, max_bytes)
+                if result.early_exit or result.truncated:
+                    response.close()
+                return result
+        except asyncio.TimeoutError as e:
+            raise FetchTimeout(f"{type(e).__name__}: {e}") from e
+        except (aiohttp.ClientError, ValueError) as e:
+            raise FetchError(f"{type(e).__name__}: {e}", _aiohttp_failure(e)) from e
+
+    async def _get_http2(self, url, headers, scanner, max_bytes):
+        usage = SimpleNamespace(opened=0, requests=0)
+
+        # httpcore reports every new connection and every request sent
+        async def trace(event, info):
+            if event == 'connection.connect_tcp.complete':
+                usage.opened += 1
+            elif event.endswith('send_request_headers.started'):
+                usage.requests += 1
+
+        try:
+            async with self.session.stream('GET', url, headers=headers, extensions={'trace': trace}) as response:
+                result = HttpResponse(response.status_code, list(response.headers.items()), b'',
+                                      final_url=str(response.url))
+                if response.status_code == 304:
+                    pass
+                elif scanner is None:
+                    result.body = await response.aread()
+                else:
+                    await _read_scanned(result, response.aiter_bytes(CHUNK_SIZE), scanner, max_bytes)
+        except httpx.TimeoutException as e:
+            raise FetchTimeout(f"{type(e).__name__}: {e}") from e
+        except (httpx.HTTPError, ValueError) as e:
+            raise FetchError(f"{type(e).__name__}: {e}", _httpx_failure(e)) from e
+        result.connections_opened = usage.opened
+        result.connections_reused = max(usage.requests - usage.opened, 0)
+        return result
+
+
+# Read body chunks into result, feeding each to the scanner, until the scanner
+# is done, max_bytes were read or the body ends
+async def _read_scanned(result, chunks, scanner, max_bytes):
+    body = bytearray()
+    scanner.start(CaseInsensitiveDict(result.header_pairs).get('Content-Type'))
+    async for chunk in chunks:
+        body += chunk
+        if scanner.feed(chunk):
+            result.early_exit = True
+            break
+        if max_bytes and len(body) >= max_bytes:
+            result.truncated = True
+            break
+    result.body = bytes(body)
+
+
+# aiohttp 3.11 and later raise this for names that do not resolve; older
+# versions raise a ClientConnectorError wrapping the resolver's gaierror
+DNS_ERROR = getattr(aiohttp, 'ClientConnectorDNSError', ())
+
+
+# Failure class of an aiohttp error; None for errors that say nothing about the host
+def _aiohttp_failure(error):
+    if isinstance(error, DNS_ERROR):
+        return 'dns'
+    if isinstance(error, aiohttp.ClientConnectorError) and isinstance(error.os_error, socket.gaierror):
+        return 'dns'
+    if isinstance(error, aiohttp.ClientSSLError):
+        return 'tls'
+    if isinstance(error, aiohttp.ClientConnectorError):
+        return 'connect'
+    return None
+
+
+# Failure class of an httpx error, which wraps DNS, TLS and refused connections
+# alike in ConnectError; the underlying exception tells them apart
+def _httpx_failure(error):
+    if not isinstance(error, httpx.ConnectError):
+        return None
+    cause = error.__cause__ or error.__context__
+    while cause is not None:
+        if isinstance(cause, socket.gaierror):
+            return 'dns'
+        if isinstance(cause, ssl.SSLError):
+            return 'tls'
+        cause = cause.__cause__ or cause.__context__
+    return 'connect'
@@ -0,0 +1,58 @@
+from functools import lru_cache
+
+try:
+    import ahocorasick  # pip install pyahocorasick
+except ImportError:
+    ahocorasick = None
+
+
+# Finds which keywords of a weight table occur in a page. With pyahocorasick
+# installed the keywords are compiled into one Aho-Corasick automaton that finds
+# all of them, overlapping ones included, in a single pass over the text and
+# stops as soon as every keyword was seen. Without it each keyword is searched
+# with `in`, exactly as calculate_probability used to.
+class KeywordMatcher:
+    def __init__(self, weights):
+        self.weights = dict(weights)
+        self.automaton = None
+        if ahocorasick is not None and self.weights:
+            self.automaton = ahocorasick.Automaton()
+            for keyword in self.weights:
+                self.automaton.add_word(keyword, keyword)
+            self.automaton.make_automaton()
+
+    # Set of the keywords occurring in text
+    def found(self, text):
+        if self.automaton is None:
+            return {keyword for keyword in self.weights if keyword in text}
+        found = set()
+        for _, keyword in self.automaton.iter(text):
+            found.add(keyword)
+            if len(found) == len(self.weights):
+                break
+        return found
+
+    # Whether any keyword occurs in text; stops at the first match
+    def contains_any(self, text):
+        if self.automaton is None:
+            return any(keyword in text for keyword in self.weights)
+        return next(self.automaton.iter(text), None) is not None
+
+    # Map of every keyword to whether it occurs in text (the found_keywords map)
+    def find(self, text):
+        found = self.found(text)
+        return {keyword: keyword in found for keyword in self.weights}
+
+    # Sum of the weights of the keywords occurring in text
+    def score(self, text):
+        return sum(self.weights[keyword] for keyword in self.found(text))
+
+
+# Matcher for a weight table, compiled once per process
+def compile_keywords(weights):
+    return _compile(tuple(weights.items()))
+
+
+@lru_cache(maxsize=None)
+def _compile(items):
+    return KeywordMatcher(items)
@@ -0,0 +1,237 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from urllib.parse import urlsplit, urlunsplit
+
+import pipeline_config as config
+
+# Default ports that are dropped when normalizing a URL
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+# Check the total cache size only every this many writes
+EVICTION_CHECK_INTERVAL = 100
+
+
+# Normalize a URL so that trivially different spellings share one cache entry
+def normalize_url(url):
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or '').lower()
+    if parts.port and parts.port != DEFAULT_PORTS.get(scheme):
+        host = f"{host}:{parts.port}"
+    path = parts.path or '/'
+    return urlunsplit((scheme, host, path, parts.query, ''))
+
+
+# On-disk page cache shared by every pipeline stage and every MPI rank.
+# Pages are keyed by normalized URL and point to a body stored once per
+# sha256 digest, so identical pages served under several URLs share storage.
+# Entries older than ttl seconds are not served; when the bodies exceed
+# max_bytes the least recently used pages are evicted. The canonical table
+# maps input URLs to the URL their redirect chain ended at.
+class PageCache:
+    def __init__(self, path=None, max_bytes=None, ttl=None):
+        self.path = path or config.CACHE_PATH
+        self.max_bytes = max_bytes or config.CACHE_MAX_BYTES
+        self.ttl = ttl or config.CACHE_TTL
+        self.canonical_ttl = config.CANONICAL_TTL
+        self._writes = 0
+        self._lock = threading.RLock()
+        self.db = sqlite3.connect(self.path, timeout=60, check_same_thread=False)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS bodies (
+                digest TEXT PRIMARY KEY,
+                body BLOB NOT NULL,
+                size INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS pages (
+                url_key TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                digest TEXT NOT NULL,
+                status INTEGER,
+                headers TEXT NOT NULL,
+                fetched_at REAL NOT NULL,
+                last_access REAL NOT NULL,
+                PRIMARY KEY (url_key, kind)
+            );
+            CREATE INDEX IF NOT EXISTS pages_last_access ON pages (last_access);
+            CREATE TABLE IF NOT EXISTS derived (
+                url_key TEXT NOT NULL,
+                name TEXT NOT NULL,
+                digest TEXT NOT NULL,
+                value TEXT NOT NULL,
+                PRIMARY KEY (url_key, name)
+            );
+            CREATE TABLE IF NOT EXISTS canonical (
+                url_key TEXT PRIMARY KEY,
+                final_url TEXT NOT NULL,
+                recorded_at REAL NOT NULL
+            );
+        """)
+        self.db.commit()
+
+    # Return the cached entry for url as a dict, or None when missing or expired.
+    # With allow_stale=True expired entries are returned too, flagged with
+    # fresh=False, so their validators can be used for a conditional request.
+    # kind separates different renditions of the same URL (e.g. crawl4ai markdown).
+    def get(self, url, kind='raw', allow_stale=False):
+        key = normalize_url(url)
+        with self._lock:
+            return self._get(key, kind, allow_stale)
+
+    def _get(self, key, kind, allow_stale):
+        row = self.db.execute(
+            'SELECT p.status, p.headers, p.fetched_at, b.body FROM pages p '
+            'JOIN bodies b ON b.digest = p.digest WHERE p.url_key = ? AND p.kind = ?',
+            (key, kind)
+        ).fetchone()
+        if row is None:
+            return None
+
+        status, headers, fetched_at, body = row
+        fresh = time.time() - fetched_at <= self.ttl
+        if not fresh and not allow_stale:
+            return None
+
+        with self.db:
+            self.db.execute('UPDATE pages SET last_access = ? WHERE url_key = ? AND kind = ?',
+                            (time.time(), key, kind))
+        return {
+            'status': status,
+            'headers': json.loads(headers),
+            'body': body,
+            'fetched_at': fetched_at,
+            'fresh': fresh,
+        }
+
+    # Mark a cached page as fresh again after the server answered 304 Not Modified
+    def touch(self, url, kind='raw'):
+        now = time.time()
+        with self._lock, self.db:
+            self.db.execute('UPDATE pages SET fetched_at = ?, last_access = ? WHERE url_key = ? AND kind = ?',
+                            (now, now, normalize_url(url), kind))
+
+    # Return a value previously computed from the cached body of url under name,
+    # or None when it was never stored or the body has changed since
+    def get_derived(self, url, name):
+        with self._lock:
+            row = self.db.execute(
+                'SELECT d.value FROM derived d JOIN pages p ON p.url_key = d.url_key AND p.digest = d.digest '
+                "WHERE d.url_key = ? AND d.name = ? AND p.kind = 'raw'",
+                (normalize_url(url), name)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    # Remember a JSON-serializable value computed from the cached body of url
+    def put_derived(self, url, name, value):
+        key = normalize_url(url)
+        with self._lock, self.db:
+            self.db.execute(
+                'INSERT OR REPLACE INTO derived (url_key, name, digest, value) '
+                "SELECT url_key, ?, digest, ? FROM pages WHERE url_key = ? AND kind = 'raw'",
+                (name, json.dumps(value), key)
+            )
+
+    # Return the URL the redirect chain of url ended at when it was last fetched,
+    # or None when url did not redirect or the entry is older than canonical_ttl
+    def canonical(self, url):
+        with self._lock:
+            row = self.db.execute('SELECT final_url, recorded_at FROM canonical WHERE url_key = ?',
+                                  (normalize_url(url),)).fetchone()
+        if row is None or time.time() - row[1] > self.canonical_ttl:
+            return None
+        return row[0]
+
+    # Remember that url redirects to final_url
+    def set_canonical(self, url, final_url):
+        with self._lock, self.db:
+            self.db.execute('INSERT OR REPLACE INTO canonical (url_key, final_url, recorded_at) VALUES (?, ?, ?)',
+                            (normalize_url(url), final_url, time.time()))
+
+    # Forget the canonical URL of url, e.g. after fetching it failed
+    def forget_canonical(self, url):
+        with self._lock, self.db:
+            self.db.execute('DELETE FROM canonical WHERE url_key = ?', (normalize_url(url),))
+
+    # Store a fetched page; headers is a list of (name, value) pairs
+    def put(self, url, status, headers, body, kind='raw'):
+        key = normalize_url(url)
+        digest = hashlib.sha256(body).hexdigest()
+        now = time.time()
+        with self._lock, self.db:
+            self.db.execute('INSERT OR IGNORE INTO bodies (digest, body, size) VALUES (?, ?, ?)',
+                            (digest, body, len(body)))
+            self.db.execute(
+                'INSERT OR REPLACE INTO pages (url_key, kind, digest, status, headers, fetched_at, last_access) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (key, kind, digest, status, json.dumps(list(headers)), now, now)
+            )
+
+        self._writes += 1
+        if self._writes % EVICTION_CHECK_INTERVAL == 0:
+            self.evict()
+
+    # Drop least recently used pages until the stored bodies fit in max_bytes
+    def evict(self):
+        with self._lock, self.db:
+            total = self.db.execute('SELECT COALESCE(SUM(size), 0) FROM bodies').fetchone()[0]
+            while total > self.max_bytes:
+                oldest = self.db.execute(
+                    'SELECT url_key, kind FROM pages ORDER BY last_access LIMIT ?',
+                    (EVICTION_CHECK_INTERVAL,)
+                ).fetchall()
+                if not oldest:
+                    break
+                self.db.executemany('DELETE FROM pages WHERE url_key = ? AND kind = ?', oldest)
+                self.db.execute('DELETE FROM bodies WHERE digest NOT IN (SELECT digest FROM pages)')
+                self.db.execute('DELETE FROM derived WHERE digest NOT IN (SELECT digest FROM pages)')
+                total = self.db.execute('SELECT COALESCE(SUM(size), 0) FROM bodies').fetchone()[0]
+                logging.info(f"Page cache evicted {len(oldest)} pages, {total} bytes left")
+
+    def close(self):
+        self.db.close()
+
+
+# Build the name under which a derived value is memoized. Hashing the inputs
+# the value depends on (e.g. a keyword weight table) makes stored values
+# invalid as soon as those inputs change.
+def memo_key(name, *inputs):
+    digest = hashlib.sha1(repr(inputs).encode('utf-8')).hexdigest()[:12]
+    return f"{name}:{digest}"
+
+
+_shared_cache = None
+
+
+# Cache instance shared by everything running in this process, or None when
+# the cache is disabled with WEBINTEL_CACHE=0
+def shared_cache():
+    global _shared_cache
+    if not config.CACHE_ENABLED:
+        return None
+    if _shared_cache is None:
+        _shared_cache = PageCache()
+    return _shared_cache
+
+
+# Close the shared cache's connection, e.g. when a local worker process exits
+def close_shared_cache():
+    global _shared_cache
+    if _shared_cache is not None:
+        _shared_cache.close()
+        _shared_cache = None
+
+
+# A forked child (a local worker, see executor.py) must not use the parent's
+# SQLite connection: it opens its own on first use
+def _forget_after_fork():
+    global _shared_cache
+    _shared_cache = None
+
+
+os.register_at_fork(after_in_child=_forget_after_fork)
@@ -0,0 +1,100 @@
+from dataclasses import asdict, dataclass, field
+
+import pipeline_config as config
+from country_profiles import KEYWORD_TABLES, TRANSLATIONS
+from ecommerce_detector import SOCIAL_PATTERNS, EcommerceDetector, social_columns
+from fetch_engine import fetch_pages
+from html_extract import extract_html
+from keyword_matcher import KeywordMatcher
+from page_cache import memo_key
+
+
+# Everything the decision functions of the pipeline look at, taken from one
+# fetch and one parse of a page: the barber filter, the probability scorers,
+# the cookie/rental check and the social media extraction all read this record.
+@dataclass
+class PageFeatures:
+    url: str
+    status: int = None
+    error: str = None
+    timed_out: bool = False
+    hits: set = field(default_factory=set)  # keywords of country_profiles.KEYWORD_TABLES in the page text
+    term_hits: set = field(default_factory=set)  # casefolded TRANSLATIONS terms in the page text
+    form_actions: list = field(default_factory=list)
+    button_texts: list = field(default_factory=list)
+    footer_text: str = None
+    visible_text: str = ''
+    cookie_headers: list = field(default_factory=list)  # Set-Cookie header values
+    social_links: dict = field(default_factory=dict)  # platform -> distinct profile links
+
+    @property
+    def ok(self):
+        # Same rule as FetchResult.ok
+        return self.error is None and self.status is not None and self.status < 400
+
+    # Keywords found per table of country_profiles.KEYWORD_TABLES, e.g. keyword_hits['NL']
+    @property
+    def keyword_hits(self):
+        return {name: self.hits.intersection(table) for name, table in KEYWORD_TABLES.items()}
+
+    # The (presence, handles) columns analyze_output writes for the social links
+    def social_columns(self):
+        return social_columns(self.social_links)
+
+    # JSON-friendly form, used to memoize the record in the page cache
+    def to_dict(self):
+        value = asdict(self)
+        value['hits'] = sorted(self.hits)
+        value['term_hits'] = sorted(self.term_hits)
+        return value
+
+    @classmethod
+    def from_dict(cls, value):
+        value = dict(value, hits=set(value['hits']), term_hits=set(value['term_hits']))
+        return cls(**value)
+
+
+# Matchers compiled once per process
+_matcher = KeywordMatcher({keyword: 1 for table in KEYWORD_TABLES.values() for keyword in table})
+_detector = EcommerceDetector(TRANSLATIONS)
+
+# Name under which the features of a page are memoized; it changes with any
+# keyword table, pattern or the HTML backend, so stale records are never reused
+FEATURES_MEMO = memo_key('PageFeatures', KEYWORD_TABLES, TRANSLATIONS, SOCIAL_PATTERNS, config.HTML_BACKEND)
+
+
+# Features of a text that is not HTML, such as the markdown crawl4ai returns
+def text_features(url, text):
+    term_hits, social_links = _detector.scan(text)
+    return PageFeatures(url=url, status=200, hits=_matcher.found(text), term_hits=term_hits,
+                        visible_text=text, social_links=social_links)
+
+
+# Features of a fetched page (a fetch_engine.FetchResult)
+def extract_features(page):
+    if page.error is not None:
+        return PageFeatures(url=page.url, status=page.status, error=page.error, timed_out=page.timed_out)
+
+    features = text_features(page.url, page.text)
+    html = extract_html(page.text)
+    features.status = page.status
+    features.form_actions = html.form_actions
+    features.button_texts = html.button_texts
+    features.footer_text = html.footer_text
+    features.visible_text = html.visible_text
+    features.cookie_headers = page.set_cookies
+    return features
+
+
+# What fetch_features memoizes per page; a module-level function, so a parse
+# process pool (WEBINTEL_PARSE_POOL=process) can run it
+def features_record(page):
+    return extract_features(page).to_dict()
+
+
+# Fetch urls and return their PageFeatures in the same order. Features of
+# pages unchanged since an earlier stage or run come from the page cache
+# without parsing the page again.
+def fetch_features(urls, scanner=None, desc="Fetching URLs"):
+    records = fetch_pages(urls, features_record, memo=FEATURES_MEMO, scanner=scanner, desc=desc)
+    return [PageFeatures.from_dict(record) for record in records]
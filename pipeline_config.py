@@ -0,0 +1,100 @@
+import os
+
+# Shared settings for the fetch layer used by the pipeline scripts.
+# Every value can be overridden with an environment variable, so the scripts
+# can still be started with `mpirun -np <ncpus> python3 <script>.py`.
+
+# Number of fetches each rank keeps in flight at the same time, over all the batches it works on
+MAX_IN_FLIGHT = int(os.environ.get('WEBINTEL_MAX_IN_FLIGHT', 200))
+
+# Number of simultaneous connections a rank opens to the same host
+PER_HOST_LIMIT = int(os.environ.get('WEBINTEL_PER_HOST_LIMIT', 4))
+
+# On-disk page cache shared by all stages (see page_cache.py); set WEBINTEL_CACHE=0 to disable it
+CACHE_ENABLED = os.environ.get('WEBINTEL_CACHE', '1') != '0'
+CACHE_PATH = os.environ.get('WEBINTEL_CACHE_PATH', 'page_cache.sqlite')
+CACHE_MAX_BYTES = int(os.environ.get('WEBINTEL_CACHE_MAX_MB', 2048)) * 1024 * 1024
+
+# Cached pages older than this are fetched again
+CACHE_TTL = float(os.environ.get('WEBINTEL_CACHE_TTL_HOURS', 72)) * 3600
+
+# Days a recorded redirect target (canonical URL) is used before the redirect chain is followed again
+CANONICAL_TTL = float(os.environ.get('WEBINTEL_CANONICAL_TTL_DAYS', 30)) * 86400
+
+# Seconds an idle pooled connection is kept open for the next request to the same host
+KEEPALIVE_TIMEOUT = float(os.environ.get('WEBINTEL_KEEPALIVE_TIMEOUT', 30))
+
+# Set WEBINTEL_HTTP2=1 to fetch over HTTP/2 through httpx (needs the h2 package)
+HTTP2 = os.environ.get('WEBINTEL_HTTP2', '0') == '1'
+
+# Per-URL deadlines in seconds: connecting, waiting for the next bytes, and the whole fetch including redirects
+CONNECT_TIMEOUT = float(os.environ.get('WEBINTEL_CONNECT_TIMEOUT', 10))
+READ_TIMEOUT = float(os.environ.get('WEBINTEL_READ_TIMEOUT', 20))
+TOTAL_TIMEOUT = float(os.environ.get('WEBINTEL_TOTAL_TIMEOUT', 60))
+
+# Seconds a rank may spend fetching in total; URLs not done by then are deferred (0 = no limit)
+RANK_TIME_BUDGET = float(os.environ.get('WEBINTEL_RANK_TIME_BUDGET', 0))
+
+# Probability (%) from which a site counts as e-commerce (used by UPDATE*DATA.py)
+DECISION_THRESHOLD = float(os.environ.get('WEBINTEL_DECISION_THRESHOLD', 20))
+
+# Set WEBINTEL_STREAMING=1 to scan pages while they download and stop reading once
+# the verdict is decided; no page is read past WEBINTEL_MAX_BODY_KB in that mode
+STREAMING = os.environ.get('WEBINTEL_STREAMING', '0') == '1'
+MAX_BODY_BYTES = int(os.environ.get('WEBINTEL_MAX_BODY_KB', 5120)) * 1024
+
+# Hostname table written by the DNS pre-pass (python3 dns_cache.py) and read by the fetch layer
+DNS_CACHE_PATH = os.environ.get('WEBINTEL_DNS_CACHE_PATH', 'dns_cache.json')
+DNS_TTL = float(os.environ.get('WEBINTEL_DNS_TTL_HOURS', 24)) * 3600
+DNS_CONCURRENCY = int(os.environ.get('WEBINTEL_DNS_CONCURRENCY', 256))
+
+# Politeness: requests per second each rank sends to one host, and the burst it may send at once
+HOST_RATE = float(os.environ.get('WEBINTEL_HOST_RATE', 2))
+HOST_BURST = float(os.environ.get('WEBINTEL_HOST_BURST', 4))
+
+# Set WEBINTEL_WARC=record to archive every page used into WARC files under WEBINTEL_WARC_DIR,
+# or WEBINTEL_WARC=replay to run offline from those archives only (needs the warcio package)
+WARC_MODE = os.environ.get('WEBINTEL_WARC', '')
+WARC_DIR = os.environ.get('WEBINTEL_WARC_DIR', 'warc')
+
+# Dead hosts (see host_health.py): within a run a host's circuit breaker opens after WEBINTEL_BREAKER_THRESHOLD
+# consecutive DNS, connect, TLS, timeout or 5xx failures; a host whose breaker opened on anything but a timeout,
+# and that never answered in the run, is skipped by later stages for WEBINTEL_DEAD_HOST_TTL_HOURS.
+# WEBINTEL_DEAD_HOSTS=0 turns both off.
+DEAD_HOSTS_ENABLED = os.environ.get('WEBINTEL_DEAD_HOSTS', '1') != '0'
+HOST_HEALTH_PATH = os.environ.get('WEBINTEL_HOST_HEALTH_PATH', 'host_health.sqlite')
+DEAD_HOST_TTL = float(os.environ.get('WEBINTEL_DEAD_HOST_TTL_HOURS', 24)) * 3600
+BREAKER_THRESHOLD = int(os.environ.get('WEBINTEL_BREAKER_THRESHOLD', 3))
+
+# HTML extraction backend of the scorers (see html_extract.py): lxml (default), selectolax, or bs4 for the old html.parser path
+HTML_BACKEND = os.environ.get('WEBINTEL_HTML_BACKEND', 'lxml')
+
+# Set WEBINTEL_PREFILTER=0 to fetch every URL again instead of deciding the ones whose
+# domain already gives them away (barbers, dentists, lawyers...) before the fan-out (see prefilter.py)
+PREFILTER_ENABLED = os.environ.get('WEBINTEL_PREFILTER', '1') != '0'
+
+# URLs a rank fetches and processes at a time; only one batch of pages is held in memory,
+# so a rank's memory does not grow with the length of the input (see work_queue.py)
+BATCH_SIZE = int(os.environ.get('WEBINTEL_BATCH_SIZE', 500))
+
+# How the MPI scripts share out their URLs (see work_queue.py): dynamic (with 3 or more ranks) makes rank 0
+# a coordinator handing out batches of WEBINTEL_DISPATCH_BATCH_SIZE URLs to whichever rank is idle;
+# static splits the URLs by host once at the start
+DISPATCH = os.environ.get('WEBINTEL_DISPATCH', 'dynamic')
+DISPATCH_BATCH_SIZE = int(os.environ.get('WEBINTEL_DISPATCH_BATCH_SIZE', 50))
+
+# Ranks per node that do the work (0: every rank). The fetches are network-bound, so a few ranks per
+# node, each with WEBINTEL_MAX_IN_FLIGHT fetches in flight and a parse pool, use a node better than
+# one rank per core; ranks beyond this number leave right away (see work_queue.working_comm)
+RANKS_PER_NODE = int(os.environ.get('WEBINTEL_RANKS_PER_NODE', 0))
+
+# Pool each rank parses its pages on while its event loop goes on fetching (see fetch_engine.py):
+# thread (default) or process, with WEBINTEL_PARSE_WORKERS workers; 0 parses on the event loop
+PARSE_POOL = os.environ.get('WEBINTEL_PARSE_POOL', 'thread')
+PARSE_WORKERS = int(os.environ.get('WEBINTEL_PARSE_WORKERS', 4))
+
+# Where the stage scripts run their batches (see executor.py): mpi, local (a pool of processes on this
+# machine) or auto (the default: MPI when started with mpirun on more than one rank, local otherwise).
+# The local pool has WEBINTEL_LOCAL_WORKERS processes, 0 for one per core
+EXECUTOR = os.environ.get('WEBINTEL_EXECUTOR', 'auto')
+LOCAL_WORKERS = int(os.environ.get('WEBINTEL_LOCAL_WORKERS', 0))
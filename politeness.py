@@ -0,0 +1,97 @@
+import asyncio
+import time
+from collections import OrderedDict, deque
+
+import pipeline_config as config
+from dns_cache import hostname
+
+
+# Hands out URLs to the fetch workers one host at a time in round-robin order,
+# so consecutive requests go to different origins. Every host has a token
+# bucket refilled at rate requests per second and holding at most burst
+# tokens; a URL is only handed out when its host has a token. The number of
+# workers calling next() is the global concurrency cap.
+class HostScheduler:
+    def __init__(self, rate=None, burst=None):
+        self.rate = rate or config.HOST_RATE
+        self.burst = burst or config.HOST_BURST
+        self.queues = OrderedDict()  # host -> deque of (item, enqueued_at)
+        self.buckets = {}  # host -> [tokens, last_refill]
+        self.pending = 0
+        self.peak_depth = 0
+        self.dispatched = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def add(self, item, host):
+        self.queues.setdefault(host, deque()).append((item, time.monotonic()))
+        self.pending += 1
+        self.peak_depth = max(self.peak_depth, self.pending)
+
+    # Take a token for host; returns 0 on success or the seconds until one is available
+    def _take_token(self, host, now):
+        tokens, last_refill = self.buckets.get(host, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - last_refill) * self.rate)
+        if tokens >= 1:
+            self.buckets[host] = [tokens - 1, now]
+            return 0
+        self.buckets[host] = [tokens, now]
+        return (1 - tokens) / self.rate
+
+    # Next item whose host may be contacted now, waiting if every host is
+    # throttled; returns None once all queues are empty
+    async def next(self):
+        while self.queues:
+            now = time.monotonic()
+            retry_in = None
+            for host in list(self.queues):
+                delay = self._take_token(host, now)
+                if delay:
+                    retry_in = delay if retry_in is None else min(retry_in, delay)
+                    continue
+
+                queue = self.queues[host]
+                item, enqueued_at = queue.popleft()
+                if queue:
+                    self.queues.move_to_end(host)
+                else:
+                    del self.queues[host]
+
+                wait = now - enqueued_at
+                self.pending -= 1
+                self.dispatched += 1
+                self.total_wait += wait
+                self.max_wait = max(self.max_wait, wait)
+                return item
+
+            await asyncio.sleep(retry_in)
+        return None
+
+    @property
+    def hosts(self):
+        return len(self.queues)
+
+    def summary(self):
+        mean_wait = self.total_wait / self.dispatched if self.dispatched else 0.0
+        return (f"Scheduler: {self.dispatched} requests, peak queue depth {self.peak_depth}, "
+                f"mean wait {mean_wait:.2f}s, max wait {self.max_wait:.2f}s")
+
+
+# Split URLs into size chunks so that all URLs of a host land on the same rank,
+# where that host's token bucket then covers every request made to it.
+# The largest hosts are placed first, each on the currently lightest rank;
+# every chunk keeps the input order of its URLs. url_of gives the URL of an
+# item when urls holds something else, e.g. (country, url) pairs.
+def split_by_host(urls, size, url_of=None):
+    positions = {}
+    for position, url in enumerate(urls):
+        positions.setdefault(hostname(url_of(url) if url_of else url), []).append(position)
+
+    loads = [0] * size
+    assigned = [[] for _ in range(size)]
+    for host_positions in sorted(positions.values(), key=len, reverse=True):
+        rank = loads.index(min(loads))
+        assigned[rank].extend(host_positions)
+        loads[rank] += len(host_positions)
+
+    return [[urls[position] for position in sorted(chunk)] for chunk in assigned]
@@ -0,0 +1,58 @@
+import argparse
+import logging
+import re
+
+import pandas as pd
+
+from country_profiles import URL_RULES
+
+# Input CSV of each country, URLs in the second column
+INPUT_FILES = {
+    'DE': 'DEinput.csv',
+    'AT': 'ATinput.csv',
+    'NL': 'NLinput.csv',
+    'PL': 'PLinput.csv',
+}
+
+
+# Run on rank 0 over the whole input before any MPI fan-out: the URL rules of
+# a country (country_profiles.URL_RULES) are compiled into one regex and
+# matched against every URL at once with pandas' vectorized string methods.
+# Returns a boolean Series, True for URLs that are decided as not e-commerce
+# without fetching them.
+def decided_non_ecommerce(urls, country):
+    scope, tokens = URL_RULES[country]
+    urls = pd.Series(urls, dtype=str)
+    if scope == 'domain':
+        urls = urls.str.split('//').str[-1].str.split('/').str[0]  # Same domain split as the barber filters
+    pattern = '|'.join(re.escape(token) for token in tokens)
+    return urls.str.contains(pattern, regex=True)
+
+
+# Split urls into the ones decided from the URL alone and the uncertain rest,
+# which still have to be fetched, and log the fetches saved
+def prefilter(urls, country):
+    decided = decided_non_ecommerce(urls, country).tolist()
+    non_ecommerce = [url for url, is_decided in zip(urls, decided) if is_decided]
+    uncertain = [url for url, is_decided in zip(urls, decided) if not is_decided]
+    logging.info(f"Prefilter {country}: {len(non_ecommerce)} of {len(urls)} URLs decided as not e-commerce "
+                 f"from the URL alone, {len(non_ecommerce)} fetches saved")
+    return non_ecommerce, uncertain
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Report how many fetches the URL prefilter saves per country.")
+    parser.add_argument('countries', nargs='*', default=sorted(INPUT_FILES), help="Countries to report (default: all)")
+    args = parser.parse_args()
+
+    rows = []
+    for country in args.countries:
+        urls = pd.read_csv(INPUT_FILES[country]).iloc[:, 1].tolist()
+        decided = int(decided_non_ecommerce(urls, country).sum())
+        rows.append({'country': country, 'URLs': len(urls), 'decided without fetching': decided,
+                     'fetches saved (%)': 100 * decided / len(urls) if urls else 0, 'still fetched': len(urls) - decided})
+    print(pd.DataFrame(rows).to_string(index=False, float_format=lambda value: f'{value:.1f}'))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+import argparse
+import csv
+import logging
+import os
+
+# How far back from the end of a file to look for the last complete line
+TAIL_BYTES = 1 << 20
+
+
+# Cut a line left unfinished by a run that died while writing it off the end of
+# the file, so appending goes on after the last complete line
+def drop_partial_line(path):
+    with open(path, 'rb+') as file:
+        size = file.seek(0, os.SEEK_END)
+        file.seek(max(0, size - TAIL_BYTES))
+        tail = file.read()
+        end = tail.rfind(b'\n')
+        if end != len(tail) - 1:
+            file.truncate(size - len(tail) + end + 1)
+
+
+# Output CSV written on rank 0 while a run is going: the rows of every batch
+# are appended and flushed as soon as the batch result arrives, so nothing is
+# kept in memory and a run that stops early leaves the rows of all finished
+# batches on disk in the usual format. With resume the rows of the earlier run
+# are kept and the new ones appended after them; kept tells whether there were any.
+class CsvStream:
+    def __init__(self, path, columns, resume=False):
+        self.path = path
+        self.columns = list(columns)
+        self.rows = 0
+        if resume and os.path.exists(path):
+            drop_partial_line(path)
+        self.kept = resume and os.path.exists(path) and os.path.getsize(path) > 0
+        self.file = open(path, 'a' if self.kept else 'w', newline='')
+        self.writer = csv.writer(self.file, lineterminator='\n')  # Same line ends as pandas' to_csv
+        if not self.kept:
+            self.writer.writerow(self.columns)
+            self.file.flush()
+
+    # Rows are sequences in the order of the columns
+    def append(self, rows):
+        rows = list(rows)
+        self.writer.writerows(rows)
+        self.file.flush()
+        self.rows += len(rows)
+
+    def close(self):
+        self.file.close()
+
+
+# Append-only record of the items a run has finished, one key per line. Rank 0
+# adds the items of a batch once the batch's results are on disk, so --resume
+# can skip everything listed. The keys of a batch go out in one write, so the
+# bookkeeping costs nothing next to fetching the batch.
+class Checkpoint:
+    def __init__(self, path, resume=False, key=None):
+        self.path = path
+        self.key = key or (lambda item: item)  # What identifies an item, e.g. its URL
+        self.done = set()
+        if resume and os.path.exists(path):
+            drop_partial_line(path)
+            with open(path) as file:
+                self.done = set(file.read().splitlines())
+        self.file = open(path, 'a' if resume else 'w')
+
+    # The items an earlier run has not finished, in their order
+    def remaining(self, items):
+        remaining = [item for item in items if str(self.key(item)) not in self.done]
+        if self.done:
+            logging.info(f"Resuming from '{self.path}': {len(items) - len(remaining)} of {len(items)} done by an earlier run")
+        return remaining
+
+    def add(self, items):
+        self.file.write(''.join(f"{self.key(item)}\n" for item in items))
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+# Whether the stage script was started with --resume: skip what the checkpoint
+# of an earlier run lists and append to its output files instead of starting over
+def resume_requested(description):
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument('--resume', action='store_true',
+                        help="Skip the URLs an interrupted earlier run finished and append to its output files")
+    return parser.parse_args().resume
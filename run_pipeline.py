@@ -0,0 +1,147 @@
+import argparse
+import importlib
+import logging
+import time
+from functools import partial
+
+from executor import make_executor
+from page_features import fetch_features
+from result_stream import Checkpoint
+
+# Set up logging configuration; the per-country scripts imported below log here as well
+logging.basicConfig(
+    filename='pipeline.log',
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+
+# Script of each stage per country. Every one provides load_urls() -> (context, urls),
+# make_scanner (None when the stage decides without fetching), process_chunk(urls, pages),
+# open_results(context, resume) -> outputs, save_batch(outputs, batch_result),
+# finish_results(context, outputs) and its CHECKPOINT_FILE, and still runs on its own
+# with mpirun or without (the two share checkpoints, so either can resume a run of the other).
+STAGES = {
+    'barbers': 'GETRIDOFBARBERS_{country}DATASET',
+    'probabilities': 'ParallelProbability{country}',
+}
+
+COUNTRIES = ['DE', 'AT', 'NL', 'PL']
+
+
+# Fetch the URLs of a batch of (country, url) pairs of every country that needs
+# its pages at once, each with its country's scanner, and let each country's
+# script process its own URLs; returns {country: process_chunk result}. A URL
+# in the input of several countries is fetched once and read in full, since
+# each country's scanner would stop reading at its own keywords.
+def process_batch(modules, items):
+    fetched = [(country, url) for country, url in items if modules[country].make_scanner is not None]
+    countries_of = {}
+    for country, url in fetched:
+        countries_of.setdefault(url, []).append(country)
+
+    def scanner(url):
+        countries = countries_of[url]
+        return modules[countries[0]].make_scanner(url) if len(set(countries)) == 1 else None
+
+    urls = list(countries_of)
+    pages = dict(zip(urls, fetch_features(urls, scanner=scanner, desc=None)))
+    pages_by_country = {}
+    for country, url in fetched:
+        pages_by_country.setdefault(country, []).append(pages[url])
+
+    results = {}
+    for country, module in modules.items():
+        urls = [url for item_country, url in items if item_country == country]
+        country_pages = pages_by_country.get(country, []) if module.make_scanner is not None else None
+        results[country] = module.process_chunk(urls, country_pages)
+    return results
+
+
+# Run one stage for several countries on one pool of processes (MPI ranks or local
+# processes, see executor.py). Rank 0 reads the input of every country, and the
+# (country, url) pairs of all of them are shared out over the ranks together;
+# each rank fetches the URLs of every country it is given together, so no rank
+# idles while a big country is still running.
+# The results are handed back to each country's script as they arrive, which writes its usual files.
+# Returns the number of URLs processed on rank 0.
+def run_stage(executor, stage, countries, resume=False):
+    rank = executor.rank
+    size = executor.size
+    modules = {country: importlib.import_module(STAGES[stage].format(country=country)) for country in countries}
+
+    if rank == 0:
+        start_time = time.time()
+        contexts = {}
+        outputs = {}
+        checkpoints = {}
+        items = []
+        for country, module in modules.items():
+            contexts[country], urls = module.load_urls()
+            # With --resume the URLs an earlier run finished are skipped and its output files appended to
+            checkpoints[country] = Checkpoint(module.CHECKPOINT_FILE, resume=resume)
+            urls = checkpoints[country].remaining(urls)
+            outputs[country] = module.open_results(contexts[country], resume)
+            items += [(country, url) for url in urls]
+            logging.info(f"{stage} {country}: {len(urls)} URLs")
+    else:
+        contexts = None
+        outputs = None
+        checkpoints = None
+        items = None
+
+    # Append each country's part of a batch result to that country's output files on rank 0
+    def save_batch(result):
+        for country, module in modules.items():
+            module.save_batch(outputs[country], result[country])
+
+    # Add the finished URLs of a batch to their countries' checkpoints
+    def add_to_checkpoints(batch):
+        for country, checkpoint in checkpoints.items():
+            checkpoint.add(url for item_country, url in batch if item_country == country)
+
+    # The (country, url) pairs of every country share the processes: handed out in small batches
+    # to idle ranks (WEBINTEL_DISPATCH=dynamic) or split by host once (static); all URLs of a host
+    # are fetched by one rank at a time, whatever their country (see work_queue.py). Batch results
+    # reach rank 0 as soon as they are done and are written out right away.
+    executor.run_batches(items, partial(process_batch, modules), url_of=lambda item: item[1], on_result=save_batch,
+                         on_done=add_to_checkpoints, desc=stage)
+
+    if rank == 0:
+        for country, module in modules.items():
+            checkpoints[country].close()
+            module.finish_results(contexts[country], outputs[country])
+        elapsed = time.time() - start_time
+        logging.info(f"{stage}: {len(items)} URLs of {', '.join(countries)} on {size} processes in {elapsed:.1f}s")
+        print(f"{stage}: {len(items)} URLs of {', '.join(countries)} on {size} processes in {elapsed:.1f}s")
+        return len(items)
+
+def main():
+    parser = argparse.ArgumentParser(description="Run pipeline stages for several countries on one pool of processes.")
+    parser.add_argument('countries', nargs='*', metavar='COUNTRY', help=f"Countries to process: {', '.join(COUNTRIES)} (default: all)")
+    parser.add_argument('--stage', choices=list(STAGES) + ['all'], default='all',
+                        help="Stage to run; 'all' runs the barber filter and then the probabilities (default)")
+    parser.add_argument('--resume', action='store_true',
+                        help="Skip the URLs an interrupted earlier run finished and append to its output files")
+    args = parser.parse_args()
+    countries = args.countries or COUNTRIES
+    unknown = set(countries) - set(COUNTRIES)
+    if unknown:
+        parser.error(f"Unknown countries: {sorted(unknown)}")
+
+    # MPI ranks under mpirun, every local core otherwise; with WEBINTEL_RANKS_PER_NODE only
+    # that many ranks per node take part
+    executor = make_executor()
+    if executor is None:
+        return
+    stages = list(STAGES) if args.stage == 'all' else [args.stage]
+    resume = args.resume
+    for stage in stages:
+        processed = run_stage(executor, stage, countries, resume)
+        # A stage that still had URLs to do changes the input of the next ones, whose checkpoints
+        # are then from an older run: they start over
+        if processed:
+            resume = False
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+import codecs
+
+import requests
+
+from keyword_matcher import compile_keywords
+
+
+# Scans a response body chunk by chunk while it downloads and tells the fetch
+# layer when reading more cannot change the verdict: either every weighted
+# keyword has been seen, or the weights found so far reach stop_score.
+# Keywords split across two chunks are caught by keeping the tail of the
+# previous chunk.
+class KeywordScanner:
+    def __init__(self, weights, stop_score=None):
+        self.weights = weights
+        self.stop_score = stop_score
+        self.found = set()
+        self.score = 0
+        self._tail = ''
+        self._overlap = max((len(keyword) for keyword in weights), default=1) - 1
+        self._decoder = None
+        self._matcher = compile_keywords(weights)
+
+    # Pick the text decoder from the Content-Type header, as requests would
+    def start(self, content_type):
+        encoding = requests.utils.get_encoding_from_headers({'content-type': content_type or ''}) or 'utf-8'
+        try:
+            self._decoder = codecs.getincrementaldecoder(encoding)(errors='replace')
+        except LookupError:
+            self._decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+
+    # Scan the next chunk of bytes; returns True once the verdict is decided
+    def feed(self, chunk):
+        if self._decoder is None:
+            self.start(None)
+        text = self._tail + self._decoder.decode(chunk)
+        for keyword in self._matcher.found(text) - self.found:
+            self.found.add(keyword)
+            self.score += self.weights[keyword]
+        self._tail = text[-self._overlap:] if self._overlap else ''
+        return self.done
+
+    @property
+    def done(self):
+        if len(self.found) == len(self.weights):
+            return True
+        return self.stop_score is not None and self.score >= self.stop_score
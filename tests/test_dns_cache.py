@@ -0,0 +1,91 @@
+import asyncio
+import json
+import socket
+
+import pytest
+
+import fetch_engine
+from dns_cache import CachedResolver, DnsCache, NameNotFound
+
+ADDRESSES = {'shop.example': [[socket.AF_INET, '192.0.2.10']]}
+
+
+# Resolve function answering from ADDRESSES, counting the lookups it was asked for
+class FakeResolve:
+    def __init__(self):
+        self.asked = []
+
+    async def __call__(self, host):
+        self.asked.append(host)
+        if host not in ADDRESSES:
+            raise NameNotFound(host)
+        return ADDRESSES[host]
+
+
+def make_dns(tmp_path, ttl=3600):
+    return DnsCache(path=str(tmp_path / 'dns_cache.json'), ttl=ttl, resolve=FakeResolve())
+
+
+def test_entries_expire_after_ttl(tmp_path):
+    dns = make_dns(tmp_path, ttl=60)
+    asyncio.run(dns.prefetch(['shop.example', 'gone.example']))
+    assert dns.lookup('shop.example')['addresses'] == ADDRESSES['shop.example']
+    assert dns.is_nxdomain('gone.example')
+
+    asyncio.run(dns.prefetch(['shop.example']))
+    assert dns.resolve.asked == ['gone.example', 'shop.example']
+
+    for entry in dns.entries.values():
+        entry['resolved_at'] -= 120
+    assert dns.lookup('shop.example') is None
+    assert not dns.is_nxdomain('gone.example')
+    asyncio.run(dns.prefetch(['shop.example']))
+    assert dns.resolve.asked.count('shop.example') == 2
+
+
+def test_temporary_failures_are_not_remembered(tmp_path):
+    dns = make_dns(tmp_path)
+
+    async def failing(host):
+        raise socket.gaierror(socket.EAI_AGAIN, "Temporary failure in name resolution")
+
+    dns.resolve = failing
+    assert asyncio.run(dns.resolve_host('shop.example')) is None
+    assert dns.lookup('shop.example') is None
+
+
+def test_table_round_trips_through_json(tmp_path):
+    dns = make_dns(tmp_path)
+    asyncio.run(dns.prefetch(['shop.example', 'gone.example']))
+    dns.save()
+    loaded = DnsCache(path=dns.path, ttl=3600, resolve=FakeResolve())
+    assert loaded.entries == json.loads(json.dumps(dns.entries))
+    assert loaded.lookup('shop.example')['addresses'] == ADDRESSES['shop.example']
+    assert loaded.is_nxdomain('gone.example')
+
+
+def test_resolver_raises_gaierror_for_missing_names(tmp_path):
+    dns = make_dns(tmp_path)
+    resolver = CachedResolver(dns)
+    assert asyncio.run(resolver.resolve('shop.example', 443))[0]['host'] == '192.0.2.10'
+    with pytest.raises(socket.gaierror):
+        asyncio.run(resolver.resolve('gone.example', 443))
+
+
+# Client that fails the test if any connection is attempted
+class NoConnections:
+    async def get(self, *args, **kwargs):
+        raise AssertionError("a connection was attempted")
+
+
+def test_nxdomain_host_fails_without_a_connection(tmp_path, monkeypatch):
+    dns = make_dns(tmp_path)
+    asyncio.run(dns.prefetch(['gone.example']))
+    monkeypatch.setattr(fetch_engine, 'shared_dns', lambda: dns)
+    monkeypatch.setattr(fetch_engine, 'shared_cache', lambda: None)
+    monkeypatch.setattr(fetch_engine, 'shared_health', lambda: None)
+    monkeypatch.setattr(fetch_engine, 'STATS', fetch_engine.Counter())
+
+    page = asyncio.run(fetch_engine._fetch_one(NoConnections(), 'http://gone.example/shop', timeout=5))
+    assert not page.ok and 'NXDOMAIN' in page.error and not page.timed_out
+    assert fetch_engine.STATS['nxdomain'] == 1
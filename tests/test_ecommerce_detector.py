@@ -0,0 +1,62 @@
+import re
+
+import pytest
+
+from country_profiles import TRANSLATIONS
+from ecommerce_detector import SOCIAL_PATTERNS, EcommerceDetector
+
+# Crawled markdown of representative pages, with the verdict analyze_output gave
+PAGES = {
+    'checkout form': ("# Mode Müller\n[Zur Kasse](https://mode-mueller.de/checkout)\n", True),
+    'buy button': ("## Winterjacke\n89,95 €\n**In den Warenkorb**\n", True),
+    'powered by footer': ("Welcome to our workshop.\n\nPowered by WooCommerce", True),
+    'polish shop': ("KSIĄŻKA kucharska – zamów teraz", True),
+    'social links only': ("Follow us: https://Twitter.com/ModeMueller and "
+                          "https://www.youtube.com/channel/UC-abc_123 and https://www.tiktok.com/@mode.mueller\n"
+                          "https://linkedin.com/in/jan-mueller", False),
+    'none of these': ("# Friseursalon Wagner\nTermine nach Vereinbarung.\nTelefon 030 1234567", False),
+}
+
+
+# analyze_output as SerialTestAI4.py and ParallelTestChar4AI.py had it
+def analyze_output(text):
+    is_ecommerce = any(
+        term in text.lower() for word in TRANSLATIONS.keys()
+        for term in [word] + [TRANSLATIONS[word][lang].lower() for lang in TRANSLATIONS[word]]
+    )
+    social_media = {
+        platform: re.search(pattern, text, re.IGNORECASE)
+        for platform, pattern in {
+            'Twitter': r'twitter\.com/([A-Za-z0-9_]+)',
+            'YouTube': r'youtube\.com/(channel|user)/([A-Za-z0-9_-]+)',
+            'TikTok': r'tiktok\.com/@([A-Za-z0-9_.]+)',
+            'LinkedIn': r'linkedin\.com/in/([A-Za-z0-9_-]+)'
+        }.items()
+    }
+    social_media_presence = {platform: ("Yes" if match else "No") for platform, match in social_media.items()}
+    social_media_handles = {f"{platform}_value": (match.group(0) if match else "") for platform, match in social_media.items()}
+    return is_ecommerce, social_media_presence, social_media_handles
+
+
+@pytest.fixture(scope='module')
+def detector():
+    return EcommerceDetector(TRANSLATIONS)
+
+
+@pytest.mark.parametrize('page', sorted(PAGES))
+def test_same_answer_as_analyze_output(detector, page):
+    text, verdict = PAGES[page]
+    is_ecommerce, presence, handles = detector.analyze(text)
+    old_is_ecommerce, old_presence, old_handles = analyze_output(text)
+    assert is_ecommerce == old_is_ecommerce == verdict
+    assert presence == old_presence
+    # The old columns held the first handle only; every distinct one is listed now
+    assert {column: value.split('; ')[0] for column, value in handles.items()} == old_handles
+
+
+def test_every_distinct_handle_is_listed(detector):
+    text = "twitter.com/a_shop twitter.com/b_shop TWITTER.com/a_shop Straße twitter.com/C_shop"
+    _, presence, handles = detector.analyze(text)
+    assert presence['Twitter'] == 'Yes' and presence['TikTok'] == 'No'
+    assert handles['Twitter_value'] == 'twitter.com/a_shop; twitter.com/b_shop; TWITTER.com/a_shop; twitter.com/C_shop'
+    assert set(handles) == {f"{platform}_value" for platform in SOCIAL_PATTERNS}
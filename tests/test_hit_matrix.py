@@ -0,0 +1,68 @@
+import numpy as np
+import pytest
+from bs4 import BeautifulSoup
+
+from country_profiles import KEYWORDS, URL_BONUSES
+from fetch_engine import _make_result
+from hit_matrix import HitMatrix
+from page_features import extract_features
+
+PAGES = {
+    'http://cityhotel-wien.example/': """<html><body><h1>Online-Shop</h1><p>Booking and payment online, cart</p>
+        <form action="/checkout"><button>Add to cart</button></form></body></html>""",
+    'http://pension.example/zimmer': """<html><body><p>Reservierung service</p><button>Buy now</button></body></html>""",
+    'http://frisoer.example/': """<html><body><p>Termine nach Vereinbarung</p>
+        <form action="/contact"><button>Send</button></form></body></html>""",
+    'http://hotel.example/': "<html><body></body></html>",
+}
+
+
+# The scoring loop of the original calculate_probability, on one page
+def calculate_probability(url, text, keywords, url_bonuses):
+    keyword_matches = sum(bonus for part, bonus in url_bonuses.items() if part in url)
+    soup = BeautifulSoup(text, 'html.parser')
+    if any('checkout' in form.get('action', '') for form in soup.find_all('form')):
+        keyword_matches += 5
+    if any('buy' in button.text.lower() or 'add to cart' in button.text.lower() for button in soup.find_all('button')):
+        keyword_matches += 5
+    keyword_matches += sum(weight for keyword, weight in keywords.items() if keyword in text)
+    total_weight = sum(keywords.values())
+    return (keyword_matches / total_weight) * 100 if total_weight > 0 else 0
+
+
+def page_matrix():
+    pages = [extract_features(_make_result(url, 200, [('Content-Type', 'text/html; charset=utf-8')], text.encode()))
+             for url, text in PAGES.items()]
+    return HitMatrix.from_features(pages)
+
+
+@pytest.mark.parametrize('country', sorted(KEYWORDS))
+def test_score_matches_calculate_probability(country):
+    expected = [calculate_probability(url, text, KEYWORDS[country], URL_BONUSES[country]) for url, text in PAGES.items()]
+    np.testing.assert_allclose(page_matrix().score(KEYWORDS[country], URL_BONUSES[country]), expected)
+
+
+def test_saved_and_streamed_hits_score_the_same(tmp_path):
+    matrix = page_matrix()
+    matrix.save(tmp_path / 'hits.npz')
+    with open(tmp_path / 'hits.csv', 'w') as file:
+        file.write('URL,Hits\n')
+        file.writelines(f"{url},{hits}\n" for url, hits in matrix.hit_rows())
+    expected = matrix.score_country('AT')
+    for copy in [HitMatrix.load(tmp_path / 'hits.npz'), HitMatrix.read_hit_rows(tmp_path / 'hits.csv')]:
+        assert copy.urls == matrix.urls
+        np.testing.assert_allclose(copy.score_country('AT'), expected)
+
+
+def test_reweighting_a_keyword_changes_only_its_pages():
+    matrix = page_matrix()
+    weights = dict(KEYWORDS['DE'], cart=KEYWORDS['DE']['cart'] + 10)
+    # Probabilities are in percent of the total weight; back to matched weight
+    matched = matrix.score(weights, URL_BONUSES['DE']) * sum(weights.values()) / 100
+    before = matrix.score_country('DE') * sum(KEYWORDS['DE'].values()) / 100
+    np.testing.assert_allclose(matched - before, [10, 0, 0, 0], atol=1e-9)
+
+
+def test_unknown_keyword_is_rejected():
+    with pytest.raises(ValueError):
+        page_matrix().score({'not a keyword anywhere': 1}, {})
@@ -0,0 +1,56 @@
+from host_health import HostHealth
+
+
+def make_health(tmp_path, threshold=3):
+    return HostHealth(path=str(tmp_path / 'host_health.sqlite'), ttl=3600, threshold=threshold)
+
+
+def test_breaker_opens_only_at_threshold(tmp_path):
+    health = make_health(tmp_path)
+    health.record_failure('down.example', 'connect')
+    health.record_failure('down.example', 'connect')
+    assert health.blocked('down.example') is None
+    health.record_failure('down.example', 'connect')
+    assert health.blocked('down.example') == 'connect'
+
+
+def test_success_resets_the_count(tmp_path):
+    health = make_health(tmp_path)
+    for failure in ['5xx', '5xx', None, '5xx', '5xx']:
+        if failure is None:
+            health.record_success('flaky.example')
+        else:
+            health.record_failure('flaky.example', failure)
+    assert health.blocked('flaky.example') is None
+
+
+def test_failures_below_threshold_are_not_persisted(tmp_path):
+    health = make_health(tmp_path)
+    health.record_failure('slow.example', '5xx')
+    health.record_failure('slow.example', 'connect')
+    health.close()
+    assert make_health(tmp_path).blocked('slow.example') is None
+
+
+def test_tripped_host_is_persisted(tmp_path):
+    health = make_health(tmp_path)
+    for _ in range(3):
+        health.record_failure('down.example', 'dns')
+    health.close()
+    assert make_health(tmp_path).blocked('down.example') == 'dns'
+
+
+def test_timeouts_open_the_breaker_but_are_not_persisted(tmp_path):
+    health = make_health(tmp_path)
+    for _ in range(3):
+        health.record_failure('slow.example', 'timeout')
+    assert health.blocked('slow.example') == 'timeout'
+    health.close()
+    # A re-run, e.g. with a longer deadline for the deferred URLs, fetches the host again
+    assert make_health(tmp_path).blocked('slow.example') is None
+
+
+def test_other_errors_say_nothing_about_the_host(tmp_path):
+    health = make_health(tmp_path, threshold=1)
+    health.record_failure('page.example', '404')
+    assert health.blocked('page.example') is None
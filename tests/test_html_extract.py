@@ -0,0 +1,49 @@
+import pytest
+
+from html_extract import BACKENDS, extract_html
+
+PAGES = {
+    'shop': """<!DOCTYPE html><html><head><title>Shop</title><style>body { color: red }</style></head>
+        <body><h1>Online-Shop</h1><script>var cart = [];</script>
+        <form action="/checkout"><input name="q"><button type="submit">Add to <b>cart</b></button></form>
+        <form><button>Search</button></form>
+        <footer><p>Powered by Shopware</p> &copy; 2024</footer></body></html>""",
+    'no footer': """<html><body><p>Termine nach Vereinbarung</p><form action="/contact"></form></body></html>""",
+    'unclosed tags': """<html><body><div><p>Buy now<p>cheap
+        <form action='/cart/add'><button>Buy</button>
+        <footer>Shop by <a href="/">us</a>""",
+    'stray end tags': """<body></div><p>Reservierung</span> online</p></form>
+        <button>Book</button></button><footer>first</footer><footer>second</footer></body>""",
+    'text only': "Just some text without any markup",
+}
+
+# Module each optional backend needs; it is compared with bs4 when installed
+OTHER_BACKENDS = {'lxml': 'lxml.etree', 'selectolax': 'selectolax.lexbor'}
+
+
+def squeeze(text):
+    return ' '.join(text.split()) if text is not None else None
+
+
+def comparable(features):
+    return (features.form_actions, [squeeze(text) for text in features.button_texts],
+            squeeze(features.footer_text), squeeze(features.visible_text))
+
+
+@pytest.mark.parametrize('backend', sorted(OTHER_BACKENDS))
+@pytest.mark.parametrize('page', sorted(PAGES))
+def test_backend_matches_bs4(backend, page):
+    pytest.importorskip(OTHER_BACKENDS[backend])
+    assert comparable(BACKENDS[backend](PAGES[page])) == comparable(BACKENDS['bs4'](PAGES[page]))
+
+
+def test_bs4_reads_the_shop_page():
+    features = BACKENDS['bs4'](PAGES['shop'])
+    assert features.form_actions == ['/checkout', '']
+    assert [squeeze(text) for text in features.button_texts] == ['Add to cart', 'Search']
+    assert squeeze(features.footer_text) == 'Powered by Shopware © 2024'
+    assert 'var cart' not in features.visible_text
+
+
+def test_unknown_backend_falls_back_to_bs4():
+    assert extract_html(PAGES['shop'], backend='missing') == BACKENDS['bs4'](PAGES['shop'])
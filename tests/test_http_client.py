@@ -0,0 +1,39 @@
+import socket
+import ssl
+from types import SimpleNamespace
+
+import aiohttp
+import pytest
+
+import http_client
+from http_client import _aiohttp_failure
+
+KEY = SimpleNamespace(host='shop.example', port=443, ssl=True)
+
+
+def connector_error(os_error):
+    return aiohttp.ClientConnectorError(KEY, os_error)
+
+
+# Also as on aiohttp versions without ClientConnectorDNSError, like the pinned 3.10
+@pytest.fixture(params=['installed', 'without ClientConnectorDNSError'])
+def aiohttp_version(request, monkeypatch):
+    if request.param != 'installed':
+        monkeypatch.setattr(http_client, 'DNS_ERROR', ())
+
+
+def test_unresolved_name_is_dns(aiohttp_version):
+    assert _aiohttp_failure(connector_error(socket.gaierror(socket.EAI_NONAME, "Name or service not known"))) == 'dns'
+
+
+def test_refused_connection_is_connect(aiohttp_version):
+    assert _aiohttp_failure(connector_error(ConnectionRefusedError(111, "Connection refused"))) == 'connect'
+
+
+def test_tls_error_is_tls(aiohttp_version):
+    error = aiohttp.ClientConnectorCertificateError(KEY, ssl.SSLCertVerificationError("certificate verify failed"))
+    assert _aiohttp_failure(error) == 'tls'
+
+
+def test_other_client_errors_say_nothing_about_the_host(aiohttp_version):
+    assert _aiohttp_failure(aiohttp.ServerDisconnectedError()) is None
@@ -0,0 +1,26 @@
+import pytest
+
+from country_profiles import KEYWORDS
+from keyword_matcher import KeywordMatcher
+
+PAGES = [
+    "<html><body>In den Warenkorb legen, zur Kasse gehen</body></html>",
+    "Dodaj do koszyka | Zamów teraz | Regulamin sklepu",
+    "winkelwagen bestellen afrekenen",
+    "Nothing to buy here, just a barber shop",
+    "",
+]
+
+
+@pytest.mark.parametrize('country', sorted(KEYWORDS))
+def test_matcher_agrees_with_the_per_keyword_scan(country):
+    weights = KEYWORDS[country]
+    matcher = KeywordMatcher(weights)
+    for text in PAGES + [' '.join(weights)]:
+        assert matcher.find(text) == {keyword: keyword in text for keyword in weights}
+        assert matcher.score(text) == sum(weight for keyword, weight in weights.items() if keyword in text)
+
+
+def test_overlapping_keywords_are_all_found():
+    matcher = KeywordMatcher({'cart': 1, 'add to cart': 2, 'to c': 3})
+    assert matcher.found("please add to cart") == {'cart', 'add to cart', 'to c'}
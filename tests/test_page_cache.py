@@ -0,0 +1,98 @@
+import asyncio
+import time
+
+import pytest
+
+import fetch_engine
+from http_client import HttpResponse
+from page_cache import PageCache
+
+HEADERS = [('Content-Type', 'text/html'), ('ETag', '"v1"')]
+
+
+def make_cache(tmp_path, ttl=3600):
+    return PageCache(path=str(tmp_path / 'page_cache.sqlite'), ttl=ttl)
+
+
+# Client answering every request with the next of responses, remembering the request headers
+class FakeClient:
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.requests = []
+
+    async def get(self, url, headers=None, scanner=None, max_bytes=None):
+        self.requests.append(headers)
+        return self.responses.pop(0)
+
+
+class NoNxdomain:
+    def is_nxdomain(self, host):
+        return False
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    cache = make_cache(tmp_path)
+    monkeypatch.setattr(fetch_engine, 'shared_cache', lambda: cache)
+    monkeypatch.setattr(fetch_engine, 'shared_dns', NoNxdomain)
+    monkeypatch.setattr(fetch_engine, 'shared_health', lambda: None)
+    monkeypatch.setattr(fetch_engine, 'shared_archive', lambda: None)
+    return cache
+
+
+def fetch(client, url='http://shop.example/'):
+    return asyncio.run(fetch_engine._fetch_one(client, url, timeout=5))
+
+
+def test_fresh_entry_is_served_until_ttl(tmp_path):
+    cache = make_cache(tmp_path, ttl=60)
+    cache.put('http://Shop.example:80/', 200, HEADERS, b'<html>shop</html>')
+    assert cache.get('http://shop.example')['body'] == b'<html>shop</html>'
+    cache.db.execute('UPDATE pages SET fetched_at = ?', (time.time() - 120,))
+    assert cache.get('http://shop.example/') is None
+    stale = cache.get('http://shop.example/', allow_stale=True)
+    assert not stale['fresh']
+    cache.touch('http://shop.example/')
+    assert cache.get('http://shop.example/')['fresh']
+
+
+def test_fresh_hit_skips_the_network(cache):
+    cache.put('http://shop.example/', 200, HEADERS, b'cached')
+    client = FakeClient()
+    page = fetch(client)
+    assert page.from_cache and page.text == 'cached'
+    assert client.requests == []
+
+
+def test_stale_entry_is_revalidated(cache):
+    cache.put('http://shop.example/', 200, HEADERS, b'cached')
+    cache.db.execute('UPDATE pages SET fetched_at = 0')
+    client = FakeClient(HttpResponse(304, [], b''))
+    page = fetch(client)
+    assert client.requests == [{'If-None-Match': '"v1"'}]
+    assert page.status == 200 and page.text == 'cached' and page.from_cache
+    assert cache.get('http://shop.example/')['fresh']
+
+
+@pytest.mark.parametrize('status', [500, 503, 408, 425, 429])
+def test_transient_errors_are_not_cached(cache, status):
+    client = FakeClient(HttpResponse(status, [], b'busy'), HttpResponse(200, HEADERS, b'shop'))
+    assert fetch(client).status == status
+    assert cache.get('http://shop.example/', allow_stale=True) is None
+    assert fetch(client).text == 'shop'
+    assert len(client.requests) == 2
+
+
+@pytest.mark.parametrize('status', [500, 429])
+def test_cached_transient_error_is_fetched_again(cache, status):
+    cache.put('http://shop.example/', status, [], b'error')
+    client = FakeClient(HttpResponse(200, HEADERS, b'shop'))
+    assert fetch(client).text == 'shop'
+    assert cache.get('http://shop.example/')['status'] == 200
+
+
+def test_missing_page_is_cached(cache):
+    client = FakeClient(HttpResponse(404, [], b'not found'))
+    assert fetch(client).status == 404
+    assert fetch(client).from_cache
+    assert len(client.requests) == 1
@@ -0,0 +1,36 @@
+import pytest
+
+from country_profiles import URL_RULES
+from prefilter import decided_non_ecommerce, prefilter
+
+URLS = [
+    'http://www.barbershop-berlin.de/',
+    'https://zahnarzt.example/dentist',
+    'http://shop.example/law-books',
+    'http://lawfirm.example/',
+    'http://orthodontie.example/',
+    'http://notar.example/Notarfachangestellte',
+    'http://www.hotel.example/',
+    'https://regex.example/a.b(c)+',
+]
+
+
+# The URL check of the barber filters, one URL at a time
+def barber_check(url, country):
+    scope, tokens = URL_RULES[country]
+    if scope == 'domain':
+        url = url.split('//')[-1].split('/')[0]
+    return any(token in url for token in tokens)
+
+
+@pytest.mark.parametrize('country', sorted(URL_RULES))
+def test_matches_the_barber_filters(country):
+    assert decided_non_ecommerce(URLS, country).tolist() == [barber_check(url, country) for url in URLS]
+
+
+def test_split_keeps_every_url_once():
+    non_ecommerce, uncertain = prefilter(URLS, 'NL')
+    # NL looks at the domain only, so the dentist path of zahnarzt.example does not count
+    assert non_ecommerce == ['http://www.barbershop-berlin.de/', 'http://lawfirm.example/',
+                             'http://orthodontie.example/']
+    assert sorted(non_ecommerce + uncertain) == sorted(URLS)
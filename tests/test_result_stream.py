@@ -0,0 +1,92 @@
+import csv
+import importlib
+
+import pytest
+
+from result_stream import Checkpoint, CsvStream
+
+
+def read_rows(path):
+    with open(path, newline='') as file:
+        return list(csv.reader(file))
+
+
+def test_resume_skips_only_the_checkpointed_urls(tmp_path):
+    path = str(tmp_path / 'checkpoint.txt')
+    urls = ['http://a.example', 'http://b.example', 'http://c.example', 'http://d.example']
+
+    checkpoint = Checkpoint(path)
+    assert checkpoint.remaining(urls) == urls
+    checkpoint.add(['http://a.example', 'http://c.example'])
+    checkpoint.close()
+
+    resumed = Checkpoint(path, resume=True)
+    assert resumed.remaining(urls) == ['http://b.example', 'http://d.example']
+    resumed.add(['http://b.example'])
+    resumed.close()
+    assert Checkpoint(path, resume=True).remaining(urls) == ['http://d.example']
+
+
+def test_without_resume_the_checkpoint_starts_over(tmp_path):
+    path = str(tmp_path / 'checkpoint.txt')
+    checkpoint = Checkpoint(path)
+    checkpoint.add(['http://a.example'])
+    checkpoint.close()
+    assert Checkpoint(path).remaining(['http://a.example']) == ['http://a.example']
+
+
+def test_a_key_cut_off_by_a_crash_is_not_done(tmp_path):
+    path = tmp_path / 'checkpoint.txt'
+    path.write_text('http://a.example\nhttp://b.exa')
+    checkpoint = Checkpoint(str(path), resume=True)
+    assert checkpoint.remaining(['http://a.example', 'http://b.example']) == ['http://b.example']
+    checkpoint.add(['http://b.example'])
+    checkpoint.close()
+    assert path.read_text() == 'http://a.example\nhttp://b.example\n'
+
+
+def test_checkpoint_key_of_rows(tmp_path):
+    path = str(tmp_path / 'checkpoint.txt')
+    rows = [(0, 'http://a.example'), (1, 'http://b.example')]
+    checkpoint = Checkpoint(path, key=lambda row: row[0])
+    checkpoint.add(rows[:1])
+    checkpoint.close()
+    assert Checkpoint(path, resume=True, key=lambda row: row[0]).remaining(rows) == rows[1:]
+
+
+def test_csv_stream_appends_on_resume(tmp_path):
+    path = str(tmp_path / 'results.csv')
+    stream = CsvStream(path, ['URL', 'E-commerce Indicator'])
+    stream.append([('http://a.example', 1)])
+    stream.close()
+
+    with open(path, 'a') as file:
+        file.write('http://b.example,')  # A row cut off by a crash
+    stream = CsvStream(path, ['URL', 'E-commerce Indicator'], resume=True)
+    stream.append([('http://b.example', 0)])
+    stream.close()
+    assert read_rows(path) == [['URL', 'E-commerce Indicator'], ['http://a.example', '1'], ['http://b.example', '0']]
+
+    CsvStream(path, ['URL', 'E-commerce Indicator']).close()
+    assert read_rows(path) == [['URL', 'E-commerce Indicator']]
+
+
+@pytest.mark.parametrize('country', ['DE', 'AT'])
+def test_prefiltered_urls_are_written_once_over_resumed_runs(tmp_path, monkeypatch, country):
+    # The stage script logs to a file in the working directory
+    monkeypatch.chdir(tmp_path)
+    script = importlib.import_module(f'GETRIDOFBARBERS_{country}DATASET')
+    context = (None, ['http://barbershop.example/'])
+    fetched = [('http://shop.example/', 1), ('http://hotel.example/', 1)]
+
+    # A --resume run with nothing to resume from still writes them
+    for resume, row in zip([True, True], fetched):
+        outputs = script.open_results(context, resume=resume)
+        script.save_batch(outputs, ([row], set(), []))
+        for stream in outputs.values():
+            stream.close()
+
+    results, non_ecommerce = (f'ecommerce_detection_results_{country}.csv', f'non_ecommerce_urls_{country.lower()}.csv')
+    assert read_rows(results) == [['URL', 'E-commerce Indicator'], ['http://barbershop.example/', '0'],
+                                  ['http://shop.example/', '1'], ['http://hotel.example/', '1']]
+    assert read_rows(non_ecommerce) == [['URL'], ['http://barbershop.example/']]
@@ -0,0 +1,43 @@
+import importlib
+from types import SimpleNamespace
+
+import pytest
+
+
+@pytest.fixture
+def run_pipeline(tmp_path, monkeypatch):
+    # The module sets up logging to pipeline.log in the working directory when imported
+    monkeypatch.chdir(tmp_path)
+    return importlib.import_module('run_pipeline')
+
+
+def country_module(country):
+    return SimpleNamespace(make_scanner=lambda url: f"{country} scanner",
+                           process_chunk=lambda urls, pages: (urls, pages))
+
+
+def test_url_of_several_countries_is_fetched_once_in_full(run_pipeline, monkeypatch):
+    fetches = []
+
+    def fetch_features(urls, scanner=None, desc=None):
+        fetches.append({url: scanner(url) for url in urls})
+        return [f"page of {url}" for url in urls]
+
+    monkeypatch.setattr(run_pipeline, 'fetch_features', fetch_features)
+    modules = {'DE': country_module('DE'), 'AT': country_module('AT')}
+    items = [('DE', 'http://shared.example/'), ('DE', 'http://de.example/'),
+             ('AT', 'http://shared.example/'), ('AT', 'http://at.example/')]
+
+    results = run_pipeline.process_batch(modules, items)
+    assert fetches == [{'http://shared.example/': None, 'http://de.example/': 'DE scanner',
+                        'http://at.example/': 'AT scanner'}]
+    assert results['DE'] == (['http://shared.example/', 'http://de.example/'],
+                             ['page of http://shared.example/', 'page of http://de.example/'])
+    assert results['AT'] == (['http://shared.example/', 'http://at.example/'],
+                             ['page of http://shared.example/', 'page of http://at.example/'])
+
+
+def test_stage_without_fetching_gets_no_pages(run_pipeline, monkeypatch):
+    monkeypatch.setattr(run_pipeline, 'fetch_features', lambda urls, scanner=None, desc=None: [])
+    modules = {'DE': SimpleNamespace(make_scanner=None, process_chunk=lambda urls, pages: (urls, pages))}
+    assert run_pipeline.process_batch(modules, [('DE', 'http://de.example/')]) == {'DE': (['http://de.example/'], None)}
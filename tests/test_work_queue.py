@@ -0,0 +1,239 @@
+import logging
+import os
+import queue
+import threading
+import time
+from collections import Counter
+from functools import partial
+
+import pytest
+
+import fetch_engine
+import pipeline_config as config
+import work_queue
+from dns_cache import hostname
+from executor import LocalExecutor
+from work_queue import run_batches, spread_size
+
+
+# In-process stand-in for the few mpi4py calls work_queue makes, one thread per rank
+class FakeStatus:
+    source = None
+
+    def Get_source(self):
+        return self.source
+
+
+class FakeMPI:
+    ANY_SOURCE = -1
+    Status = FakeStatus
+
+
+class FakeWorld:
+    def __init__(self, size):
+        self.size = size
+        self.boxes = {(rank, tag): queue.Queue() for rank in range(size)
+                      for tag in (work_queue.TAG_WORK, work_queue.TAG_RESULT)}
+        self.barrier = threading.Barrier(size)
+        self.values = [None] * size
+        self.aborted = None
+
+
+# What every fake rank raises once one of them called Abort
+class FakeAbort(Exception):
+    pass
+
+
+class FakeComm:
+    def __init__(self, world, rank):
+        self.world = world
+        self.rank = rank
+
+    def Get_rank(self):
+        return self.rank
+
+    def Get_size(self):
+        return self.world.size
+
+    def send(self, value, dest, tag):
+        self.world.boxes[dest, tag].put((self.rank, value))
+
+    def recv(self, source=None, tag=None, status=None):
+        deadline = time.monotonic() + 10
+        while True:
+            if self.world.aborted is not None:
+                raise FakeAbort(self.world.aborted)
+            try:
+                sender, value = self.world.boxes[self.rank, tag].get(timeout=0.01)
+                break
+            except queue.Empty:
+                assert time.monotonic() < deadline, "rank blocked in recv"
+        if status is not None:
+            status.source = sender
+        return value
+
+    def Abort(self, errorcode=0):
+        self.world.aborted = errorcode
+        raise FakeAbort(errorcode)
+
+    def Iprobe(self, source=None, tag=None):
+        return not self.world.boxes[self.rank, tag].empty()
+
+    def _exchange(self, value):
+        self.world.values[self.rank] = value
+        self.world.barrier.wait()
+        values = list(self.world.values)
+        self.world.barrier.wait()
+        return values
+
+    def gather(self, value, root=0):
+        values = self._exchange(value)
+        return values if self.rank == root else None
+
+    def scatter(self, chunks, root=0):
+        return self._exchange(chunks)[root][self.rank]
+
+
+# Run target(comm) on size fake ranks; returns what each rank returned, or
+# FakeAbort on every rank when the run was aborted
+def run_ranks(size, target):
+    world = FakeWorld(size)
+    returned = [None] * size
+
+    def run(rank):
+        try:
+            returned[rank] = target(FakeComm(world, rank))
+        except FakeAbort as e:
+            returned[rank] = e
+
+    threads = [threading.Thread(target=run, args=(rank,)) for rank in range(size)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return returned
+
+
+@pytest.fixture(autouse=True)
+def fake_mpi(monkeypatch):
+    monkeypatch.setattr(work_queue, 'MPI', FakeMPI)
+    monkeypatch.setattr(work_queue, '_log_summary', lambda *args: None)
+    monkeypatch.setattr(config, 'DISPATCH', 'dynamic')
+    monkeypatch.setattr(config, 'DISPATCH_BATCH_SIZE', 5)
+
+
+def urls(count, hosts):
+    return [f"http://shop{index % hosts}.example/page{index}" for index in range(count)]
+
+
+# Run items through the dynamic dispatcher on size fake ranks with process_batch(rank, batch);
+# returns what rank 0 received
+def dispatch(size, items, process_batch, batches_at_once=4):
+    def target(comm):
+        rank = comm.Get_rank()
+        return run_batches(comm, items if rank == 0 else None, partial(process_batch, rank),
+                           batches_at_once=batches_at_once, desc=None)
+    return run_ranks(size, target)[0]
+
+
+def slow_batch(rank, batch):
+    time.sleep(0.02)
+    return rank, batch
+
+
+def test_spread_size_leaves_a_batch_per_worker():
+    assert spread_size(37, 3, 200) == 13
+    assert spread_size(1000, 3, 200) == 200
+    assert spread_size(0, 3, 200) == 1
+
+
+def test_every_batch_reaches_rank_0_and_hosts_stay_on_one_batch():
+    items = urls(200, hosts=8)
+    lock = threading.Lock()
+    active = Counter()
+    overlap = []
+
+    def process_batch(rank, batch):
+        hosts = {hostname(url) for url in batch}
+        with lock:
+            active.update(hosts)
+            overlap.append(max(active[host] for host in hosts))
+        time.sleep(0.01)
+        with lock:
+            active.subtract(hosts)
+        return rank, batch
+
+    results = dispatch(4, items, process_batch)
+    assert sorted(url for _, batch in results for url in batch) == sorted(items)
+    assert max(overlap) == 1
+
+
+@pytest.mark.parametrize('count', [12, 40, 200])
+def test_batches_are_spread_over_all_workers(count):
+    items = urls(count, hosts=count)
+    results = dispatch(4, items, slow_batch)
+    assert sorted(url for _, batch in results for url in batch) == sorted(items)
+    assert {rank for rank, _ in results} == {1, 2, 3}
+
+
+def test_failed_batch_is_handed_out_again():
+    items = urls(40, hosts=40)
+    failed = []
+    lock = threading.Lock()
+
+    def process_batch(rank, batch):
+        with lock:
+            if items[0] in batch and not failed:
+                failed.append(rank)
+                raise RuntimeError("bad page")
+        return slow_batch(rank, batch)
+
+    results = dispatch(4, items, process_batch)
+    assert failed
+    assert sorted(url for _, batch in results for url in batch) == sorted(items)
+
+
+def test_batch_failing_again_aborts_the_run():
+    items = urls(40, hosts=40)
+
+    def process_batch(rank, batch):
+        if items[0] in batch:
+            raise RuntimeError("bad page")
+        return slow_batch(rank, batch)
+
+    returned = run_ranks(4, lambda comm: run_batches(comm, items if comm.Get_rank() == 0 else None,
+                                                      partial(process_batch, comm.Get_rank()), desc=None))
+    assert isinstance(returned[0], FakeAbort) and returned[0].args == (1,)
+
+
+def test_local_executor_uses_every_worker():
+    items = urls(37, hosts=37)
+    done = []
+
+    def process_batch(batch):
+        time.sleep(0.05)
+        return os.getpid(), batch
+
+    results = LocalExecutor(3).run_batches(items, process_batch, on_done=done.extend, desc=None)
+    assert sorted(url for _, batch in results for url in batch) == sorted(items)
+    assert sorted(done) == sorted(items)
+    assert len({pid for pid, _ in results}) == 3
+
+
+def test_fetch_stats_add_up_with_peaks_kept():
+    merged = fetch_engine.merge_stats([{'cache_hits': 2, 'max_wait': 1.5, 'peak_queue_depth': 4},
+                                       {'cache_hits': 3, 'max_wait': 0.5, 'peak_queue_depth': 9}])
+    assert merged == {'cache_hits': 5, 'max_wait': 1.5, 'peak_queue_depth': 9}
+
+
+def test_local_executor_logs_the_fetch_stats_of_all_workers(caplog):
+    def process_batch(batch):
+        fetch_engine.STATS['cache_hits'] += len(batch)
+        fetch_engine.STATS['scheduled'] += len(batch)
+        time.sleep(0.05)
+        return batch
+
+    with caplog.at_level(logging.INFO):
+        LocalExecutor(3).run_batches(urls(30, hosts=30), process_batch, desc=None)
+    assert "Fetch cache: 30 fresh hits" in caplog.text
+    assert "Scheduler: 30 requests" in caplog.text
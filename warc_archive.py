@@ -0,0 +1,167 @@
+import atexit
+import glob
+import io
+import logging
+import os
+import sys
+import threading
+from http import HTTPStatus
+
+import pipeline_config as config
+from page_cache import normalize_url
+
+try:
+    from warcio.archiveiterator import ArchiveIterator
+    from warcio.statusandheaders import StatusAndHeaders
+    from warcio.warcwriter import WARCWriter
+except ImportError:
+    WARCWriter = None
+
+# WARC header naming the rendition stored in a resource record (e.g. crawl4ai markdown)
+KIND_HEADER = 'WebIntel-Kind'
+
+# The fetch layer stores decoded bodies, so the headers describing the wire
+# encoding are dropped and Content-Length is set to the stored length
+ENCODING_HEADERS = {'content-encoding', 'transfer-encoding', 'content-length'}
+
+
+# WARC files holding every page a run used. In record mode each process appends
+# to its own file <script>-<pid>.warc.gz in directory: HTTP pages as response
+# records, other renditions (crawl4ai markdown) as resource records. In replay
+# mode every file of directory is indexed and pages are served from it alone;
+# when a URL was recorded several times the most recent record wins.
+class WarcArchive:
+    def __init__(self, mode=None, directory=None):
+        if WARCWriter is None:
+            raise RuntimeError("WARC recording and replay need the warcio package")
+        self.mode = mode or config.WARC_MODE
+        self.directory = directory or config.WARC_DIR
+        self._lock = threading.Lock()
+        self._file = None
+        self._writer = None
+        self._index = None
+
+    @property
+    def replaying(self):
+        return self.mode == 'replay'
+
+    def _open(self):
+        if self._writer is None:
+            os.makedirs(self.directory, exist_ok=True)
+            script = os.path.splitext(os.path.basename(sys.argv[0] or 'python'))[0] or 'python'
+            path = os.path.join(self.directory, f"{script}-{os.getpid()}.warc.gz")
+            self._file = open(path, 'ab')
+            self._writer = WARCWriter(self._file, gzip=True)
+            atexit.register(self.close)
+            logging.info(f"Recording fetched pages to '{path}'")
+        return self._writer
+
+    # Append the response to one GET of url
+    def record_response(self, url, status, header_pairs, body):
+        headers = [(name, value) for name, value in header_pairs if name.lower() not in ENCODING_HEADERS]
+        headers.append(('Content-Length', str(len(body))))
+        try:
+            reason = HTTPStatus(status).phrase
+        except ValueError:
+            reason = ''
+        http_headers = StatusAndHeaders(f"{status} {reason}".strip(), headers, protocol='HTTP/1.1')
+        with self._lock:
+            writer = self._open()
+            record = writer.create_warc_record(url, 'response', payload=io.BytesIO(body), http_headers=http_headers)
+            writer.write_record(record)
+            self._file.flush()
+
+    # Append a rendition of url that was not produced by a plain GET
+    def record_resource(self, url, kind, data, content_type):
+        with self._lock:
+            writer = self._open()
+            record = writer.create_warc_record(
+                url, 'resource', payload=io.BytesIO(data), warc_content_type=content_type,
+                warc_headers_dict={KIND_HEADER: kind},
+            )
+            writer.write_record(record)
+            self._file.flush()
+
+    # Map (normalized URL, kind) to the file and offset of its latest record
+    def _build_index(self):
+        index = {}
+        paths = sorted(glob.glob(os.path.join(self.directory, '*.warc*')), key=os.path.getmtime)
+        for path in paths:
+            with open(path, 'rb') as file:
+                records = ArchiveIterator(file)
+                for record in records:
+                    if record.rec_type == 'response':
+                        kind = 'raw'
+                    elif record.rec_type == 'resource':
+                        kind = record.rec_headers.get_header(KIND_HEADER) or 'resource'
+                    else:
+                        continue
+                    url = record.rec_headers.get_header('WARC-Target-URI')
+                    index[(normalize_url(url), kind)] = (path, records.get_record_offset())
+        return index
+
+    # URLs recorded with the given kind
+    def urls(self, kind='raw'):
+        return [url for url, url_kind in self._load_index() if url_kind == kind]
+
+    def _load_index(self):
+        with self._lock:
+            if self._index is None:
+                self._index = self._build_index()
+                logging.info(f"Replaying {len(self._index)} recorded pages from '{self.directory}'")
+        return self._index
+
+    # Return the recorded entry for url as a dict like PageCache.get, or None
+    def get(self, url, kind='raw'):
+        location = self._load_index().get((normalize_url(url), kind))
+        if location is None:
+            return None
+        path, offset = location
+        with open(path, 'rb') as file:
+            file.seek(offset)
+            record = next(iter(ArchiveIterator(file)))
+            body = record.content_stream().read()
+            if record.http_headers is None:
+                return {'status': 200, 'headers': [], 'body': body}
+            return {
+                'status': int(record.http_headers.get_statuscode()),
+                'headers': list(record.http_headers.headers),
+                'body': body,
+            }
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = self._writer = None
+
+
+_shared_archive = None
+
+
+# Archive shared by everything running in this process, or None unless
+# WEBINTEL_WARC is set to record or replay
+def shared_archive():
+    global _shared_archive
+    if config.WARC_MODE not in ('record', 'replay'):
+        return None
+    if _shared_archive is None:
+        _shared_archive = WarcArchive()
+    return _shared_archive
+
+
+# Flush and close the WARC file of this process, e.g. when a local worker process exits
+def close_shared_archive():
+    global _shared_archive
+    if _shared_archive is not None:
+        _shared_archive.close()
+        _shared_archive = None
+
+
+# A forked child (a local worker, see executor.py) records into a file of its own pid
+def _forget_after_fork():
+    global _shared_archive
+    _shared_archive = None
+
+
+os.register_at_fork(after_in_child=_forget_after_fork)
@@ -0,0 +1,133 @@
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+import pipeline_config as config
+from country_profiles import KEYWORDS, PAGE_BONUSES, URL_BONUSES
+from hit_matrix import HitMatrix
+
+
+# "name:keyword=weight,url:hotel=weight,form:checkout=weight" -> (name, overrides)
+def parse_variant(text):
+    name, _, assignments = text.partition(':')
+    overrides = {}
+    for assignment in filter(None, assignments.split(',')):
+        key, _, weight = assignment.rpartition('=')
+        if not key:
+            raise argparse.ArgumentTypeError(f"Expected keyword=weight in variant '{text}', got '{assignment}'")
+        overrides[key] = float(weight)
+    return name, overrides
+
+
+# "10,15,20" or an inclusive range "10:40:5"
+def parse_thresholds(text):
+    if ':' in text:
+        start, stop, step = (float(part) for part in text.split(':'))
+        return np.arange(start, stop + step / 2, step)
+    return np.array([float(part) for part in text.split(',')])
+
+
+# Keyword weights, URL bonuses and page bonuses of a country with a variant's overrides applied
+def variant_weights(country, overrides):
+    keywords, url_bonuses, page_bonuses = dict(KEYWORDS[country]), dict(URL_BONUSES[country]), dict(PAGE_BONUSES)
+    for key, weight in overrides.items():
+        if key.startswith('url:'):
+            url_bonuses[key[len('url:'):]] = weight
+        elif key in page_bonuses:
+            page_bonuses[key] = weight
+        else:
+            keywords[key] = weight
+    return keywords, url_bonuses, page_bonuses
+
+
+# 1/0 label of every row of a hit matrix, -1 where the URL is not labeled
+def label_vector(matrix, labels):
+    return np.array([labels.get(url.rstrip('/'), -1) for url in matrix.urls], dtype=np.int8)
+
+
+# Share of e-commerce pages per country, and precision / recall on the
+# labeled pages, for every variant and threshold. Each variant is scored with
+# one matrix-vector product per country and compared against all thresholds at once.
+def sweep(matrices, labels, variants, thresholds):
+    rows = []
+    for name, overrides in variants:
+        for country, matrix in matrices.items():
+            probabilities = matrix.score(*variant_weights(country, overrides))
+            decisions = probabilities[:, None] >= thresholds[None, :]  # pages x thresholds
+
+            truth = label_vector(matrix, labels)
+            labeled = truth >= 0
+            positive = (truth == 1)[labeled, None]
+            predicted = decisions[labeled]
+            true_positives = (predicted & positive).sum(axis=0)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                precision = true_positives / predicted.sum(axis=0)
+                recall = true_positives / positive.sum()
+
+            share = decisions.mean(axis=0) * 100 if len(matrix) else np.full(len(thresholds), np.nan)
+            for i, threshold in enumerate(thresholds):
+                rows.append({
+                    'variant': name,
+                    'threshold': threshold,
+                    'country': country,
+                    'pages': len(matrix),
+                    'e-commerce (%)': share[i],
+                    'labeled': int(labeled.sum()),
+                    'precision': precision[i] if labeled.any() else np.nan,
+                    'recall': recall[i] if labeled.any() else np.nan,
+                })
+    return pd.DataFrame(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Sweep decision thresholds and keyword weight variants over the stored keyword hits, offline.")
+    parser.add_argument('--matrix', action='append', default=[], metavar='COUNTRY=NPZ',
+                        help="Hit matrix of a country (default: every keyword_hits_<country>DATASET.npz present)")
+    parser.add_argument('--labels', default='classified_urls_DE_corrected.csv',
+                        help="CSV with url and ecommerce (1/0) columns to compute precision and recall against")
+    parser.add_argument('--thresholds', type=parse_thresholds, default=parse_thresholds('5:40:5'),
+                        help="Comma separated thresholds or an inclusive start:stop:step range (default 5:40:5)")
+    parser.add_argument('--variant', type=parse_variant, action='append', default=[], metavar='NAME:KEY=WEIGHT,...',
+                        help="Weight variant, e.g. 'morecart:cart=20,url:hotel=0,form:checkout=10'; "
+                             "the current weights of country_profiles.py are always included as 'current'")
+    parser.add_argument('--output', help="CSV to write the full table to")
+    args = parser.parse_args()
+
+    if args.matrix:
+        paths = dict(entry.split('=', 1) for entry in args.matrix)
+    else:
+        paths = {country: f'keyword_hits_{country}DATASET.npz' for country in KEYWORDS}
+        paths = {country: path for country, path in paths.items() if os.path.exists(path)}
+    unknown = set(paths) - set(KEYWORDS)
+    if unknown:
+        parser.error(f"Unknown countries: {sorted(unknown)}")
+    if not paths:
+        parser.error("No hit matrices found; run ParallelProbability<country>.py first or pass --matrix")
+    matrices = {country: HitMatrix.load(path) for country, path in paths.items()}
+
+    labels = {}
+    if os.path.exists(args.labels):
+        df_labels = pd.read_csv(args.labels)
+        labels = {url.rstrip('/'): int(label) for url, label in zip(df_labels['url'], df_labels['ecommerce'])}
+    else:
+        print(f"No labels at {args.labels}; precision and recall are not computed")
+
+    variants = [('current', {})] + args.variant
+    try:
+        table = sweep(matrices, labels, variants, args.thresholds)
+    except ValueError as error:
+        parser.error(str(error))
+
+    print(f"Pages per country: {', '.join(f'{country} {len(matrix)}' for country, matrix in matrices.items())}; "
+          f"current decision threshold {config.DECISION_THRESHOLD:g}")
+    print(table.to_string(index=False, float_format=lambda value: f'{value:.3f}'))
+    if args.output:
+        table.to_csv(args.output, index=False)
+        print(f"Results have been saved to '{args.output}'.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,303 @@
+import logging
+import time
+import traceback
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from itertools import islice
+
+from tqdm import tqdm
+
+import pipeline_config as config
+from dns_cache import hostname
+from fetch_engine import STATS, log_stats, merge_stats, reset_stats
+from page_features import fetch_features
+from politeness import split_by_host
+
+try:
+    from mpi4py import MPI
+except ImportError:
+    MPI = None
+
+# Message tags of the dispatcher: work sent to a worker, results (or a first "ready") sent back
+TAG_WORK = 1
+TAG_RESULT = 2
+
+# Seconds a worker with batches running waits for one to finish before it looks for new work
+POLL_INTERVAL = 0.05
+
+# Times a batch whose processing raised is handed out again before the coordinator aborts the run
+BATCH_RETRIES = 1
+
+
+# The communicator of the ranks that do the work: the first WEBINTEL_RANKS_PER_NODE
+# ranks of every node (all ranks when it is 0). The others get None and should
+# leave; world rank 0 always works and stays rank 0.
+def working_comm(comm):
+    if not config.RANKS_PER_NODE:
+        return comm
+    node = comm.Split_type(MPI.COMM_TYPE_SHARED, key=comm.Get_rank())
+    works = node.Get_rank() < config.RANKS_PER_NODE
+    node.Free()
+    working = comm.Split(0 if works else MPI.UNDEFINED, key=comm.Get_rank())
+    if not works:
+        logging.info(f"Rank {comm.Get_rank()} leaves: WEBINTEL_RANKS_PER_NODE={config.RANKS_PER_NODE} ranks per node do the work")
+        return None
+    return working
+
+
+# Consecutive lists of at most size items
+def batches(items, size):
+    items = iter(items)
+    while batch := list(islice(items, size)):
+        yield batch
+
+
+# Function fetching the pages of a batch of URLs (with make_scanner, unless it is
+# None for stages that never fetch) and handing them to process_chunk(urls, pages)
+def fetch_and_process(process_chunk, make_scanner):
+    def process_batch(urls):
+        pages = fetch_features(urls, scanner=make_scanner, desc=None) if make_scanner is not None else None
+        return process_chunk(urls, pages)
+    return process_batch
+
+
+# Batches of at most size items in which all items of a host stay together
+# (a host with more items than size gets batches of its own), so the
+# dispatcher can keep every host on one rank at a time
+def host_batches(items, size, url_of=None):
+    by_host = {}
+    for item in items:
+        by_host.setdefault(hostname(url_of(item) if url_of else item), []).append(item)
+
+    packed = []  # (hosts, items)
+    hosts, batch = set(), []
+    for host, host_items in by_host.items():
+        if len(host_items) > size:
+            packed += [({host}, chunk) for chunk in batches(host_items, size)]
+            continue
+        if len(batch) + len(host_items) > size:
+            packed.append((hosts, batch))
+            hosts, batch = set(), []
+        hosts.add(host)
+        batch += host_items
+    if batch:
+        packed.append((hosts, batch))
+    return packed
+
+
+# Largest batch size up to size that still leaves a batch for each of workers
+# when count items are split, so a small input is spread over every worker
+def spread_size(count, workers, size):
+    return max(1, min(size, -(-count // max(workers, 1))))
+
+
+# Process items (given on rank 0, None elsewhere) with process_batch(batch) on
+# all ranks. Every batch result is sent to rank 0 as soon as its batch is done
+# and handed to on_result(result) there, so rank 0 can write it out right away,
+# and then the batch itself to on_done(batch), e.g. a Checkpoint's add (see
+# result_stream.py); without on_result run_batches returns the list of batch
+# results on rank 0 (None on the other ranks). WEBINTEL_DISPATCH=dynamic (the default, with 3 or
+# more ranks) makes rank 0 a coordinator handing out small batches on demand;
+# static splits the items by host once, as the scripts used to. Either way a
+# summary of every rank's busy and idle time is logged, with the fetch counters
+# of the run added up over the ranks. A dynamic worker works
+# on batches_at_once batches together, in threads, by default enough to keep
+# WEBINTEL_MAX_IN_FLIGHT fetches going; 1 suits work that is not network-bound.
+def run_batches(comm, items, process_batch, url_of=None, on_result=None, on_done=None, batches_at_once=None,
+                desc="Processing URLs"):
+    start_time = time.monotonic()
+    reset_stats()
+    size = comm.Get_size()
+    results = None
+    if on_result is None:
+        results = []
+        on_result = results.append
+
+    # Rank 0: a batch is done once its result is handed on
+    def deliver(batch, result):
+        on_result(result)
+        if on_done is not None:
+            on_done(batch)
+
+    dynamic = config.DISPATCH == 'dynamic' and size > 2
+    if dynamic:
+        batches_at_once = batches_at_once or -(-config.MAX_IN_FLIGHT // config.DISPATCH_BATCH_SIZE)
+        busy = _dispatch(comm, items, process_batch, url_of, deliver, batches_at_once, desc)
+    else:
+        busy = _static(comm, items, process_batch, url_of, deliver, desc)
+    _log_summary(comm, 'dynamic' if dynamic else 'static', start_time, busy)
+    return results if comm.Get_rank() == 0 else None
+
+
+# Static split: all items of a host on the same rank, each rank working through
+# its share in batches. The other ranks send each batch with its result to
+# rank 0 when it is done (and None when they are finished); rank 0 takes in what
+# has arrived between its own batches and the rest once its share is done.
+def _static(comm, items, process_batch, url_of, deliver, desc):
+    rank = comm.Get_rank()
+    chunks = split_by_host(items, comm.Get_size(), url_of=url_of) if rank == 0 else None
+    chunk = comm.scatter(chunks, root=0)
+    running = comm.Get_size() - 1  # Ranks rank 0 still receives results from
+
+    def receive():
+        nonlocal running
+        message = comm.recv(source=MPI.ANY_SOURCE, tag=TAG_RESULT)
+        if message is None:
+            running -= 1
+        else:
+            deliver(*message)
+
+    busy = 0.0
+    with tqdm(total=len(chunk), desc=f"{desc} on rank {rank}", disable=desc is None) as progress:
+        for batch in batches(chunk, config.BATCH_SIZE):
+            batch_start = time.monotonic()
+            result = process_batch(batch)
+            busy += time.monotonic() - batch_start
+            if rank == 0:
+                deliver(batch, result)
+                while running and comm.Iprobe(source=MPI.ANY_SOURCE, tag=TAG_RESULT):
+                    receive()
+            else:
+                comm.send((batch, result), dest=0, tag=TAG_RESULT)
+            progress.update(len(batch))
+
+    if rank != 0:
+        comm.send(None, dest=0, tag=TAG_RESULT)
+        return busy
+    while running:
+        receive()
+    return busy
+
+
+def _dispatch(comm, items, process_batch, url_of, deliver, batches_at_once, desc):
+    if comm.Get_rank() == 0:
+        _coordinate(comm, items, url_of, deliver, desc)
+        return 0.0
+    return _work(comm, process_batch, batches_at_once)
+
+
+# Rank 0: hand the next batch to whichever worker asks. A worker first says how
+# many batches it works on at once and asks again with every result. A batch
+# whose hosts are being fetched by another worker (or another batch of the same
+# worker) waits, so each host is still fetched by one batch at a time and its
+# token bucket covers all requests made to it. No worker holds more than its
+# share of the batches left, so the first workers to ask do not take them all.
+# A batch that raised on a worker is handed out again BATCH_RETRIES times; when
+# it fails after that the whole job is aborted, since it could not finish.
+def _coordinate(comm, items, url_of, deliver, desc):
+    workers = comm.Get_size() - 1
+    packed = host_batches(items, spread_size(len(items), workers, config.DISPATCH_BATCH_SIZE), url_of=url_of)
+    pending = list(range(len(packed)))
+    busy_hosts = set()
+    waiting = []  # requests of workers waiting for a batch whose hosts are free, or for their share to grow
+    held = Counter()  # worker -> batches it is working on
+    failures = Counter()  # batch index -> times it raised
+    joined = 0
+    slots = 0  # batches the workers can still take: a slot ends when it is answered with None
+
+    def serve(worker):
+        nonlocal slots
+        share = -(-(len(pending) + sum(held.values())) // workers)
+        index = next((index for index in pending if not packed[index][0] & busy_hosts), None)
+        if index is not None and held[worker] < share:
+            pending.remove(index)
+            busy_hosts.update(packed[index][0])
+            held[worker] += 1
+            comm.send((index, packed[index][1]), dest=worker, tag=TAG_WORK)
+        elif pending:
+            waiting.append(worker)
+        else:
+            comm.send(None, dest=worker, tag=TAG_WORK)
+            slots -= 1
+
+    with tqdm(total=len(items), desc=desc, disable=desc is None) as progress:
+        while joined < workers or slots:
+            status = MPI.Status()
+            message = comm.recv(source=MPI.ANY_SOURCE, tag=TAG_RESULT, status=status)
+            if isinstance(message, int):
+                joined += 1
+                slots += message
+                for _ in range(message):
+                    serve(status.Get_source())
+            else:
+                index, result, error = message
+                busy_hosts.difference_update(packed[index][0])
+                held[status.Get_source()] -= 1
+                if error is None:
+                    deliver(packed[index][1], result)
+                    progress.update(len(packed[index][1]))
+                elif failures[index] < BATCH_RETRIES:
+                    failures[index] += 1
+                    logging.warning(f"Batch {index} failed on rank {status.Get_source()}, handing it out again:\n{error}")
+                    pending.append(index)
+                else:
+                    logging.error(f"Batch {index} failed on rank {status.Get_source()} again, aborting the run:\n{error}")
+                    comm.Abort(1)
+                # The hosts just released may be what parked workers wait for
+                parked = waiting[:]
+                waiting.clear()
+                for worker in parked:
+                    serve(worker)
+                serve(status.Get_source())
+
+
+# Worker ranks: ask for batches_at_once batches and work on the ones received
+# together in threads (their fetches share the rank's event loop, see
+# fetch_engine.py); every result goes back with a request for the next batch,
+# as (index, result, None), or (index, None, traceback) when the batch raised.
+# MPI is only called from this thread. Returns the time any batch was running.
+def _work(comm, process_batch, batches_at_once):
+    busy = 0.0
+    comm.send(batches_at_once, dest=0, tag=TAG_RESULT)
+    open_requests = batches_at_once
+    running = {}  # future -> batch index
+    with ThreadPoolExecutor(batches_at_once, thread_name_prefix='batch') as pool:
+        while open_requests or running:
+            # Take in the batches (or stops) that have arrived; block for one when nothing is running
+            while open_requests and (not running or comm.Iprobe(source=0, tag=TAG_WORK)):
+                work = comm.recv(source=0, tag=TAG_WORK)
+                open_requests -= 1
+                if work is not None:
+                    index, batch = work
+                    running[pool.submit(process_batch, batch)] = index
+            if not running:
+                continue
+
+            wait_start = time.monotonic()
+            done, _ = wait(running, timeout=POLL_INTERVAL, return_when=FIRST_COMPLETED)
+            busy += time.monotonic() - wait_start
+            for future in done:
+                index = running.pop(future)
+                try:
+                    message = (index, future.result(), None)
+                except Exception:
+                    message = (index, None, traceback.format_exc())
+                comm.send(message, dest=0, tag=TAG_RESULT)
+                open_requests += 1
+    return busy
+
+
+# Busy and idle time of every rank: idle is the time from the start until the
+# last rank finished that a rank was not processing a batch, so a long tail
+# shows up as idle time on all the other ranks. The fetch counters of all
+# ranks (see fetch_engine.log_stats) are added up and logged once, on rank 0.
+def _log_summary(comm, mode, start_time, busy):
+    finished = time.monotonic() - start_time
+    stats = comm.gather((busy, finished, dict(STATS)), root=0)
+    if comm.Get_rank() == 0:
+        log_summary(mode, [(busy, finished) for busy, finished, _ in stats], coordinator=mode == 'dynamic')
+        log_stats(merge_stats(fetch_stats for _, _, fetch_stats in stats))
+
+
+# Log and print the (busy, done after) seconds of every rank, or of every local
+# worker process with unit='worker' (see executor.py); with coordinator the
+# first rank hands out work
+def log_summary(mode, stats, coordinator=False, unit='rank'):
+    makespan = max(done for _, done in stats)
+    lines = [f"Dispatch ({mode}): {len(stats)} {unit}s, makespan {makespan:.1f}s, "
+             f"first {unit} done after {min(done for _, done in stats):.1f}s"]
+    for number, (busy, done) in enumerate(stats):
+        role = (" (coordinator)" if coordinator and number == 0 else " (worker)") if unit == 'rank' else ""
+        lines.append(f"  {unit} {number}{role}: busy {busy:.1f}s, idle {makespan - busy:.1f}s, done after {done:.1f}s")
+    logging.info('\n'.join(lines))
+    print('\n'.join(lines))